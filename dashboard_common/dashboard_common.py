@@ -0,0 +1,1273 @@
+# =========================================
+# Socle commun des tableaux de bord
+# =========================================
+
+# Instrumentation, démarrage, chargement des partitions, moteur DuckDB,
+# sous-échantillonnage des courbes, cache des figures et panneaux précalculés,
+# partagés par supermarket_sales_dashboard et retail_insight_dashboard, qui
+# importent ces fonctions. Un processus ne sert qu'une application (un worker
+# gunicorn, un script de performance) : l'état de ce module (mesures,
+# démarrage, connexion DuckDB, cache) est celui de l'application installée
+# par installer(app).
+
+import atexit
+import cProfile
+import collections
+import gzip
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+from dash import Patch
+from flask import Response, request
+import plotly.io as pio
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:  # sans pyarrow, les données sont lues depuis le CSV
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+journal = logging.getLogger(__name__)
+
+# Application servie par le processus, fixée par installer ; sa mise en page
+# complète ("interface") est construite par charger_application
+application = {
+    "app": None,
+    "chemin_callbacks": None,
+    "chemin_interface": None,
+    "instant_debut": None,
+    "interface": None,
+}
+
+
+# =========================================
+# Instrumentation
+# =========================================
+
+# Durées des requêtes de callback et de leurs étapes, tailles des réponses et
+# lectures du cache, exposées au format texte de Prometheus sur /metrics. Les
+# mesures sont propres à chaque processus : chaque worker gunicorn publie les
+# siennes.
+#
+# Avec PROFILAGE_DOSSIER, une requête de callback qui le demande (en-tête
+# X-Profilage: 1, ou paramètre ?profilage=1) est profilée par cProfile et le
+# profil écrit dans ce dossier, à lire avec pstats ou snakeviz. Une seule
+# requête est profilée à la fois dans le processus (depuis Python 3.12, un
+# seul profileur peut être actif) : une autre demande reçue entre-temps est
+# servie sans profil.
+
+dossier_profilage = os.environ.get("PROFILAGE_DOSSIER")
+verrou_profilage = threading.Lock()
+
+bornes_durees = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+bornes_tailles = [100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+# nom : (type, description, bornes des histogrammes)
+definitions_metriques = {
+    "dashboard_callback_duration_seconds": (
+        "histogram",
+        "Durée des requêtes de callback, sérialisation de la réponse comprise",
+        bornes_durees,
+    ),
+    "dashboard_stage_duration_seconds": (
+        "histogram",
+        "Durée des étapes des callbacks (filtre, agregation, figure...)",
+        bornes_durees,
+    ),
+    "dashboard_response_size_bytes": (
+        "histogram",
+        "Taille des réponses des callbacks",
+        bornes_tailles,
+    ),
+    "dashboard_cache_requests_total": (
+        "counter",
+        "Lectures du cache des panneaux par résultat (precalcul, hit, miss, disabled)",
+        None,
+    ),
+    "dashboard_panel_unchanged_total": (
+        "counter",
+        "Panneaux non renvoyés car leur contenu n'a pas changé",
+        None,
+    ),
+    "dashboard_startup_seconds": (
+        "gauge",
+        "Durée des étapes du démarrage (imports, donnees, agregats...)",
+        None,
+    ),
+}
+
+# nom -> {étiquettes: valeur (compteur, jauge) ou [comptes par borne, somme, nombre]}
+mesures = {nom: {} for nom in definitions_metriques}
+verrou_mesures = threading.Lock()
+
+# Callback en cours dans le thread, pour étiqueter les étapes et la réponse
+contexte_mesure = threading.local()
+
+
+def observer(nom, valeur, **etiquettes):
+    bornes = definitions_metriques[nom][2]
+    cle = tuple(sorted(etiquettes.items()))
+    with verrou_mesures:
+        serie = mesures[nom].setdefault(cle, [[0] * len(bornes), 0.0, 0])
+        for i, borne in enumerate(bornes):
+            if valeur <= borne:
+                serie[0][i] += 1
+        serie[1] += valeur
+        serie[2] += 1
+
+
+def incrementer(nom, **etiquettes):
+    cle = tuple(sorted(etiquettes.items()))
+    with verrou_mesures:
+        mesures[nom][cle] = mesures[nom].get(cle, 0) + 1
+
+
+def fixer(nom, valeur, **etiquettes):
+    cle = tuple(sorted(etiquettes.items()))
+    with verrou_mesures:
+        mesures[nom][cle] = valeur
+
+
+def callback_courant():
+    return getattr(contexte_mesure, "callback", None) or "hors_requete"
+
+
+@contextmanager
+def etape(nom):
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        observer(
+            "dashboard_stage_duration_seconds",
+            time.perf_counter() - debut,
+            callback=callback_courant(),
+            stage=nom,
+        )
+
+
+def format_etiquettes(etiquettes):
+    return "{" + ",".join(f'{cle}="{valeur}"' for cle, valeur in etiquettes) + "}"
+
+
+def texte_metriques():
+    lignes = []
+    with verrou_mesures:
+        for nom, (type_metrique, description, bornes) in definitions_metriques.items():
+            lignes.append(f"# HELP {nom} {description}")
+            lignes.append(f"# TYPE {nom} {type_metrique}")
+            for etiquettes, valeur in sorted(mesures[nom].items()):
+                if type_metrique in ("counter", "gauge"):
+                    lignes.append(f"{nom}{format_etiquettes(etiquettes)} {valeur}")
+                    continue
+                comptes, somme, nombre = valeur
+                for borne, compte in zip(bornes, comptes):
+                    le = format_etiquettes(etiquettes + (("le", borne),))
+                    lignes.append(f"{nom}_bucket{le} {compte}")
+                le = format_etiquettes(etiquettes + (("le", "+Inf"),))
+                lignes.append(f"{nom}_bucket{le} {nombre}")
+                lignes.append(f"{nom}_sum{format_etiquettes(etiquettes)} {somme}")
+                lignes.append(f"{nom}_count{format_etiquettes(etiquettes)} {nombre}")
+    return "\n".join(lignes) + "\n"
+
+
+def profilage_demande():
+    return bool(dossier_profilage) and (
+        request.headers.get("X-Profilage") == "1"
+        or request.args.get("profilage") == "1"
+    )
+
+
+def arreter_profil():
+    # Profil de la requête du thread, arrêté, et verrou libéré ; None sans profil
+    profil = getattr(contexte_mesure, "profil", None)
+    if profil is None:
+        return None
+    profil.disable()
+    contexte_mesure.profil = None
+    verrou_profilage.release()
+    return profil
+
+
+def debuter_mesure():
+    if request.path != application["chemin_callbacks"]:
+        return
+    contexte_mesure.callback = None
+    contexte_mesure.debut = time.perf_counter()
+    contexte_mesure.profil = None
+    if profilage_demande():
+        if verrou_profilage.acquire(blocking=False):
+            contexte_mesure.profil = cProfile.Profile()
+            contexte_mesure.profil.enable()
+        else:
+            journal.warning("Requête non profilée : un profil est déjà en cours")
+
+
+def terminer_mesure(reponse):
+    if (
+        request.path != application["chemin_callbacks"]
+        or getattr(contexte_mesure, "debut", None) is None
+    ):
+        return reponse
+    duree = time.perf_counter() - contexte_mesure.debut
+    callback = callback_courant()
+    contexte_mesure.debut = None
+
+    observer("dashboard_callback_duration_seconds", duree, callback=callback)
+    observer(
+        "dashboard_response_size_bytes",
+        reponse.calculate_content_length() or 0,
+        callback=callback,
+    )
+
+    profil = arreter_profil()
+    if profil is not None:
+        nom = f"{callback}-{time.time_ns()}-{threading.get_ident()}.prof"
+        try:
+            os.makedirs(dossier_profilage, exist_ok=True)
+            profil.dump_stats(os.path.join(dossier_profilage, nom))
+        except OSError:
+            journal.exception("Impossible d'écrire le profil %s", nom)
+    return reponse
+
+
+def abandonner_profil(erreur):
+    # Requête interrompue par une exception, sans passer par terminer_mesure
+    arreter_profil()
+
+
+def metrics():
+    return Response(texte_metriques(), mimetype="text/plain; version=0.0.4")
+
+
+# =========================================
+# Démarrage
+# =========================================
+
+# Les données, les agrégats et les gabarits des figures sont préparés par
+# le charger_application de chaque application, à la fin de l'import de son
+# module (lancer_demarrage). Avec DEMARRAGE_DIFFERE=1, ce chargement est fait
+# dans un thread de préchauffage : le serveur répond dès la fin des imports,
+# /health renvoie 503 tant que les données ne sont pas prêtes, et les
+# requêtes qui en ont besoin attendent la fin du chargement. La durée de
+# chaque étape est journalisée et publiée sur /health et /metrics.
+
+demarrage_differe = os.environ.get("DEMARRAGE_DIFFERE") == "1"
+
+donnees_pretes = threading.Event()
+erreur_demarrage = None
+
+# étape -> durée (secondes)
+durees_demarrage = {}
+
+
+def noter_duree(nom, duree):
+    durees_demarrage[nom] = duree
+    fixer("dashboard_startup_seconds", duree, stage=nom)
+
+
+@contextmanager
+def etape_demarrage(nom):
+    debut = time.perf_counter()
+    yield
+    noter_duree(nom, time.perf_counter() - debut)
+
+
+def attendre_donnees():
+    donnees_pretes.wait()
+    if erreur_demarrage is not None:
+        raise RuntimeError("Échec du chargement des données") from erreur_demarrage
+
+
+def health():
+    if erreur_demarrage is not None:
+        statut, code = "error", 500
+    elif donnees_pretes.is_set():
+        statut, code = "ready", 200
+    else:
+        statut, code = "loading", 503
+    corps = {"status": statut, "startup_seconds": dict(durees_demarrage)}
+    return Response(json.dumps(corps), status=code, mimetype="application/json")
+
+
+def afficher_interface():
+    # Dash évalue aussi la mise en page pour la valider, à la première requête
+    # reçue (/health par exemple) : seule la requête de la page attend les
+    # données
+    if request.path != application["chemin_interface"]:
+        return application["app"].validation_layout
+    attendre_donnees()
+    return application["interface"]
+
+
+def installer(app, instant_debut):
+    # Mesure des callbacks et routes /metrics et /health de l'application ;
+    # instant_debut marque le début de l'import de son module
+    prefixe = app.config.routes_pathname_prefix
+    application.update(
+        app=app,
+        chemin_callbacks=prefixe + "_dash-update-component",
+        chemin_interface=prefixe + "_dash-layout",
+        instant_debut=instant_debut,
+    )
+    app.server.before_request(debuter_mesure)
+    app.server.after_request(terminer_mesure)
+    app.server.teardown_request(abandonner_profil)
+    app.server.route("/metrics")(metrics)
+    app.server.route("/health")(health)
+
+    # Imports et création de l'application
+    noter_duree("imports", time.perf_counter() - instant_debut)
+
+
+def demarrer(charger_application):
+    global erreur_demarrage
+    try:
+        charger_application()
+    except Exception as erreur:
+        erreur_demarrage = erreur
+        raise
+    finally:
+        noter_duree("total", time.perf_counter() - application["instant_debut"])
+        journal.info("Durées du démarrage (s) : %s", durees_demarrage)
+        donnees_pretes.set()
+
+
+def lancer_demarrage(charger_application):
+    noter_duree(
+        "module",
+        time.perf_counter()
+        - application["instant_debut"]
+        - durees_demarrage["imports"],
+    )
+    if demarrage_differe:
+        threading.Thread(
+            target=demarrer,
+            args=(charger_application,),
+            name="prechauffage",
+            daemon=True,
+        ).start()
+    else:
+        demarrer(charger_application)
+
+
+# =========================================
+# Schéma compact
+# =========================================
+
+# Variables qualitatives désignées par l'application en catégories, entiers
+# réduits au plus petit type suffisant, prix en float32 seulement si
+# l'arrondi au centime est conservé. Les montants agrégés restent en float64
+# pour que les sommes affichées ne changent pas. Les colonnes en catégories
+# sont fixées d'avance, pas déduites des valeurs : tout le CSV, chacun de ses
+# blocs ou un lot de ventes intégré reçoivent le même schéma.
+
+
+def float32_sans_perte(serie, decimales=2):
+    valeurs = serie.to_numpy(dtype=np.float64)
+    arrondies = np.round(valeurs, decimales)
+    reconverties = np.round(valeurs.astype(np.float32).astype(np.float64), decimales)
+    return np.array_equal(valeurs, arrondies, equal_nan=True) and np.array_equal(
+        arrondies, reconverties, equal_nan=True
+    )
+
+
+def compacter_donnees(data, colonnes_categorielles=(), colonnes_float32=()):
+    rapport = {}
+    for colonne in data.columns:
+        serie = data[colonne]
+        avant = serie.memory_usage(deep=True, index=False)
+
+        if colonne in colonnes_categorielles:
+            data[colonne] = serie.astype("category")
+        elif pd.api.types.is_integer_dtype(serie):
+            data[colonne] = pd.to_numeric(serie, downcast="integer")
+        elif colonne in colonnes_float32 and float32_sans_perte(serie):
+            data[colonne] = serie.astype(np.float32)
+
+        rapport[colonne] = (avant, data[colonne].memory_usage(deep=True, index=False))
+
+    rapport = pd.DataFrame.from_dict(
+        rapport, orient="index", columns=["Avant (octets)", "Après (octets)"]
+    )
+    rapport.loc["Total"] = rapport.sum()
+    return data, rapport
+
+
+# =========================================
+# Chargement des données
+# =========================================
+
+# Le CSV nettoyé est converti une fois pour toutes en fichiers Arrow/Feather,
+# un par mois de données (catégories et datetime64 déjà en place), relus
+# ensuite par projection mémoire. Un manifeste décrit les partitions et
+# enregistre la date de modification et l'empreinte SHA-256 du CSV, ainsi que
+# les modalités proposées par les filtres : le CSV n'est relu que si elles ne
+# correspondent plus. Un verrou garantit qu'un seul processus prépare les
+# partitions quand plusieurs workers démarrent ensemble. Les lignes sans date
+# forment la partition "NaT", rangée après les mois.
+#
+# Avec DONNEES_PARTAGEES (un dossier en mémoire, /dev/shm par exemple), les
+# partitions sont écrites dans ce dossier et lues directement sur les
+# tampons Arrow projetés en mémoire, sans copie : tous les workers lisent les
+# mêmes pages et la mémoire n'augmente plus d'une copie des données par
+# worker. Les colonnes sont alors en lecture seule.
+#
+# Avec CSV_LIGNES_PAR_BLOC, le CSV est lu et nettoyé par blocs de ce nombre
+# de lignes, découpés par mois au fur et à mesure : le fichier entier n'est
+# jamais en mémoire, seulement un bloc, puis un mois à la fois pour réunir
+# (et retrier, si l'application le demande) les mois répartis sur plusieurs
+# blocs.
+#
+# Avec PROCESSUS_CHARGEMENT, les blocs puis les mois à réunir sont répartis
+# entre autant de processus fils (executer_en_parallele), comme les agrégats
+# de chaque partition construits par les applications : chaque processus
+# renvoie un résultat partiel, fusionné dans l'ordre des blocs ou des
+# partitions, donc identique à un seul processus. La mémoire est alors bornée
+# par un bloc ou un mois par processus.
+#
+# Chaque application décrit son CSV par un dictionnaire :
+# - "nettoyer" : fonction appliquée aux lignes lues (un bloc ou tout le CSV) ;
+# - "index_col" : colonne d'index du CSV, None pour numéroter les lignes ;
+# - "colonne_date" : colonne des dates, qui répartit les lignes par mois ;
+# - "colonnes_filtres" : colonnes dont les modalités alimentent les filtres ;
+# - "trier" : fonction appliquée aux lignes d'un mois réunies de plusieurs
+#   blocs, ou None.
+
+lignes_par_bloc = int(os.environ.get("CSV_LIGNES_PAR_BLOC") or 0) or None
+processus_chargement = int(os.environ.get("PROCESSUS_CHARGEMENT") or 1)
+dossier_partage = os.environ.get("DONNEES_PARTAGEES")
+
+
+def dossier_des_partitions(chemin_csv, prefixe):
+    # À côté du CSV, ou dans DONNEES_PARTAGEES sous un nom propre au CSV
+    if not dossier_partage:
+        return os.path.splitext(chemin_csv)[0] + ".partitions"
+    return os.path.join(
+        dossier_partage,
+        prefixe
+        + hashlib.sha1(os.path.abspath(chemin_csv).encode()).hexdigest()[:12]
+        + ".partitions",
+    )
+
+
+def valeurs_filtres(data, colonnes_filtres):
+    return {
+        colonne: sorted(data[colonne].dropna().unique()) for colonne in colonnes_filtres
+    }
+
+
+def signature_fichier(chemin):
+    statistiques = os.stat(chemin)
+    return {"mtime": statistiques.st_mtime_ns, "taille": statistiques.st_size}
+
+
+def empreinte_fichier(chemin):
+    empreinte = hashlib.sha256()
+    with open(chemin, "rb") as fichier:
+        for bloc in iter(lambda: fichier.read(1 << 20), b""):
+            empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+
+def ecrire_atomique(chemin, ecrire):
+    # Les autres workers ne lisent jamais un fichier partiel
+    chemin_temporaire = f"{chemin}.{os.getpid()}.tmp"
+    ecrire(chemin_temporaire)
+    os.replace(chemin_temporaire, chemin)
+
+
+def ecrire_json(chemin, valeur):
+    with open(chemin, "w") as fichier:
+        json.dump(valeur, fichier)
+
+
+def lire_manifeste(dossier):
+    try:
+        with open(os.path.join(dossier, "manifeste.json")) as fichier:
+            return json.load(fichier)
+    except (OSError, ValueError):
+        return None
+
+
+def partitions_a_jour(chemin_csv, dossier):
+    # Manifeste des partitions si elles correspondent au CSV, None sinon
+    manifeste = lire_manifeste(dossier)
+    if manifeste is None:
+        return None
+    source = manifeste["source"]
+    signature = signature_fichier(chemin_csv)
+    if all(source.get(cle) == valeur for cle, valeur in signature.items()):
+        return manifeste
+    if source.get("sha256") == empreinte_fichier(chemin_csv):
+        return manifeste
+    return None
+
+
+def decouper_par_mois(data, colonne_date):
+    # (mois "AAAA-MM", lignes du mois) dans l'ordre des mois, l'ordre des
+    # lignes étant conservé dans chaque mois
+    mois = data[colonne_date].dt.to_period("M")
+    for periode, lignes in data.groupby(mois, sort=True, dropna=False):
+        yield str(periode), lignes
+
+
+def ordonner_partitions(partitions):
+    # Mois dans l'ordre chronologique, la partition "NaT" en dernier
+    return dict(sorted(partitions.items(), key=lambda p: (p[0] == "NaT", p[0])))
+
+
+def concatener_lignes(morceaux):
+    # Catégories communes à tous les blocs, le premier gardant ses codes ; les
+    # blocs vides ne sont là que pour le schéma
+    premier, *suivants = morceaux
+    types = {}
+    for colonne in premier.select_dtypes("category").columns:
+        type_commun = premier[colonne].dtype
+        categories = type_commun.categories
+        for morceau in suivants:
+            serie = morceau[colonne]
+            if serie.dtype == type_commun:
+                continue
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                valeurs = serie.cat.categories
+            else:
+                valeurs = pd.Index(serie.dropna().unique())
+            categories = categories.append(valeurs.difference(categories))
+        types[colonne] = pd.CategoricalDtype(categories)
+
+    morceaux = [morceau for morceau in morceaux if len(morceau)] or [premier]
+    for i, morceau in enumerate(morceaux):
+        conversions = {c: t for c, t in types.items() if morceau[c].dtype != t}
+        if conversions:
+            morceaux[i] = morceau.astype(conversions)
+    return morceaux[0] if len(morceaux) == 1 else pd.concat(morceaux)
+
+
+def trier_categories(modele):
+    # Catégories communes rangées comme par une lecture du CSV en une seule
+    # passe (astype("category") : triées quand les valeurs le permettent),
+    # pour que les partitions ne dépendent pas du découpage en blocs
+    return modele.assign(
+        **{
+            colonne: modele[colonne].cat.reorder_categories(
+                pd.Categorical(modele[colonne].cat.categories).categories
+            )
+            for colonne in modele.select_dtypes("category").columns
+        }
+    )
+
+
+def reunir_mois(source, morceaux):
+    # Lignes d'un mois venues de plusieurs blocs, dans l'ordre des blocs
+    lignes = concatener_lignes(morceaux)
+    return lignes if source["trier"] is None else source["trier"](lignes)
+
+
+def executer_taches(fonction, taches, connexion):
+    # Processus fils : renvoie les résultats de ses tâches, ou l'exception levée
+    try:
+        connexion.send([fonction(*tache) for tache in taches])
+    except BaseException as erreur:
+        connexion.send(erreur)
+    finally:
+        connexion.close()
+
+
+def executer_en_parallele(fonction, taches):
+    # fonction(*tache) pour chaque tâche, résultats dans l'ordre des tâches.
+    # Les tâches sont réparties à tour de rôle entre PROCESSUS_CHARGEMENT
+    # processus fils créés par fork, qui héritent de la fonction et des
+    # tâches : seuls les résultats sont sérialisés. Un pool qui sérialise la
+    # fonction bloquerait, car le chargement a lieu pendant l'import du module
+    # de l'application. Un seul processus demandé, ou pas de fork (Windows) :
+    # tout s'exécute dans le processus lui-même
+    taches = list(taches)
+    nombre = min(processus_chargement, len(taches))
+    if nombre <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return [fonction(*tache) for tache in taches]
+    contexte = multiprocessing.get_context("fork")
+    processus, connexions = [], []
+    for rang in range(nombre):
+        lecture, ecriture = contexte.Pipe(duplex=False)
+        fils = contexte.Process(
+            target=executer_taches, args=(fonction, taches[rang::nombre], ecriture)
+        )
+        fils.start()
+        ecriture.close()
+        processus.append(fils)
+        connexions.append(lecture)
+
+    resultats = [None] * len(taches)
+    try:
+        for rang, lecture in enumerate(connexions):
+            recus = lecture.recv()
+            if isinstance(recus, BaseException):
+                raise recus
+            resultats[rang::nombre] = recus
+    finally:
+        for fils in processus:
+            if fils.is_alive():
+                fils.terminate()
+            fils.join()
+    return resultats
+
+
+def blocs_csv(chemin_csv):
+    # Blocs de CSV_LIGNES_PAR_BLOC lignes : (début, fin) en octets et numéro
+    # de leur première ligne, trouvés en comptant les fins de ligne (aucun
+    # champ du CSV ne contient de retour à la ligne). Sans
+    # CSV_LIGNES_PAR_BLOC, un seul bloc (None) : tout le fichier
+    if lignes_par_bloc is None:
+        return [None]
+    with open(chemin_csv, "rb") as fichier:
+        fichier.readline()
+        debuts, lues = [fichier.tell()], 0
+        while contenu := fichier.read(1 << 24):
+            fins = np.flatnonzero(np.frombuffer(contenu, dtype=np.uint8) == 10)
+            # Fins de ligne qui terminent un bloc
+            premiere = lignes_par_bloc - lues % lignes_par_bloc - 1
+            position = fichier.tell() - len(contenu) + 1
+            debuts.extend((position + fins[premiere::lignes_par_bloc]).tolist())
+            lues += len(fins)
+        fin = fichier.tell()
+    debuts = [debut for debut in debuts if debut < fin] or debuts[:1]
+    return [
+        (debut, suivant, numero * lignes_par_bloc)
+        for numero, (debut, suivant) in enumerate(zip(debuts, debuts[1:] + [fin]))
+    ]
+
+
+def lire_bloc_csv(source, chemin_csv, bloc):
+    # Lignes nettoyées d'un bloc, l'en-tête du CSV étant relu devant elles
+    if bloc is None:
+        return source["nettoyer"](
+            pd.read_csv(chemin_csv, index_col=source["index_col"])
+        )
+    debut, fin, premiere_ligne = bloc
+    with open(chemin_csv, "rb") as fichier:
+        entete = fichier.readline()
+        fichier.seek(debut)
+        contenu = entete + fichier.read(fin - debut)
+    data = pd.read_csv(io.BytesIO(contenu), index_col=source["index_col"])
+    if source["index_col"] is None:
+        # Lignes numérotées dans tout le fichier, comme avec pd.read_csv
+        data.index = data.index + premiere_ligne
+    return source["nettoyer"](data)
+
+
+def regrouper_par_mois(source, blocs):
+    # Lignes de chaque mois, tous blocs réunis, en mémoire (sans pyarrow)
+    morceaux, modeles = collections.defaultdict(list), []
+    for data in blocs:
+        modeles.append(data.iloc[:0])
+        for mois, lignes in decouper_par_mois(data, source["colonne_date"]):
+            morceaux[mois].append(lignes)
+    modele = trier_categories(concatener_lignes(modeles))
+    return {
+        mois: reunir_mois(source, [modele, *lignes])
+        for mois, lignes in ordonner_partitions(morceaux).items()
+    }
+
+
+def ecrire_feather(chemin, lignes):
+    table = pa.Table.from_pandas(lignes)
+    # Un seul bloc par colonne, pour que chaque colonne se lise sans copie
+    feather.write_feather(
+        table, chemin, compression="uncompressed", chunksize=max(len(table), 1)
+    )
+
+
+def fragmenter_bloc(source, chemin_csv, bloc, numero, dossier_blocs):
+    # Écrit les lignes d'un bloc par mois ; renvoie son schéma (frame vide),
+    # ses modalités et ses fragments (mois, fichier, nombre de lignes)
+    data = lire_bloc_csv(source, chemin_csv, bloc)
+    fragments = []
+    for mois, lignes in decouper_par_mois(data, source["colonne_date"]):
+        chemin = os.path.join(dossier_blocs, f"{mois}-{numero}.feather")
+        ecrire_feather(chemin, lignes)
+        fragments.append((mois, chemin, len(lignes)))
+    return data.iloc[:0], valeurs_filtres(data, source["colonnes_filtres"]), fragments
+
+
+def reunir_fragments(source, chemins, modele, chemin_partition):
+    lignes = reunir_mois(source, [modele, *(feather.read_feather(c) for c in chemins)])
+    ecrire_atomique(chemin_partition, lambda chemin: ecrire_feather(chemin, lignes))
+
+
+def ecrire_partitions(source, chemin_csv, dossier):
+    # Chaque bloc est découpé par mois dans un dossier temporaire. Le fragment
+    # d'un mois présent dans un seul bloc devient directement sa partition ;
+    # les fragments d'un mois réparti sur plusieurs blocs sont relus et réunis
+    # (reunir_mois), un mois à la fois, avec les catégories communes à tous
+    # les blocs
+    with tempfile.TemporaryDirectory(dir=dossier) as dossier_blocs:
+        resultats = executer_en_parallele(
+            fragmenter_bloc,
+            [
+                (source, chemin_csv, bloc, numero, dossier_blocs)
+                for numero, bloc in enumerate(blocs_csv(chemin_csv))
+            ],
+        )
+
+        fragments = collections.defaultdict(list)
+        lignes_par_mois = collections.Counter()
+        options = {colonne: set() for colonne in source["colonnes_filtres"]}
+        for numero, (_, valeurs, morceaux) in enumerate(resultats):
+            for colonne, modalites in valeurs.items():
+                options[colonne].update(modalites)
+            for mois, chemin, nombre in morceaux:
+                fragments[mois].append((chemin, numero))
+                lignes_par_mois[mois] += nombre
+
+        modeles = [modele for modele, _, _ in resultats]
+        modele = trier_categories(concatener_lignes(modeles))
+        categorielles = modele.select_dtypes("category").columns
+        a_reunir = []
+        for mois, morceaux in ordonner_partitions(fragments).items():
+            chemin_partition = os.path.join(dossier, f"{mois}.feather")
+            (chemin, numero), *suivants = morceaux
+            if not suivants and all(
+                modeles[numero][c].dtype == modele[c].dtype for c in categorielles
+            ):
+                os.replace(chemin, chemin_partition)
+            else:
+                a_reunir.append(
+                    (source, [c for c, _ in morceaux], modele, chemin_partition)
+                )
+        executer_en_parallele(reunir_fragments, a_reunir)
+    partitions = {
+        mois: lignes_par_mois[mois] for mois in ordonner_partitions(fragments)
+    }
+
+    # Partitions d'une version précédente du CSV
+    for nom in os.listdir(dossier):
+        if nom.endswith(".feather") and nom[: -len(".feather")] not in partitions:
+            os.remove(os.path.join(dossier, nom))
+
+    manifeste = {
+        "source": {
+            **signature_fichier(chemin_csv),
+            "sha256": empreinte_fichier(chemin_csv),
+        },
+        "options": {colonne: sorted(options[colonne]) for colonne in options},
+        "partitions": partitions,
+    }
+    ecrire_atomique(
+        os.path.join(dossier, "manifeste.json"),
+        lambda chemin: ecrire_json(chemin, manifeste),
+    )
+    return manifeste
+
+
+def lire_options(dossier):
+    # Modalités des filtres enregistrées avec les données, sans lire les colonnes
+    manifeste = None if pa is None else lire_manifeste(dossier)
+    return None if manifeste is None else manifeste["options"]
+
+
+def colonne_sans_copie(colonne):
+    # Vue sur le tampon Arrow quand la conversion le permet ; sinon (valeurs
+    # manquantes, plusieurs blocs...) copie privée, comme to_pandas
+    if colonne.num_chunks == 1:
+        morceau = colonne.chunk(0)
+        try:
+            if pa.types.is_dictionary(morceau.type):
+                return (
+                    pd.Categorical.from_codes(
+                        morceau.indices.to_numpy(zero_copy_only=True),
+                        categories=morceau.dictionary.to_pandas(),
+                        ordered=morceau.type.ordered,
+                    ),
+                    True,
+                )
+            if pa.types.is_string(morceau.type):
+                return pd.arrays.ArrowStringArray(colonne), True
+            return morceau.to_numpy(zero_copy_only=True), True
+        except pa.ArrowInvalid:
+            pass
+    return colonne.to_pandas(), False
+
+
+def eviter_regroupement(data):
+    # pandas regroupe à la première occasion (take, filtre...) les colonnes de
+    # même type en un seul bloc, ce qui les copierait hors de la mémoire
+    # partagée. Aucune API publique ne l'empêche : les blocs sont déclarés déjà
+    # regroupés seulement si le gestionnaire de blocs de cette version de
+    # pandas a bien ces attributs, sinon les colonnes restent telles quelles
+    # et pourront être copiées
+    gestionnaire = getattr(data, "_mgr", None)
+    attributs = ("_is_consolidated", "_known_consolidated")
+    if not all(hasattr(gestionnaire, attribut) for attribut in attributs):
+        journal.warning(
+            "pandas %s : colonnes de même type regroupées (copiées) à l'usage",
+            pd.__version__,
+        )
+        return
+    for attribut in attributs:
+        setattr(gestionnaire, attribut, True)
+
+
+def lire_colonnaire(chemin_feather):
+    table = feather.read_table(chemin_feather, memory_map=True)
+    if not dossier_partage:
+        return table.to_pandas()
+
+    metadonnees = table.schema.pandas_metadata or {}
+    index = (metadonnees.get("index_columns") or [None])[0]
+
+    colonnes_lues, copiees = {}, []
+    for nom, colonne in zip(table.column_names, table.columns):
+        valeurs, partagee = colonne_sans_copie(colonne)
+        colonnes_lues[nom] = pd.Series(valeurs, name=nom, copy=False)
+        if not partagee:
+            copiees.append(nom)
+    journal.info("Colonnes copiées hors de la mémoire partagée : %s", copiees)
+
+    data = pd.concat(
+        [colonnes_lues[nom] for nom in table.column_names if nom != index],
+        axis=1,
+        copy=False,
+    )
+    eviter_regroupement(data)
+    if isinstance(index, str):
+        nom = None if index.startswith("__index_level_") else index
+        data.index = pd.Index(colonnes_lues[index], name=nom, copy=False)
+    elif isinstance(index, dict):
+        data.index = pd.RangeIndex(
+            index["start"], index["stop"], index["step"], name=index["name"]
+        )
+    return data
+
+
+@contextmanager
+def verrou_fichier(chemin):
+    if fcntl is None:
+        yield
+        return
+    with open(chemin, "a") as fichier:
+        fcntl.flock(fichier, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fichier, fcntl.LOCK_UN)
+
+
+def charger_donnees(source, chemin_csv, dossier):
+    # Partitions par mois : {"AAAA-MM": fichier Feather}, ou directement les
+    # lignes de chaque mois sans pyarrow
+    if pa is None:
+        return regrouper_par_mois(
+            source,
+            (lire_bloc_csv(source, chemin_csv, bloc) for bloc in blocs_csv(chemin_csv)),
+        )
+
+    manifeste = partitions_a_jour(chemin_csv, dossier)
+    if manifeste is None:
+        os.makedirs(dossier, exist_ok=True)
+        with verrou_fichier(os.path.join(dossier, ".verrou")):
+            # Les partitions ont pu être préparées par un autre processus
+            # entre-temps
+            manifeste = partitions_a_jour(chemin_csv, dossier)
+            if manifeste is None:
+                manifeste = ecrire_partitions(source, chemin_csv, dossier)
+    return {
+        mois: os.path.join(dossier, f"{mois}.feather")
+        for mois in manifeste["partitions"]
+    }
+
+
+def empreinte_donnees(chemin_csv, dossier):
+    # Version des données d'après le contenu du CSV, pas sa date : elle ne
+    # change pas quand le même fichier est redéployé. Lue dans le manifeste
+    # des partitions quand il correspond au CSV, calculée sinon
+    manifeste = None if pa is None else partitions_a_jour(chemin_csv, dossier)
+    if manifeste is not None:
+        return manifeste["source"]["sha256"][:16]
+    return empreinte_fichier(chemin_csv)[:16]
+
+
+# =========================================
+# Sélections
+# =========================================
+
+
+def normaliser_periode(debut, fin):
+    # Dates ISO du sélecteur (AAAA-MM-JJ, parfois suivies d'une heure) ;
+    # None pour une borne non renseignée
+    return (debut[:10] if debut else None, fin[:10] if fin else None)
+
+
+def normaliser_selection(valeurs):
+    # None, [] et ["all"] désignent tous la sélection complète
+    return tuple(sorted(set(valeurs or []) - {"all"}))
+
+
+# =========================================
+# Moteur DuckDB
+# =========================================
+
+# Avec MOTEUR_REQUETES=duckdb, les applications agrègent les partitions par
+# des requêtes SQL exécutées par DuckDB dans le processus, en parallèle sur
+# MOTEUR_THREADS threads (tous les cœurs par défaut).
+
+moteur_requetes = os.environ.get("MOTEUR_REQUETES", "pandas")
+threads_moteur = os.environ.get("MOTEUR_THREADS")
+
+# duckdb n'est importé que s'il est choisi
+if moteur_requetes == "duckdb":
+    try:
+        import duckdb
+    except ImportError:
+        journal.warning(
+            "duckdb n'est pas installé : les requêtes sont faites avec pandas"
+        )
+        moteur_requetes = "pandas"
+
+# Une connexion par processus, ouverte à la première requête ; chaque requête
+# a son propre curseur. Elle est fermée avant un fork (gunicorn --preload) :
+# les threads de DuckDB n'existeraient pas dans le processus fils
+connexion_duckdb = {"connexion": None}
+verrou_duckdb = threading.Lock()
+
+
+def curseur_duckdb():
+    with verrou_duckdb:
+        if connexion_duckdb["connexion"] is None:
+            configuration = (
+                {} if threads_moteur is None else {"threads": int(threads_moteur)}
+            )
+            connexion_duckdb["connexion"] = duckdb.connect(config=configuration)
+        return connexion_duckdb["connexion"].cursor()
+
+
+def fermer_connexion_duckdb():
+    with verrou_duckdb:
+        if connexion_duckdb["connexion"] is not None:
+            connexion_duckdb["connexion"].close()
+            connexion_duckdb["connexion"] = None
+
+
+os.register_at_fork(before=fermer_connexion_duckdb)
+
+
+# =========================================
+# Granularité et sous-échantillonnage des courbes
+# =========================================
+
+# La granularité des courbes d'évolution (jour, semaine ou mois) dépend de
+# la période visible : toute la période au chargement, la zone zoomée
+# ensuite (relayoutData). Au-delà de EVOLUTION_POINTS_MAX points par courbe,
+# les points sont réduits par l'algorithme Largest-Triangle-Three-Buckets,
+# qui conserve la forme de la courbe : la figure reste de taille bornée
+# quelle que soit la profondeur de l'historique.
+
+points_max_courbe = int(os.environ.get("EVOLUTION_POINTS_MAX", 500))
+
+# Durée visible maximale (en jours) pour chaque granularité
+granularites = [("jour", 62), ("semaine", 730), ("mois", None)]
+
+libelles_granularite = {"jour": "Jour", "semaine": "Semaine", "mois": "Mois"}
+
+
+def plage_visible(relayout):
+    # Bornes de l'axe des x après un zoom, None pour toute la période
+    relayout = relayout or {}
+    if "xaxis.range[0]" in relayout and "xaxis.range[1]" in relayout:
+        bornes = [relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]]
+    elif "xaxis.range" in relayout:
+        bornes = relayout["xaxis.range"]
+    else:
+        return None
+    return tuple(pd.Timestamp(borne) for borne in bornes)
+
+
+def choisir_granularite(debut, fin):
+    jours = (fin - debut) / pd.Timedelta(days=1)
+    for granularite, duree_max in granularites:
+        if duree_max is None or jours <= duree_max:
+            return granularite
+
+
+def lttb(x, y, nombre):
+    # Positions des `nombre` points retenus parmi ceux de (x, y), x croissant
+    n = len(x)
+    if nombre >= n or nombre < 3:
+        return np.arange(n)
+
+    x = np.asarray(x).astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Premier et dernier points gardés, les autres répartis en nombre - 2 seaux
+    bornes = np.linspace(1, n - 1, nombre - 1).astype(np.intp)
+    retenus = np.empty(nombre, dtype=np.intp)
+    retenus[0], retenus[-1] = 0, n - 1
+
+    for i in range(nombre - 2):
+        debut, fin = bornes[i], bornes[i + 1]
+        # Sommet C : moyenne du seau suivant (le dernier point pour le dernier seau)
+        if i + 2 < len(bornes):
+            cx = x[fin : bornes[i + 2]].mean()
+            cy = y[fin : bornes[i + 2]].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        # Sommet A : le point retenu dans le seau précédent
+        a = retenus[i]
+        aires = np.abs(
+            (x[a] - cx) * (y[debut:fin] - y[a]) - (x[a] - x[debut:fin]) * (cy - y[a])
+        )
+        retenus[i + 1] = debut + np.argmax(aires)
+
+    return retenus
+
+
+# =========================================
+# Figures
+# =========================================
+
+# La mise en page de chaque figure (titres, polices, légendes, marges, thème)
+# est construite une seule fois au démarrage, avec plotly express ; par
+# requête, seules les traces sont recalculées, en simples dictionnaires, et
+# envoyées comme mise à jour partielle de la figure affichée.
+
+# Palette du thème par défaut, celle qu'utilise plotly express
+couleurs_defaut = list(pio.templates[pio.templates.default].layout.colorway)
+
+
+def mise_en_page(fig):
+    return fig.to_plotly_json()["layout"]
+
+
+def figure_partielle(traces):
+    # Seules les traces sont remplacées : la mise en page reste celle du gabarit
+    patch = Patch()
+    patch["data"] = traces
+    return patch
+
+
+def empreinte_contenu(texte):
+    return hashlib.sha1(texte.encode()).hexdigest()
+
+
+# =========================================
+# Cache des figures
+# =========================================
+
+# Les sorties de chaque panneau sont mémorisées en JSON dans une base SQLite
+# locale (chemin choisi par l'application), partagée par tous les workers
+# gunicorn, avec éviction LRU au-delà de CACHE_FIGURES_TAILLE entrées (0
+# désactive le cache). La base compte aussi les sélections demandées, pour
+# choisir celles à précalculer. Les clés des applications contiennent la
+# version de leur code (version_code) : après une mise à jour, les figures
+# calculées par l'ancien code ne sont plus servies et sortent par l'éviction.
+#
+# Une lecture ne fait que lire : l'heure d'accès des entrées servies (pour
+# l'éviction LRU) et les sélections demandées sont notées en mémoire puis
+# écrites en une transaction au plus toutes les CACHE_FIGURES_ECRITURE_S
+# secondes, à l'écriture suivante d'une figure ou à la sortie du processus.
+
+taille_cache = int(os.environ.get("CACHE_FIGURES_TAILLE", 128))
+intervalle_ecritures = float(os.environ.get("CACHE_FIGURES_ECRITURE_S", 5))
+
+# À incrémenter quand la forme des valeurs en cache change sans que le code
+# des applications ne change
+format_cache = 1
+
+# Fixé par initialiser_cache
+base_cache = {"chemin": None}
+
+
+def version_code(chemin_module):
+    # Empreinte du format du cache, du code de l'application et de ce module
+    empreinte = hashlib.sha1(str(format_cache).encode())
+    for chemin in (chemin_module, __file__):
+        with open(chemin, "rb") as fichier:
+            empreinte.update(fichier.read())
+    return empreinte.hexdigest()[:16]
+
+
+def ouvrir_cache():
+    return closing(sqlite3.connect(base_cache["chemin"], timeout=5))
+
+
+def initialiser_cache(chemin):
+    base_cache["chemin"] = chemin
+    if taille_cache <= 0:
+        return
+    with ouvrir_cache() as connexion, connexion:
+        connexion.execute("PRAGMA journal_mode=WAL")
+        connexion.execute(
+            "CREATE TABLE IF NOT EXISTS figures "
+            "(cle TEXT PRIMARY KEY, valeur TEXT, acces REAL)"
+        )
+        connexion.execute(
+            "CREATE TABLE IF NOT EXISTS selections "
+            "(selection TEXT PRIMARY KEY, nombre INTEGER)"
+        )
+
+
+# Écritures en attente : {clé: heure d'accès} et {sélection: nombre}
+acces_en_attente = {}
+selections_en_attente = collections.Counter()
+verrou_attente = threading.Lock()
+derniere_ecriture = [time.monotonic()]
+
+
+def noter_en_attente(acces=None, selection=None):
+    with verrou_attente:
+        if acces is not None:
+            acces_en_attente[acces] = time.time()
+        if selection is not None:
+            selections_en_attente[selection] += 1
+        if time.monotonic() - derniere_ecriture[0] < intervalle_ecritures:
+            return
+        # Une seule requête écrit, les suivantes continuent de noter
+        derniere_ecriture[0] = time.monotonic()
+    vider_attente()
+
+
+def ecrire_attente(connexion):
+    # Écrit dans la transaction de connexion les accès et sélections notés
+    with verrou_attente:
+        acces = list(acces_en_attente.items())
+        selections = list(selections_en_attente.items())
+        acces_en_attente.clear()
+        selections_en_attente.clear()
+        derniere_ecriture[0] = time.monotonic()
+    connexion.executemany(
+        "UPDATE figures SET acces = max(acces, ?) WHERE cle = ?",
+        [(instant, cle) for cle, instant in acces],
+    )
+    connexion.executemany(
+        "INSERT INTO selections VALUES (?, ?) "
+        "ON CONFLICT (selection) DO UPDATE SET nombre = nombre + excluded.nombre",
+        selections,
+    )
+
+
+def vider_attente():
+    if taille_cache <= 0 or base_cache["chemin"] is None:
+        return
+    try:
+        with ouvrir_cache() as connexion, connexion:
+            ecrire_attente(connexion)
+    except sqlite3.Error:
+        pass
+
+
+atexit.register(vider_attente)
+
+
+def lire_cache(cle):
+    if taille_cache <= 0:
+        return None
+    try:
+        with ouvrir_cache() as connexion:
+            ligne = connexion.execute(
+                "SELECT valeur FROM figures WHERE cle = ?", (cle,)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    if ligne is None:
+        return None
+    noter_en_attente(acces=cle)
+    return ligne[0]
+
+
+def ecrire_cache(cle, texte):
+    if taille_cache <= 0:
+        return
+    try:
+        with ouvrir_cache() as connexion, connexion:
+            connexion.execute(
+                "INSERT OR REPLACE INTO figures VALUES (?, ?, ?)",
+                (cle, texte, time.time()),
+            )
+            # Les accès en attente d'abord, pour évincer d'après les plus récents
+            ecrire_attente(connexion)
+            # Éviction des entrées les moins récemment utilisées
+            connexion.execute(
+                "DELETE FROM figures WHERE cle NOT IN "
+                "(SELECT cle FROM figures ORDER BY acces DESC LIMIT ?)",
+                (taille_cache,),
+            )
+    except sqlite3.Error:
+        pass
+
+
+def compter_selection(*selection):
+    # Popularité des combinaisons de filtres, pour choisir celles à précalculer
+    if taille_cache <= 0:
+        return
+    noter_en_attente(selection=json.dumps(selection))
+
+
+def selections_populaires():
+    # Combinaisons de filtres enregistrées, des plus demandées aux moins
+    # demandées
+    if taille_cache <= 0:
+        return []
+    vider_attente()
+    try:
+        with ouvrir_cache() as connexion:
+            lignes = connexion.execute(
+                "SELECT selection FROM selections ORDER BY nombre DESC, selection"
+            ).fetchall()
+    except sqlite3.Error:
+        return []
+    return [
+        tuple(tuple(valeurs) for valeurs in json.loads(selection))
+        for (selection,) in lignes
+    ]
+
+
+# =========================================
+# Panneaux précalculés
+# =========================================
+
+# Les sorties des panneaux pour des combinaisons de filtres, sur toute la
+# période et sans zoom, peuvent être calculées hors ligne (python -m
+# performance.precompute), une par fichier JSON compressé nommé d'après
+# l'empreinte de sa clé de cache. Avec PRECALCUL_DOSSIER, les callbacks
+# lisent ces fichiers avant le cache. Sans --maximum, au plus
+# maximum_precalcul combinaisons de filtres sont précalculées par application.
+
+dossier_precalcul = os.environ.get("PRECALCUL_DOSSIER")
+maximum_precalcul = 256
+
+
+def chemin_precalcul(dossier, cle):
+    return os.path.join(dossier, hashlib.sha1(cle.encode()).hexdigest() + ".json.gz")
+
+
+def lire_precalcul(cle):
+    if not dossier_precalcul:
+        return None
+    try:
+        with gzip.open(
+            chemin_precalcul(dossier_precalcul, cle), "rt", encoding="utf-8"
+        ) as fichier:
+            return fichier.read()
+    except OSError:
+        return None
+
+
+def ecrire_gzip(chemin, texte):
+    with gzip.open(chemin, "wt", encoding="utf-8") as fichier:
+        fichier.write(texte)
@@ -0,0 +1,62 @@
+# =========================================
+# Configuration gunicorn commune aux deux tableaux de bord
+# =========================================
+
+# Lancée depuis la racine du dépôt :
+#
+#   gunicorn -c gunicorn.conf.py supermarket_sales_dashboard.supermarket_sales_dashboard:server
+#   gunicorn -c gunicorn.conf.py retail_insight_dashboard.retail_insight_dashboard:server
+#
+# Deux façons d'éviter une copie des données par worker :
+#
+# - DONNEES_PARTAGEES=/dev/shm : avant le démarrage des workers, un processus
+#   de chargement écrit une fois les données nettoyées dans ce dossier, en
+#   partitions Arrow mensuelles décrites par un manifeste ; chaque worker
+#   construit ensuite ses tables sur ces fichiers projetés, sans copie ;
+# - GUNICORN_PRELOAD=1 (ou --preload) : l'application est importée une seule
+#   fois dans le processus maître, et les workers, créés par fork, partagent
+#   ses pages mémoire tant qu'ils ne les modifient pas.
+#
+# Avec DEMARRAGE_DIFFERE=1, chaque worker répond dès ses imports terminés et
+# charge les données dans un thread de préchauffage (/health renvoie 503
+# jusque-là). GUNICORN_PRELOAD=1 le désactive : le processus maître charge
+# alors tout avant de créer les workers, un thread ne survivant pas au fork
+# (ne pas combiner DEMARRAGE_DIFFERE=1 avec l'option --preload).
+
+import ctypes
+import os
+import subprocess
+import sys
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = os.environ.get("GUNICORN_PRELOAD") == "1"
+
+if preload_app:
+    os.environ["DEMARRAGE_DIFFERE"] = "0"
+
+
+def on_starting(server):
+    if server.cfg.preload_app or not os.environ.get("DONNEES_PARTAGEES"):
+        return
+    # Processus de chargement : importer le module prépare les partitions
+    # partagées, sans préchauffage en arrière-plan pour qu'elles soient prêtes
+    # à la sortie
+    module = server.app.app_uri.split(":")[0]
+    server.log.info("Préparation des données partagées par %s", module)
+    subprocess.run(
+        [sys.executable, "-c", f"import {module}"],
+        check=True,
+        cwd=server.cfg.chdir,
+        env={**os.environ, "DEMARRAGE_DIFFERE": "0"},
+    )
+
+
+def post_worker_init(worker):
+    # La mémoire libérée après la construction des agrégats au démarrage est
+    # rendue au système : glibc la garderait sinon dans chaque worker
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
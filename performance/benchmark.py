@@ -0,0 +1,442 @@
+# =========================================
+# Mesures de performance des deux tableaux de bord
+# =========================================
+
+# Pour chaque application et chaque taille de données, un CSV synthétique est
+# généré (une fois, puis réutilisé), puis mesuré dans un processus séparé :
+# démarrage sur le CSV, démarrage sur les partitions Feather, puis chaque
+# fonction de calcul et chaque callback pour des sélections de filtres
+# représentatives.
+# Le temps (médiane et minimum sur plusieurs répétitions) et le pic mémoire
+# (tracemalloc) de chaque mesure sont écrits en JSON, comparables entre deux
+# commits.
+#
+#   python -m performance.benchmark --sortie avant.json
+#   python -m performance.benchmark --tailles 1000 100000 --sortie apres.json
+#   python -m performance.benchmark --comparer avant.json apres.json
+#
+# Les applications utilisent le moteur de requêtes de MOTEUR_REQUETES, et
+# lisent le CSV par blocs de CSV_LIGNES_PAR_BLOC lignes s'il est défini,
+# dans PROCESSUS_CHARGEMENT processus (le pic mémoire ne compte alors que le
+# processus principal) :
+#
+#   MOTEUR_REQUETES=duckdb python -m performance.benchmark --sortie duckdb.json
+#   CSV_LIGNES_PAR_BLOC=100000 python -m performance.benchmark --sortie blocs.json
+#   PROCESSUS_CHARGEMENT=4 python -m performance.benchmark --sortie processus.json
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from performance.synthetic_data import ecrire_csv
+
+racine = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+modules = {
+    "supermarche": "supermarket_sales_dashboard.supermarket_sales_dashboard",
+    "retail": "retail_insight_dashboard.retail_insight_dashboard",
+}
+
+tailles_defaut = [1_000, 100_000, 1_000_000, 10_000_000]
+
+# Sélections de filtres représentatives : tout, une modalité, plusieurs, et
+# les trois derniers mois des données ; la période (début, fin) suit les
+# autres filtres
+dernier_trimestre = "dernier trimestre"
+
+selections = {
+    "supermarche": {
+        "tout": (None, None, (None, None)),
+        "un genre": (["Femme"], None, (None, None)),
+        "une ville": (None, ["Yangon"], (None, None)),
+        "genre et deux villes": (["Homme"], ["Naypyitaw", "Mandalay"], (None, None)),
+        "dernier trimestre": (None, None, dernier_trimestre),
+    },
+    "retail": {
+        "tout": (None, (None, None)),
+        "une zone": (["Chicago"], (None, None)),
+        "deux zones": (["New York", "California"], (None, None)),
+        "dernier trimestre": (None, dernier_trimestre),
+        "une zone, dernier trimestre": (["Chicago"], dernier_trimestre),
+    },
+}
+
+
+# Mesures, dans le processus de l'application
+
+
+def chronometrer(fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+
+def memoire_residente_max():
+    # VmHWM : pic de mémoire résidente depuis le lancement du processus. Sous
+    # Linux, ru_maxrss conserverait celui du processus parent.
+    try:
+        with open("/proc/self/status") as statut:
+            for ligne in statut:
+                if ligne.startswith("VmHWM:"):
+                    return int(ligne.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def pic_memoire(fonction):
+    tracemalloc.start()
+    try:
+        fonction()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def resoudre_filtres(m, filtres):
+    # Période en dates ISO, comme envoyées par le sélecteur de dates
+    *selection, periode = filtres
+    if periode == dernier_trimestre:
+        fin = m.dates[1]
+        debut = pd.Timestamp(fin) - pd.DateOffset(months=3) + pd.Timedelta(days=1)
+        periode = (debut.date().isoformat(), fin.isoformat())
+    return (*selection, *periode)
+
+
+def appels_callbacks(m, filtres):
+    # Un appel par panneau, comme le navigateur au changement de filtre, sans
+    # cache ni contenu déjà affiché
+    appels = {}
+    for identifiant, *_, entrees in m.panneaux:
+        callback = m.update_panneaux[identifiant]
+        appels[f"callback {identifiant}"] = (
+            lambda callback=callback, entrees=entrees: callback(
+                *filtres, *[None] * len(entrees), None
+            )
+        )
+    panneaux = list(appels.values())
+    appels["callbacks (tous les panneaux)"] = lambda: [appel() for appel in panneaux]
+    return appels
+
+
+def appels_supermarche(m, genres, villes, debut, fin):
+    genres = m.normaliser_selection(genres)
+    villes = m.normaliser_selection(villes)
+    periode = m.normaliser_periode(debut, fin)
+    cellules = m.selectionner_cellules(m.cube, genres, villes, periode)
+    return {
+        "selectionner_cellules": lambda: m.selectionner_cellules(
+            m.cube, genres, villes, periode
+        ),
+        "histogramme_montants_totaux_achats": lambda: (
+            m.histogramme_montants_totaux_achats(cellules)
+        ),
+        "diagramme_categorie_produit": lambda: m.diagramme_categorie_produit(cellules),
+        "evolution_montant_total_achats": lambda: (
+            m.evolution_montant_total_achats(cellules)
+        ),
+    }
+
+
+def appels_retail(m, locations, debut, fin):
+    locations = m.normaliser_selection(locations)
+    periode = m.normaliser_periode(debut, fin)
+    etat = m.etat
+    df_filtre = m.ventes_de_la_selection(etat, locations, periode)
+    couples = m.couples_de_la_selection(
+        etat, "Gender", "Product_Category", locations, periode
+    )
+    mensuel = m.series_de_la_selection(etat, "mois", locations)
+    mois = m.mois_de_reference(etat, periode)
+    chiffre, _ = m.serie_evolution(etat, locations, None, periode)
+    return {
+        "ventes_de_la_selection": lambda: m.ventes_de_la_selection(
+            etat, locations, periode
+        ),
+        "calculer_chiffre_affaire": lambda: m.calculer_chiffre_affaire(df_filtre),
+        "couples_de_la_selection": lambda: m.couples_de_la_selection(
+            etat, "Gender", "Product_Category", locations, periode
+        ),
+        "frequence_meilleure_vente": lambda: m.frequence_meilleure_vente(couples),
+        "series_de_la_selection": lambda: m.series_de_la_selection(
+            etat, "mois", locations
+        ),
+        "indicateur_du_mois": lambda: m.indicateur_du_mois(mensuel, mois),
+        "serie_evolution": lambda: m.serie_evolution(etat, locations, None, periode),
+        "plot_evolution_chiffre_affaire": lambda: (
+            m.plot_evolution_chiffre_affaire(chiffre)
+        ),
+        "interroger_ventes (première page)": lambda: m.interroger_ventes(
+            etat, locations, periode, "", [], 0, 10
+        ),
+        "interroger_ventes (tri et filtre)": lambda: m.interroger_ventes(
+            etat,
+            locations,
+            periode,
+            "{Quantity} > 3",
+            [{"column_id": "Avg_Price", "direction": "desc"}],
+            0,
+            10,
+        ),
+    }
+
+
+fabriques_appels = {"supermarche": appels_supermarche, "retail": appels_retail}
+
+
+def mesurer_application(application, repetitions, demarrage_seul):
+    sys.path.insert(0, racine)
+    debut = time.perf_counter()
+    m = importlib.import_module(modules[application])
+    demarrage = time.perf_counter() - debut
+    memoire_demarrage = memoire_residente_max()
+
+    resultats = [
+        {
+            "mesure": "demarrage",
+            "selection": None,
+            "durees": [demarrage],
+            "pic_memoire_octets": memoire_demarrage,
+        }
+    ]
+    if demarrage_seul:
+        return resultats
+
+    for nom_selection, filtres in selections[application].items():
+        filtres = resoudre_filtres(m, filtres)
+        appels = fabriques_appels[application](m, *filtres)
+        appels.update(appels_callbacks(m, filtres))
+        for mesure, appel in appels.items():
+            appel()  # préchauffage
+            resultats.append(
+                {
+                    "mesure": mesure,
+                    "selection": nom_selection,
+                    "durees": chronometrer(appel, repetitions),
+                    "pic_memoire_octets": pic_memoire(appel),
+                }
+            )
+    return resultats
+
+
+# Orchestration, dans le processus principal
+
+
+def preparer_donnees(application, lignes, dossier, graine):
+    chemin = os.path.join(dossier, f"{application}_{lignes}_{graine}.csv")
+    if not os.path.exists(chemin):
+        print(f"Génération de {chemin}", file=sys.stderr)
+        ecrire_csv(application, lignes, chemin + ".tmp", graine)
+        os.replace(chemin + ".tmp", chemin)
+    return chemin
+
+
+def lancer_mesures(application, chemin, repetitions, demarrage_seul=False):
+    environnement = {
+        **os.environ,
+        "DONNEES_CHEMIN": chemin,
+        "CACHE_FIGURES_TAILLE": "0",
+    }
+    commande = [
+        sys.executable,
+        "-m",
+        "performance.benchmark",
+        "--mesurer",
+        application,
+        "--repetitions",
+        str(repetitions),
+    ]
+    if demarrage_seul:
+        commande.append("--demarrage-seul")
+    sortie = subprocess.run(
+        commande,
+        cwd=racine,
+        env=environnement,
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(sortie)
+
+
+def version_code():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=racine,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def resumer(application, lignes, resultat):
+    durees = resultat.pop("durees")
+    return {
+        "application": application,
+        "lignes": lignes,
+        **resultat,
+        "mediane_s": statistics.median(durees),
+        "minimum_s": min(durees),
+        "repetitions": len(durees),
+    }
+
+
+def executer(applications, tailles, repetitions, dossier, graine):
+    resultats = []
+    for application in applications:
+        for lignes in tailles:
+            chemin = preparer_donnees(application, lignes, dossier, graine)
+            # Les partitions sont supprimées : le premier démarrage lit le CSV
+            shutil.rmtree(os.path.splitext(chemin)[0] + ".partitions", True)
+
+            print(f"Mesures {application}, {lignes} lignes", file=sys.stderr)
+            froid = lancer_mesures(application, chemin, repetitions, True)[0]
+            froid["mesure"] = "demarrage (CSV)"
+            resultats.append(resumer(application, lignes, froid))
+
+            for resultat in lancer_mesures(application, chemin, repetitions):
+                if resultat["mesure"] == "demarrage":
+                    resultat["mesure"] = "demarrage (Feather)"
+                resultats.append(resumer(application, lignes, resultat))
+
+    return {
+        "version": version_code(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        # Moteur de requêtes et lecture du CSV des applications, hérités par
+        # leurs processus
+        "moteur": os.environ.get("MOTEUR_REQUETES", "pandas"),
+        "lignes_par_bloc": os.environ.get("CSV_LIGNES_PAR_BLOC"),
+        "processus_chargement": os.environ.get("PROCESSUS_CHARGEMENT"),
+        "plateforme": platform.platform(),
+        "resultats": resultats,
+    }
+
+
+# Comparaison de deux fichiers de résultats
+
+
+def cle_resultat(resultat):
+    return (
+        resultat["application"],
+        resultat["lignes"],
+        resultat["mesure"],
+        resultat["selection"],
+    )
+
+
+def comparer(chemin_reference, chemin_nouveau, seuil):
+    with open(chemin_reference) as fichier:
+        reference = json.load(fichier)
+    with open(chemin_nouveau) as fichier:
+        nouveau = json.load(fichier)
+
+    anciens = {cle_resultat(r): r for r in reference["resultats"]}
+    print(
+        f"Référence : {reference['version']} ({reference.get('moteur', 'pandas')})"
+        f"   Nouveau : {nouveau['version']} ({nouveau.get('moteur', 'pandas')})"
+    )
+    print(
+        f"{'application':<12} {'lignes':>10} {'mesure':<45} {'sélection':<22} "
+        f"{'avant (ms)':>11} {'après (ms)':>11} {'rapport':>8} {'mémoire':>8}"
+    )
+
+    regressions = 0
+    for resultat in nouveau["resultats"]:
+        ancien = anciens.get(cle_resultat(resultat))
+        if ancien is None:
+            continue
+        rapport = resultat["mediane_s"] / ancien["mediane_s"]
+        rapport_memoire = resultat["pic_memoire_octets"] / max(
+            ancien["pic_memoire_octets"], 1
+        )
+        marque = ""
+        if rapport > 1 + seuil:
+            marque = "  régression"
+            regressions += 1
+        elif rapport < 1 - seuil:
+            marque = "  amélioration"
+        print(
+            f"{resultat['application']:<12} {resultat['lignes']:>10} "
+            f"{resultat['mesure']:<45} {str(resultat['selection'] or ''):<22} "
+            f"{ancien['mediane_s'] * 1000:>11.2f} {resultat['mediane_s'] * 1000:>11.2f} "
+            f"{rapport:>8.2f} {rapport_memoire:>8.2f}{marque}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Mesure les fonctions et callbacks des tableaux de bord"
+    )
+    parser.add_argument(
+        "--applications", nargs="+", choices=sorted(modules), default=sorted(modules)
+    )
+    parser.add_argument("--tailles", nargs="+", type=int, default=tailles_defaut)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument(
+        "--dossier",
+        default=os.path.join(tempfile.gettempdir(), "dashboards_benchmark"),
+        help="dossier des CSV synthétiques, réutilisés d'une exécution à l'autre",
+    )
+    parser.add_argument("--sortie", help="fichier JSON des résultats (sinon stdout)")
+    parser.add_argument(
+        "--comparer",
+        nargs=2,
+        metavar=("REFERENCE", "NOUVEAU"),
+        help="compare deux fichiers de résultats au lieu de mesurer",
+    )
+    parser.add_argument(
+        "--seuil",
+        type=float,
+        default=0.1,
+        help="écart relatif de la médiane signalé comme régression",
+    )
+    parser.add_argument("--mesurer", choices=sorted(modules), help=argparse.SUPPRESS)
+    parser.add_argument("--demarrage-seul", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.mesurer:
+        json.dump(
+            mesurer_application(
+                arguments.mesurer, arguments.repetitions, arguments.demarrage_seul
+            ),
+            sys.stdout,
+        )
+    elif arguments.comparer:
+        sys.exit(1 if comparer(*arguments.comparer, arguments.seuil) else 0)
+    else:
+        os.makedirs(arguments.dossier, exist_ok=True)
+        resultats = executer(
+            arguments.applications,
+            arguments.tailles,
+            arguments.repetitions,
+            arguments.dossier,
+            arguments.graine,
+        )
+        if arguments.sortie:
+            with open(arguments.sortie, "w") as fichier:
+                json.dump(resultats, fichier, indent=2)
+        else:
+            json.dump(resultats, sys.stdout, indent=2)
@@ -0,0 +1,459 @@
+# =========================================
+# Test de charge des callbacks des tableaux de bord
+# =========================================
+
+# Démarre une application sous gunicorn (nombre de workers et de threads au
+# choix), puis des utilisateurs virtuels rejouent des changements de filtres
+# sur /_dash-update-component comme le ferait le navigateur : chargement de
+# la page, puis à chaque changement d'un filtre, toutes les requêtes des
+# callbacks qui en dépendent, envoyées en parallèle. Les requêtes sont
+# construites à partir de /_dash-dependencies et de /_dash-layout, et l'état
+# renvoyé (empreintes des panneaux, page de la table) est réutilisé comme le
+# ferait le navigateur. Le nombre d'utilisateurs augmente par paliers ; pour
+# chaque palier sont mesurés les centiles 50, 95 et 99 de la latence des
+# requêtes et des interactions (toutes les requêtes d'un changement de
+# filtre) et le débit.
+#
+#   python -m performance.load_test --workers 2 --threads 4
+#   python -m performance.load_test --applications retail --lignes 1000000
+#   python -m performance.load_test --url http://127.0.0.1:8000 --applications supermarche
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from performance.benchmark import modules, preparer_donnees, version_code
+
+racine = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+chemin_callbacks = "/_dash-update-component"
+
+
+# =========================================
+# Serveur
+# =========================================
+
+
+def port_libre():
+    with socket.socket() as connexion:
+        connexion.bind(("127.0.0.1", 0))
+        return connexion.getsockname()[1]
+
+
+def requete(adresse, methode, chemin, corps=None, delai=60):
+    morceaux = urlsplit(adresse)
+    connexion = http.client.HTTPConnection(
+        morceaux.hostname, morceaux.port, timeout=delai
+    )
+    try:
+        entetes = {"Content-Type": "application/json"} if corps is not None else {}
+        connexion.request(
+            methode,
+            morceaux.path.rstrip("/") + chemin,
+            body=None if corps is None else json.dumps(corps),
+            headers=entetes,
+        )
+        reponse = connexion.getresponse()
+        return reponse.status, reponse.read()
+    finally:
+        connexion.close()
+
+
+def attendre_serveur(adresse, processus, delai):
+    limite = time.monotonic() + delai
+    while time.monotonic() < limite:
+        if processus.poll() is not None:
+            raise RuntimeError("gunicorn s'est arrêté au démarrage")
+        try:
+            if requete(adresse, "GET", "/_dash-layout", delai=5)[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Le serveur {adresse} ne répond pas après {delai} s")
+
+
+def demarrer_gunicorn(application, workers, threads, chemin_donnees, journal):
+    port = port_libre()
+    environnement = dict(os.environ)
+    if chemin_donnees:
+        environnement["DONNEES_CHEMIN"] = chemin_donnees
+    processus = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--workers",
+            str(workers),
+            "--threads",
+            str(threads),
+            "--bind",
+            f"127.0.0.1:{port}",
+            f"{modules[application]}:server",
+        ],
+        cwd=racine,
+        env=environnement,
+        stdout=journal,
+        stderr=journal,
+    )
+    return processus, f"http://127.0.0.1:{port}"
+
+
+# =========================================
+# Requêtes de callbacks
+# =========================================
+
+
+def proprietes_initiales(noeud, proprietes):
+    # Parcours de /_dash-layout : valeur initiale de chaque propriété des
+    # composants identifiés
+    if isinstance(noeud, list):
+        for enfant in noeud:
+            proprietes_initiales(enfant, proprietes)
+    elif isinstance(noeud, dict):
+        props = noeud.get("props", {})
+        if isinstance(props.get("id"), str):
+            for propriete, valeur in props.items():
+                proprietes[(props["id"], propriete)] = valeur
+        for valeur in props.values():
+            proprietes_initiales(valeur, proprietes)
+    return proprietes
+
+
+def decrire_application(adresse):
+    _, corps = requete(adresse, "GET", "/_dash-dependencies")
+    callbacks = json.loads(corps)
+    _, corps = requete(adresse, "GET", "/_dash-layout")
+    proprietes = proprietes_initiales(json.loads(corps), {})
+
+    # Filtres : listes déroulantes dont dépendent les callbacks
+    filtres = {}
+    for dependance in callbacks:
+        for entree in dependance["inputs"]:
+            cle = (entree["id"], entree["property"])
+            options = proprietes.get((entree["id"], "options"))
+            if entree["property"] == "value" and options:
+                filtres[cle] = [option["value"] for option in options]
+    return callbacks, proprietes, filtres
+
+
+def sorties(dependance):
+    texte = dependance["output"]
+    if texte.startswith(".."):
+        return [partie.rsplit(".", 1) for partie in texte.strip(".").split("...")]
+    return [texte.rsplit(".", 1)]
+
+
+def corps_callback(dependance, etat, declencheur):
+    liste_sorties = [
+        {"id": identifiant, "property": propriete}
+        for identifiant, propriete in sorties(dependance)
+    ]
+    return {
+        "output": dependance["output"],
+        "outputs": (
+            liste_sorties if dependance["output"].startswith("..") else liste_sorties[0]
+        ),
+        "inputs": [
+            {**entree, "value": etat.get((entree["id"], entree["property"]))}
+            for entree in dependance["inputs"]
+        ],
+        "state": [
+            {**entree, "value": etat.get((entree["id"], entree["property"]))}
+            for entree in dependance["state"]
+        ],
+        "changedPropIds": [f"{declencheur[0]}.{declencheur[1]}"] if declencheur else [],
+    }
+
+
+def choisir_selection(aleatoire, valeurs):
+    # Aucune valeur, une seule ou plusieurs, comme un utilisateur
+    tirage = aleatoire.random()
+    if tirage < 0.2:
+        return None
+    nombre = 1 if tirage < 0.7 else aleatoire.randint(2, max(2, len(valeurs) - 1))
+    return aleatoire.sample(valeurs, min(nombre, len(valeurs)))
+
+
+# =========================================
+# Utilisateurs virtuels
+# =========================================
+
+
+def nouvelles_mesures():
+    return {
+        "verrou": threading.Lock(),
+        "requetes": [],
+        "interactions": [],
+        "erreurs": 0,
+    }
+
+
+def ajouter_mesures(mesures, durees, erreurs, duree_interaction):
+    with mesures["verrou"]:
+        mesures["requetes"].extend(durees)
+        mesures["interactions"].append(duree_interaction)
+        mesures["erreurs"] += erreurs
+
+
+def envoyer(adresse, dependance, etat, declencheur):
+    debut = time.perf_counter()
+    try:
+        statut, corps = requete(
+            adresse,
+            "POST",
+            chemin_callbacks,
+            corps_callback(dependance, etat, declencheur),
+        )
+    except OSError:
+        return time.perf_counter() - debut, None, False
+    duree = time.perf_counter() - debut
+    if statut == 204:
+        return duree, {}, True
+    if statut != 200:
+        return duree, None, False
+    return duree, json.loads(corps).get("response", {}), True
+
+
+def interagir(adresse, dependances, etat, declencheur, executeur, mesures):
+    debut = time.perf_counter()
+    resultats = list(
+        executeur.map(
+            lambda dependance: envoyer(adresse, dependance, etat, declencheur),
+            dependances,
+        )
+    )
+    duree_interaction = time.perf_counter() - debut
+
+    # Les valeurs renvoyées qui servent d'entrée ou d'état à un callback
+    # (empreintes, page de la table) sont conservées, comme dans le navigateur
+    for _, reponse, _ in resultats:
+        for identifiant, proprietes in (reponse or {}).items():
+            for propriete, valeur in proprietes.items():
+                if (identifiant, propriete) in etat:
+                    etat[(identifiant, propriete)] = valeur
+
+    ajouter_mesures(
+        mesures,
+        [duree for duree, _, _ in resultats],
+        sum(1 for _, _, succes in resultats if not succes),
+        duree_interaction,
+    )
+
+
+def utilisateur(adresse, description, fin, pause, graine, mesures):
+    callbacks, proprietes, filtres = description
+    aleatoire = random.Random(graine)
+    etat = {
+        (entree["id"], entree["property"]): proprietes.get(
+            (entree["id"], entree["property"])
+        )
+        for dependance in callbacks
+        for entree in dependance["inputs"] + dependance["state"]
+    }
+
+    with ThreadPoolExecutor(max_workers=len(callbacks)) as executeur:
+        # Chargement de la page : tous les callbacks sont appelés
+        interagir(adresse, callbacks, etat, None, executeur, mesures)
+        while time.monotonic() < fin:
+            time.sleep(aleatoire.uniform(0, 2 * pause))
+            filtre = aleatoire.choice(sorted(filtres))
+            etat[filtre] = choisir_selection(aleatoire, filtres[filtre])
+            concernes = [
+                dependance
+                for dependance in callbacks
+                if {"id": filtre[0], "property": filtre[1]} in dependance["inputs"]
+            ]
+            interagir(adresse, concernes, etat, filtre, executeur, mesures)
+
+
+def centile(valeurs, rang):
+    if not valeurs:
+        return None
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(rang / 100 * len(valeurs)))]
+
+
+def resumer_centiles(durees):
+    return {
+        f"p{rang}_ms": None if not durees else round(centile(durees, rang) * 1000, 2)
+        for rang in (50, 95, 99)
+    }
+
+
+def lancer_palier(adresse, description, utilisateurs, duree, pause, graine):
+    mesures = nouvelles_mesures()
+    debut = time.monotonic()
+    fin = debut + duree
+    fils = [
+        threading.Thread(
+            target=utilisateur,
+            args=(adresse, description, fin, pause, graine * 1_000 + i, mesures),
+        )
+        for i in range(utilisateurs)
+    ]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+    ecoule = time.monotonic() - debut
+
+    return {
+        "utilisateurs": utilisateurs,
+        "duree_s": round(ecoule, 2),
+        "requetes": len(mesures["requetes"]),
+        "interactions": len(mesures["interactions"]),
+        "erreurs": mesures["erreurs"],
+        "debit_requetes_s": round(len(mesures["requetes"]) / ecoule, 2),
+        "requete": resumer_centiles(mesures["requetes"]),
+        "interaction": resumer_centiles(mesures["interactions"]),
+    }
+
+
+# =========================================
+# Exécution
+# =========================================
+
+
+def tester_application(application, adresse, arguments):
+    description = decrire_application(adresse)
+    resultats = []
+    for utilisateurs in arguments.utilisateurs:
+        print(
+            f"{application} : {utilisateurs} utilisateur(s) pendant "
+            f"{arguments.duree} s",
+            file=sys.stderr,
+        )
+        resultat = lancer_palier(
+            adresse,
+            description,
+            utilisateurs,
+            arguments.duree,
+            arguments.pause,
+            arguments.graine,
+        )
+        resultats.append({"application": application, **resultat})
+        afficher(resultats[-1])
+    return resultats
+
+
+def afficher(resultat):
+    print(
+        f"  {resultat['requetes']:>7} requêtes  {resultat['erreurs']:>4} erreurs  "
+        f"{resultat['debit_requetes_s']:>8.1f} req/s  requête p50/p95/p99 "
+        f"{resultat['requete']['p50_ms']}/{resultat['requete']['p95_ms']}/"
+        f"{resultat['requete']['p99_ms']} ms  interaction p50/p95/p99 "
+        f"{resultat['interaction']['p50_ms']}/{resultat['interaction']['p95_ms']}/"
+        f"{resultat['interaction']['p99_ms']} ms",
+        file=sys.stderr,
+    )
+
+
+def executer(arguments):
+    resultats = []
+    for application in arguments.applications:
+        if arguments.url:
+            resultats += tester_application(application, arguments.url, arguments)
+            continue
+
+        chemin_donnees = None
+        if arguments.lignes:
+            chemin_donnees = preparer_donnees(
+                application, arguments.lignes, arguments.dossier, arguments.graine
+            )
+        with tempfile.TemporaryFile() as journal:
+            processus, adresse = demarrer_gunicorn(
+                application,
+                arguments.workers,
+                arguments.threads,
+                chemin_donnees,
+                journal,
+            )
+            try:
+                attendre_serveur(adresse, processus, arguments.delai_demarrage)
+                resultats += tester_application(application, adresse, arguments)
+            except RuntimeError:
+                journal.seek(0)
+                sys.stderr.write(journal.read().decode(errors="replace"))
+                raise
+            finally:
+                processus.terminate()
+                processus.wait()
+
+    return {
+        "version": version_code(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "configuration": {
+            "url": arguments.url,
+            "workers": None if arguments.url else arguments.workers,
+            "threads": None if arguments.url else arguments.threads,
+            "lignes": arguments.lignes,
+            "pause_s": arguments.pause,
+            "cpu": os.cpu_count(),
+        },
+        "resultats": resultats,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Test de charge des callbacks des tableaux de bord"
+    )
+    parser.add_argument(
+        "--applications", nargs="+", choices=sorted(modules), default=sorted(modules)
+    )
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument(
+        "--utilisateurs",
+        nargs="+",
+        type=int,
+        default=[1, 5, 10, 20],
+        help="nombre d'utilisateurs virtuels de chaque palier",
+    )
+    parser.add_argument(
+        "--duree", type=float, default=20, help="durée de chaque palier en secondes"
+    )
+    parser.add_argument(
+        "--pause",
+        type=float,
+        default=0.5,
+        help="temps de réflexion moyen entre deux changements de filtre (s)",
+    )
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument(
+        "--lignes",
+        type=int,
+        help="taille des données synthétiques (sinon les données de l'application)",
+    )
+    parser.add_argument(
+        "--dossier",
+        default=os.path.join(tempfile.gettempdir(), "dashboards_benchmark"),
+        help="dossier des CSV synthétiques, partagé avec performance.benchmark",
+    )
+    parser.add_argument(
+        "--url", help="serveur déjà démarré à tester, au lieu de lancer gunicorn"
+    )
+    parser.add_argument("--delai-demarrage", type=float, default=300)
+    parser.add_argument("--sortie", help="fichier JSON des résultats (sinon stdout)")
+    arguments = parser.parse_args()
+
+    if arguments.lignes:
+        os.makedirs(arguments.dossier, exist_ok=True)
+    resultats = executer(arguments)
+    if arguments.sortie:
+        with open(arguments.sortie, "w") as fichier:
+            json.dump(resultats, fichier, indent=2)
+    else:
+        json.dump(resultats, sys.stdout, indent=2)
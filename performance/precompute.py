@@ -0,0 +1,110 @@
+# =========================================
+# Précalcul des panneaux des tableaux de bord
+# =========================================
+
+# Calcule hors ligne les sorties des panneaux de chaque application pour ses
+# combinaisons de filtres, sur toute la période, en fichiers JSON compressés
+# (un dossier par application). Au-delà de --maximum combinaisons (256 par
+# défaut), les plus demandées d'après la base du cache des figures sont
+# retenues, puis les plus simples. Chaque application est chargée dans un
+# processus séparé, avec ses variables d'environnement (DONNEES_CHEMIN...),
+# puis sert les fichiers avec PRECALCUL_DOSSIER :
+#
+#   python -m performance.precompute --dossier precalcul
+#   python -m performance.precompute --applications retail --maximum 50
+#   PRECALCUL_DOSSIER=precalcul/supermarche gunicorn -c gunicorn.conf.py \
+#       supermarket_sales_dashboard.supermarket_sales_dashboard:server
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from dashboard_common.dashboard_common import maximum_precalcul
+from performance.benchmark import modules, racine
+
+
+def precalculer_application(application, dossier, maximum):
+    sys.path.insert(0, racine)
+    m = importlib.import_module(modules[application])
+    debut = time.perf_counter()
+    selections = m.precalculer(dossier, maximum)
+    fichiers = [os.path.join(dossier, nom) for nom in os.listdir(dossier)]
+    return {
+        "application": application,
+        "dossier": dossier,
+        "combinaisons": len(selections),
+        "fichiers": len(fichiers),
+        "octets": sum(os.path.getsize(chemin) for chemin in fichiers),
+        "duree_s": time.perf_counter() - debut,
+    }
+
+
+def executer(applications, dossier, maximum):
+    resultats = []
+    for application in applications:
+        print(f"Précalcul {application}", file=sys.stderr)
+        commande = [
+            sys.executable,
+            "-m",
+            "performance.precompute",
+            "--precalculer",
+            application,
+            "--dossier",
+            os.path.abspath(os.path.join(dossier, application)),
+            "--maximum",
+            str(maximum),
+        ]
+        sortie = subprocess.run(
+            commande, cwd=racine, stdout=subprocess.PIPE, check=True, text=True
+        ).stdout
+        resultats.append(json.loads(sortie))
+    return resultats
+
+
+def afficher(resultat):
+    print(
+        f"{resultat['application']:<12} {resultat['combinaisons']:>6} combinaisons"
+        f" {resultat['fichiers']:>7} fichiers {resultat['octets'] / 1e6:>9.1f} Mo"
+        f" {resultat['duree_s']:>8.1f} s   {resultat['dossier']}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Précalcule les panneaux des tableaux de bord"
+    )
+    parser.add_argument(
+        "--applications", nargs="+", choices=sorted(modules), default=sorted(modules)
+    )
+    parser.add_argument(
+        "--dossier",
+        default="precalcul",
+        help="dossier des fichiers précalculés (un sous-dossier par application)",
+    )
+    parser.add_argument(
+        "--maximum",
+        type=int,
+        default=maximum_precalcul,
+        help="nombre maximal de combinaisons de filtres par application",
+    )
+    parser.add_argument(
+        "--precalculer", choices=sorted(modules), help=argparse.SUPPRESS
+    )
+    arguments = parser.parse_args()
+
+    if arguments.precalculer:
+        json.dump(
+            precalculer_application(
+                arguments.precalculer, arguments.dossier, arguments.maximum
+            ),
+            sys.stdout,
+        )
+    else:
+        for resultat in executer(
+            arguments.applications, arguments.dossier, arguments.maximum
+        ):
+            afficher(resultat)
@@ -0,0 +1,553 @@
+# =========================================
+# Données synthétiques aux schémas des deux applications
+# =========================================
+
+# Produit des fichiers CSV au format des fichiers sources des deux tableaux
+# de bord, de taille quelconque. Les distributions (fréquences des modalités,
+# quantiles des prix, profil mensuel et hebdomadaire des ventes...) sont
+# ajustées sur les CSV du dépôt ; sans le CSV du retail, des paramètres
+# intégrés le remplacent. Le fichier est écrit par blocs : la mémoire reste
+# bornée quelle que soit la taille. Chaque bloc tire ses valeurs de sa propre
+# graine : la même graine et la même taille de bloc (--bloc) donnent le même
+# fichier.
+#
+#   python -m performance.synthetic_data supermarche 1000000 ventes.csv
+#   python -m performance.synthetic_data retail 100000000 lignes.csv --jours 1825
+
+import argparse
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+taille_bloc = 1_000_000
+
+racine = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sources = {
+    "supermarche": os.path.join(
+        racine, "supermarket_sales_dashboard", "supermarket_sales.csv"
+    ),
+    "retail": os.path.join(
+        racine, "retail_insight_dashboard", "omnichannel_retail_line_items.csv"
+    ),
+}
+
+# Nombre de quantiles conservés pour les distributions continues
+nombre_quantiles = 101
+
+
+# =========================================
+# Distributions
+# =========================================
+
+# Distribution discrète d'une ou plusieurs colonnes (loi jointe)
+
+
+def frequences(data, colonnes):
+    comptes = data.groupby(colonnes).size()
+    valeurs = comptes.index.to_frame(index=False)
+    return {
+        "valeurs": {colonne: valeurs[colonne].to_numpy() for colonne in colonnes},
+        "probabilites": comptes.to_numpy() / comptes.sum(),
+    }
+
+
+def frequences_fixees(colonnes, lignes, poids):
+    valeurs = pd.DataFrame(lignes, columns=colonnes)
+    poids = np.asarray(poids, dtype=float)
+    return {
+        "valeurs": {colonne: valeurs[colonne].to_numpy() for colonne in colonnes},
+        "probabilites": poids / poids.sum(),
+    }
+
+
+def tirer(distribution, uniformes):
+    cumul = np.cumsum(distribution["probabilites"])
+    indices = np.searchsorted(cumul, uniformes * cumul[-1], side="right")
+    indices = np.minimum(indices, len(cumul) - 1)
+    return {
+        colonne: valeurs[indices]
+        for colonne, valeurs in distribution["valeurs"].items()
+    }
+
+
+# Distribution continue : quantiles, tirés par inversion de la fonction de
+# répartition
+
+
+def quantiles(serie):
+    return np.quantile(serie.dropna(), np.linspace(0, 1, nombre_quantiles))
+
+
+def tirer_quantiles(points, uniformes):
+    return np.interp(uniformes, np.linspace(0, 1, len(points)), points)
+
+
+def tirer_par_groupe(groupes, points_groupes, points_defaut, uniformes):
+    valeurs = np.empty(len(groupes))
+    for groupe in np.unique(groupes):
+        masque = groupes == groupe
+        points = points_groupes.get(groupe, points_defaut)
+        valeurs[masque] = tirer_quantiles(points, uniformes[masque])
+    return valeurs
+
+
+# Uniformes déterministes d'un identifiant (client, transaction) : les
+# attributs d'un même client sont identiques d'un bloc à l'autre sans garder
+# de table en mémoire
+
+
+def uniformes_hachees(identifiants, graine, sel):
+    valeurs = np.asarray(identifiants, dtype=np.uint64)
+    valeurs = valeurs * np.uint64(0x9E3779B97F4A7C15) + np.uint64(
+        (graine * 1_000_003 + sel) & 0xFFFFFFFF
+    )
+    valeurs ^= valeurs >> np.uint64(31)
+    valeurs *= np.uint64(0xBF58476D1CE4E5B9)
+    valeurs ^= valeurs >> np.uint64(29)
+    return (valeurs >> np.uint64(11)).astype(np.float64) / 2.0**53
+
+
+# =========================================
+# Calendrier
+# =========================================
+
+# Poids relatifs des mois et des jours de la semaine, normalisés par le nombre
+# de jours observés : l'historique peut ainsi être prolongé sur plusieurs
+# années en gardant la saisonnalité
+
+
+def profil_calendrier(dates):
+    jours = pd.date_range(dates.min(), dates.max(), freq="D")
+    ventes = dates.value_counts().reindex(jours, fill_value=0)
+
+    par_mois = ventes.groupby(jours.month).mean()
+    par_semaine = ventes.groupby(jours.dayofweek).mean()
+
+    mois = par_mois.reindex(range(1, 13)).fillna(par_mois.mean())
+    semaine = par_semaine.reindex(range(7)).fillna(par_semaine.mean())
+    return {
+        "mois": (mois / mois.mean()).to_numpy(),
+        "semaine": (semaine / semaine.mean()).to_numpy(),
+        "debut": jours[0],
+        "jours": len(jours),
+    }
+
+
+def jours_historique(calendrier, debut=None, jours=None):
+    dates = pd.date_range(
+        debut or calendrier["debut"], periods=jours or calendrier["jours"], freq="D"
+    )
+    poids = calendrier["mois"][dates.month - 1] * calendrier["semaine"][dates.dayofweek]
+    return dates, poids / poids.sum()
+
+
+# =========================================
+# Supermarché
+# =========================================
+
+
+def ajuster_supermarche(data):
+    dates = pd.to_datetime(data["Date"], format="%m/%d/%Y")
+    heures = pd.to_datetime(data["Time"], format="%H:%M").dt.hour
+    return {
+        "cellules": frequences(data, ["Branch", "City", "Gender", "Product line"]),
+        "types_client": frequences(data, ["Customer type"]),
+        "paiements": frequences(data, ["Payment"]),
+        "quantites": frequences(data, ["Quantity"]),
+        "heures": frequences(heures.to_frame("heure"), ["heure"]),
+        "prix": {
+            ligne: quantiles(groupe)
+            for ligne, groupe in data.groupby("Product line")["Unit price"]
+        },
+        "prix_global": quantiles(data["Unit price"]),
+        "notes": quantiles(data["Rating"]),
+        "taux_taxe": float((data["Tax 5%"] / data["cogs"]).median()),
+        "marge": float(data["gross margin percentage"].median()),
+        "calendrier": profil_calendrier(dates),
+    }
+
+
+def identifiants_factures(positions):
+    # Bijection sur 10^9 : chaque position donne un identifiant unique
+    nombres = (positions * 387_420_489 + 123_456_789) % 1_000_000_000
+    return (
+        libelles_nombres(3)[nombres // 1_000_000]
+        + "-"
+        + libelles_nombres(2)[nombres // 10_000 % 100]
+        + "-"
+        + libelles_nombres(4)[nombres % 10_000]
+    )
+
+
+def libelles_nombres(chiffres):
+    return np.array([f"{n:0{chiffres}d}" for n in range(10**chiffres)], dtype=object)
+
+
+def generer_supermarche(modele, nombre, graine=0, debut=0, jours=None, date_debut=None):
+    aleatoire = np.random.default_rng([graine, debut])
+    positions = np.arange(debut, debut + nombre, dtype=np.int64)
+
+    cellules = tirer(modele["cellules"], aleatoire.random(nombre))
+    lignes = cellules["Product line"]
+    prix = np.round(
+        tirer_par_groupe(
+            lignes, modele["prix"], modele["prix_global"], aleatoire.random(nombre)
+        ),
+        2,
+    )
+    quantites = tirer(modele["quantites"], aleatoire.random(nombre))["Quantity"]
+    cout = np.round(prix * quantites, 2)
+    taxe = np.round(cout * modele["taux_taxe"], 4)
+
+    dates, poids = jours_historique(modele["calendrier"], date_debut, jours)
+    libelles_dates = np.array(
+        [f"{d.month}/{d.day}/{d.year}" for d in dates], dtype=object
+    )
+    jours_tires = aleatoire.choice(len(dates), nombre, p=poids)
+
+    heures = tirer(modele["heures"], aleatoire.random(nombre))["heure"]
+    minutes = heures * 60 + aleatoire.integers(0, 60, nombre)
+    libelles_heures = np.array(
+        [f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)], dtype=object
+    )
+
+    return pd.DataFrame(
+        {
+            "Invoice ID": identifiants_factures(positions),
+            "Branch": cellules["Branch"],
+            "City": cellules["City"],
+            "Customer type": tirer(modele["types_client"], aleatoire.random(nombre))[
+                "Customer type"
+            ],
+            "Gender": cellules["Gender"],
+            "Product line": lignes,
+            "Unit price": prix,
+            "Quantity": quantites,
+            "Tax 5%": taxe,
+            "Total": cout + taxe,
+            "Date": libelles_dates[jours_tires],
+            "Time": libelles_heures[minutes],
+            "Payment": tirer(modele["paiements"], aleatoire.random(nombre))["Payment"],
+            "cogs": cout,
+            "gross margin percentage": modele["marge"],
+            "gross income": taxe,
+            "Rating": np.round(
+                tirer_quantiles(modele["notes"], aleatoire.random(nombre)), 1
+            ),
+        }
+    )
+
+
+# =========================================
+# Retail
+# =========================================
+
+
+def ajuster_retail(data):
+    dates = pd.to_datetime(data["Transaction_Date"])
+    clients = data.drop_duplicates("CustomerID")
+    return {
+        "clients": frequences(clients, ["Gender", "Location", "Tenure_Months"]),
+        "lignes_par_client": len(data) / data["CustomerID"].nunique(),
+        "lignes_par_transaction": len(data) / data["Transaction_ID"].nunique(),
+        "premier_client": int(data["CustomerID"].min()),
+        "premiere_transaction": int(data["Transaction_ID"].min()),
+        "produits": frequences(
+            data, ["Product_SKU", "Product_Description", "Product_Category"]
+        ),
+        "prix": {
+            categorie: quantiles(groupe)
+            for categorie, groupe in data.groupby("Product_Category")["Avg_Price"]
+        },
+        "prix_global": quantiles(data["Avg_Price"]),
+        "quantites": frequences(data, ["Quantity"]),
+        "livraison": frequences(data, ["Delivery_Charges"]),
+        "coupons": frequences(data, ["Coupon_Status"]),
+        "remises": {
+            mois: frequences(groupe, ["Discount_pct"])
+            for mois, groupe in data.groupby("Month")
+        },
+        "remises_global": frequences(data, ["Discount_pct"]),
+        "calendrier": profil_calendrier(dates),
+    }
+
+
+# Paramètres intégrés, utilisés quand le CSV du retail n'est pas présent
+
+locations = ["Chicago", "California", "New York", "New Jersey", "Washington DC"]
+
+categories_produit = [
+    "Accessories",
+    "Android",
+    "Apparel",
+    "Bags",
+    "Bottles",
+    "Drinkware",
+    "Fun",
+    "Gift Cards",
+    "Google",
+    "Headgear",
+    "Housewares",
+    "Lifestyle",
+    "More Bags",
+    "Nest",
+    "Nest-Canada",
+    "Nest-USA",
+    "Notebooks & Journals",
+    "Office",
+    "Waze",
+]
+
+poids_locations = [0.35, 0.31, 0.21, 0.08, 0.05]
+
+poids_categories = [
+    1.4,
+    0.1,
+    34.4,
+    3.5,
+    0.5,
+    6.4,
+    0.3,
+    0.3,
+    0.2,
+    1.5,
+    0.1,
+    0.6,
+    0.1,
+    4.5,
+    0.1,
+    27.6,
+    1.4,
+    12.3,
+    1.0,
+]
+
+prix_categories = {
+    "Apparel": [2.0, 7.0, 14.0, 19.0, 25.0, 60.0],
+    "Nest-USA": [20.0, 80.0, 120.0, 150.0, 200.0, 355.0],
+    "Nest": [20.0, 80.0, 120.0, 150.0, 200.0, 355.0],
+    "Office": [0.5, 2.0, 3.5, 6.0, 10.0, 40.0],
+    "Drinkware": [2.0, 4.0, 8.0, 10.0, 15.0, 35.0],
+}
+
+modele_retail_defaut = {
+    "clients": frequences_fixees(
+        ["Gender", "Location", "Tenure_Months"],
+        list(itertools.product(["F", "M"], locations, range(2, 51))),
+        [
+            genre * location
+            for genre, location in itertools.product([0.64, 0.36], poids_locations)
+            for _ in range(2, 51)
+        ],
+    ),
+    "lignes_par_client": 36.0,
+    "lignes_par_transaction": 2.1,
+    "premier_client": 12_346,
+    "premiere_transaction": 16_679,
+    "produits": frequences_fixees(
+        ["Product_SKU", "Product_Description", "Product_Category"],
+        [
+            (f"GGOE{indice:05d}", categorie, categorie)
+            for indice, categorie in enumerate(categories_produit)
+        ],
+        poids_categories,
+    ),
+    "prix": {
+        categorie: np.interp(
+            np.linspace(0, 1, nombre_quantiles), np.linspace(0, 1, len(points)), points
+        )
+        for categorie, points in prix_categories.items()
+    },
+    "prix_global": np.interp(
+        np.linspace(0, 1, nombre_quantiles),
+        np.linspace(0, 1, 6),
+        [1.0, 5.0, 12.0, 20.0, 60.0, 355.0],
+    ),
+    "quantites": frequences_fixees(
+        ["Quantity"], [(q,) for q in range(1, 21)], [1 / q**1.5 for q in range(1, 21)]
+    ),
+    "livraison": frequences_fixees(
+        ["Delivery_Charges"], [(6.0,), (6.5,), (12.99,), (19.99,)], [5, 80, 10, 5]
+    ),
+    "coupons": frequences_fixees(
+        ["Coupon_Status"], [("Clicked",), ("Used",), ("Not Used",)], [51, 34, 15]
+    ),
+    "remises": {},
+    "remises_global": frequences_fixees(
+        ["Discount_pct"], [(10,), (20,), (30,)], [1, 1, 1]
+    ),
+    "calendrier": {
+        "mois": np.array([1.0, 0.9, 0.9, 0.8, 0.8, 0.9, 1.0, 1.1, 1.0, 1.0, 1.1, 1.5]),
+        "semaine": np.ones(7),
+        "debut": pd.Timestamp("2019-01-01"),
+        "jours": 365,
+    },
+}
+
+
+def generer_retail(
+    modele, nombre, graine=0, debut=0, jours=None, date_debut=None, total=None
+):
+    aleatoire = np.random.default_rng([graine, debut])
+    total = total or debut + nombre
+    positions = np.arange(debut, debut + nombre, dtype=np.int64)
+
+    # Les lignes sont regroupées en transactions numérotées dans l'ordre des
+    # dates, comme dans le fichier d'origine ; le client et la date sont ceux
+    # de la transaction
+    transactions_total = max(1, int(total / modele["lignes_par_transaction"]))
+    transactions = positions * transactions_total // total
+
+    dates, poids = jours_historique(modele["calendrier"], date_debut, jours)
+    jours_transactions = np.minimum(
+        np.searchsorted(
+            np.cumsum(poids),
+            (transactions + uniformes_hachees(transactions, graine, 1))
+            / transactions_total,
+        ),
+        len(dates) - 1,
+    )
+    dates_lignes = dates[jours_transactions]
+
+    nombre_clients = max(1, int(total / modele["lignes_par_client"]))
+    rangs_clients = (
+        uniformes_hachees(transactions, graine, 2) * nombre_clients
+    ).astype(np.int64)
+    clients = tirer(modele["clients"], uniformes_hachees(rangs_clients, graine, 3))
+
+    produits = tirer(modele["produits"], aleatoire.random(nombre))
+    categories = produits["Product_Category"]
+
+    mois = dates_lignes.month.to_numpy()
+    remises = np.empty(nombre, dtype=np.int64)
+    for numero in np.unique(mois):
+        masque = mois == numero
+        distribution = modele["remises"].get(numero, modele["remises_global"])
+        remises[masque] = tirer(distribution, aleatoire.random(masque.sum()))[
+            "Discount_pct"
+        ]
+
+    return pd.DataFrame(
+        {
+            "CustomerID": (modele["premier_client"] + rangs_clients).astype(float),
+            "Gender": clients["Gender"],
+            "Location": clients["Location"],
+            "Tenure_Months": clients["Tenure_Months"],
+            "Transaction_ID": modele["premiere_transaction"] + transactions,
+            "Transaction_Date": dates_lignes.strftime("%Y-%m-%d"),
+            "Product_SKU": produits["Product_SKU"],
+            "Product_Description": produits["Product_Description"],
+            "Product_Category": categories,
+            "Quantity": tirer(modele["quantites"], aleatoire.random(nombre))[
+                "Quantity"
+            ],
+            "Avg_Price": np.round(
+                tirer_par_groupe(
+                    categories,
+                    modele["prix"],
+                    modele["prix_global"],
+                    aleatoire.random(nombre),
+                ),
+                2,
+            ),
+            "Delivery_Charges": tirer(modele["livraison"], aleatoire.random(nombre))[
+                "Delivery_Charges"
+            ],
+            "Coupon_Status": tirer(modele["coupons"], aleatoire.random(nombre))[
+                "Coupon_Status"
+            ],
+            "Month": mois,
+            "Discount_pct": remises,
+        },
+        index=pd.RangeIndex(debut, debut + nombre),
+    )
+
+
+# =========================================
+# Modèles et écriture
+# =========================================
+
+ajusteurs = {"supermarche": ajuster_supermarche, "retail": ajuster_retail}
+
+modeles_defaut = {"retail": modele_retail_defaut}
+
+# Le CSV du retail a une première colonne d'index sans nom
+index_csv = {"supermarche": False, "retail": True}
+
+
+def charger_modele(application, source=None):
+    source = source or sources[application]
+    if not os.path.exists(source) and application in modeles_defaut:
+        return modeles_defaut[application]
+    data = pd.read_csv(source, index_col=0 if index_csv[application] else None)
+    return ajusteurs[application](data)
+
+
+def generer(application, modele, nombre, graine=0, debut=0, **options):
+    if application == "retail":
+        return generer_retail(modele, nombre, graine, debut, **options)
+    options.pop("total", None)
+    return generer_supermarche(modele, nombre, graine, debut, **options)
+
+
+def ecrire_csv(
+    application,
+    nombre,
+    chemin,
+    graine=0,
+    jours=None,
+    date_debut=None,
+    source=None,
+    bloc=taille_bloc,
+):
+    modele = charger_modele(application, source)
+    for debut in range(0, nombre, bloc):
+        donnees = generer(
+            application,
+            modele,
+            min(bloc, nombre - debut),
+            graine,
+            debut,
+            jours=jours,
+            date_debut=date_debut,
+            total=nombre,
+        )
+        donnees.to_csv(
+            chemin,
+            mode="w" if debut == 0 else "a",
+            header=debut == 0,
+            index=index_csv[application],
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Écrit un CSV synthétique au schéma d'une application"
+    )
+    parser.add_argument("application", choices=sorted(ajusteurs))
+    parser.add_argument("lignes", type=int)
+    parser.add_argument("chemin")
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument(
+        "--jours",
+        type=int,
+        help="Durée de l'historique en jours (par défaut celle du CSV d'origine)",
+    )
+    parser.add_argument("--debut", help="Premier jour de l'historique (AAAA-MM-JJ)")
+    parser.add_argument("--source", help="CSV sur lequel ajuster les distributions")
+    parser.add_argument("--bloc", type=int, default=taille_bloc)
+    arguments = parser.parse_args()
+
+    ecrire_csv(
+        arguments.application,
+        arguments.lignes,
+        arguments.chemin,
+        arguments.graine,
+        arguments.jours,
+        arguments.debut,
+        arguments.source,
+        arguments.bloc,
+    )
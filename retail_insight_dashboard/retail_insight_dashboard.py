@@ -1,17 +1,88 @@
 # Import des bibliothèques essentielles
+import collections
+import csv
+import io
+import itertools
+import json
+import logging
+import math
+import operator
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+# Début du démarrage, avant les imports lourds (numpy, pandas, dash, plotly)
+instant_debut = time.perf_counter()
+
 import numpy as np
 import pandas as pd
 from calendar import month_abbr, month_name
 
 # Import de Dash et de ses composants
 import dash
-from dash import Dash, dcc, html, dash_table, Input, Output, callback
+from dash import Dash, dcc, html, dash_table, Input, Output, State, callback
+from dash import no_update
 import dash_bootstrap_components as dbc
 
 # Import de Plotly pour la visualisation
-import plotly.express as px
 import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
+
+# Lancé comme script, le module commun est cherché à la racine du dépôt
+if not __package__:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from dashboard_common.dashboard_common import (
+    afficher_interface,
+    application,
+    attendre_donnees,
+    charger_donnees,
+    chemin_precalcul,
+    choisir_granularite,
+    compacter_donnees,
+    compter_selection,
+    concatener_lignes,
+    contexte_mesure,
+    couleurs_defaut,
+    curseur_duckdb,
+    decouper_par_mois,
+    donnees_pretes,
+    dossier_des_partitions,
+    ecrire_atomique,
+    ecrire_cache,
+    ecrire_gzip,
+    empreinte_contenu,
+    empreinte_donnees,
+    etape,
+    etape_demarrage,
+    executer_en_parallele,
+    figure_partielle,
+    incrementer,
+    initialiser_cache,
+    installer,
+    lancer_demarrage,
+    libelles_granularite,
+    lire_cache,
+    lire_colonnaire,
+    lire_options,
+    lire_precalcul,
+    lttb,
+    maximum_precalcul,
+    mise_en_page,
+    moteur_requetes,
+    normaliser_periode,
+    normaliser_selection,
+    ordonner_partitions,
+    plage_visible,
+    points_max_courbe,
+    selections_populaires,
+    taille_cache,
+    valeurs_filtres,
+    version_code,
+)
 
 # ========================================
 # Initialisation de l'application
@@ -20,32 +91,26 @@ import plotly.graph_objects as go
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
 
+journal = logging.getLogger(__name__)
 
-# =========================================
-# Chargement des données
-# =========================================
-
-df = pd.read_csv(
-    "retail_insight_dashboard/omnichannel_retail_line_items.csv", index_col=0
-)
+# Mesures des callbacks, /metrics et /health (dashboard_common)
+installer(app, instant_debut)
 
 
 # =========================================
 # Sélection des colonnes
 # =========================================
 
-df = df[
-    [
-        "CustomerID",
-        "Gender",
-        "Location",
-        "Product_Category",
-        "Quantity",
-        "Avg_Price",
-        "Transaction_Date",
-        "Month",
-        "Discount_pct",
-    ]
+colonnes_source = [
+    "CustomerID",
+    "Gender",
+    "Location",
+    "Product_Category",
+    "Quantity",
+    "Avg_Price",
+    "Transaction_Date",
+    "Month",
+    "Discount_pct",
 ]
 
 colonnes = [
@@ -63,14 +128,651 @@ colonnes = [
 # Nettoyage et transformation des données
 # =========================================
 
-df["CustomerID"] = df["CustomerID"].fillna(0).astype(int)
-df["Transaction_Date"] = pd.to_datetime(df["Transaction_Date"])
 
-df["Total_price"] = (
-    df["Quantity"] * df["Avg_Price"] * (1 - (df["Discount_pct"] / 100)).round(3)
+# Schéma compact (compacter_donnees) : les variables qualitatives en
+# catégories ; le prix moyen passe en float32 seulement si l'arrondi au
+# centime est conservé. Total_price est calculé avant la compaction et reste
+# en float64 pour que les chiffres d'affaires affichés ne changent pas.
+
+colonnes_categorielles = ["Gender", "Location", "Product_Category"]
+
+
+def nettoyer_donnees(df):
+    df = df[colonnes_source].copy()
+
+    df["CustomerID"] = df["CustomerID"].fillna(0).astype(int)
+    df["Transaction_Date"] = pd.to_datetime(df["Transaction_Date"])
+
+    df["Total_price"] = (
+        df["Quantity"] * df["Avg_Price"] * (1 - (df["Discount_pct"] / 100)).round(3)
+    )
+
+    # Lignes rangées par date de transaction : voir construire_etat
+    df = df.sort_values("Transaction_Date", kind="stable")
+
+    df, rapport = compacter_donnees(
+        df, colonnes_categorielles, colonnes_float32=["Avg_Price"]
+    )
+    journal.info("Mémoire par colonne avant/après compaction :\n%s", rapport)
+
+    return df
+
+
+# =========================================
+# Chargement des données
+# =========================================
+
+# Le CSV nettoyé est converti en partitions Arrow/Feather mensuelles par
+# charger_donnees (dashboard_common), qui décrit aussi DONNEES_PARTAGEES,
+# CSV_LIGNES_PAR_BLOC et PROCESSUS_CHARGEMENT. Les lignes d'un mois réparti
+# sur plusieurs blocs sont retriées par date (voir État des données).
+
+chemin_donnees = os.environ.get(
+    "DONNEES_CHEMIN", "retail_insight_dashboard/omnichannel_retail_line_items.csv"
 )
+dossier_partitions = dossier_des_partitions(chemin_donnees, "retail_insight_")
+
+
+def trier_par_date(data):
+    # Tri seulement si nécessaire (ajout en retard)
+    if data["Transaction_Date"].is_monotonic_increasing:
+        return data
+    return data.sort_values("Transaction_Date", kind="stable")
+
+
+source_donnees = {
+    "nettoyer": nettoyer_donnees,
+    "index_col": 0,
+    "colonne_date": "Transaction_Date",
+    "colonnes_filtres": ["Location"],
+    "trier": trier_par_date,
+}
+
+
+# =========================================
+# Lecture des partitions
+# =========================================
+
+# Une requête ne lit que les partitions (mois) qui recoupent la période
+# sélectionnée, puis les lignes de la période et des zones dans chacune :
+# les dates étant triées dans une partition, la période est une tranche
+# trouvée par recherche dichotomique.
+# Les PARTITIONS_EN_MEMOIRE dernières partitions lues restent ouvertes,
+# les moins récemment utilisées étant libérées au-delà.
+
+partitions_en_memoire = int(os.environ.get("PARTITIONS_EN_MEMOIRE", 24))
+cache_partitions = collections.OrderedDict()
+verrou_partitions = threading.Lock()
+
+
+def mois_de_la_periode(partitions, periode):
+    # Partitions qui recoupent la période ; les ventes sans date ne sont
+    # lues que sans période
+    debut, fin = periode
+    if not debut and not fin:
+        return list(partitions)
+    return [
+        mois
+        for mois in partitions
+        if mois != "NaT"
+        and (not debut or mois >= debut[:7])
+        and (not fin or mois <= fin[:7])
+    ]
+
+
+def mois_complet(mois, periode):
+    # Le mois est-il entièrement compris dans la période ?
+    if mois == "NaT":
+        return False
+    debut, fin = periode
+    premier_jour = pd.Timestamp(mois)
+    dernier_jour = premier_jour + pd.offsets.MonthEnd(0)
+    return (not debut or pd.Timestamp(debut) <= premier_jour) and (
+        not fin or pd.Timestamp(fin) >= dernier_jour
+    )
+
+
+def lire_partition(source):
+    # Partition en mémoire (DataFrame), ou fichier Feather gardé ouvert
+    if isinstance(source, pd.DataFrame):
+        return source
+    with verrou_partitions:
+        if source in cache_partitions:
+            cache_partitions.move_to_end(source)
+            return cache_partitions[source]
+    data = lire_colonnaire(source)
+    with verrou_partitions:
+        cache_partitions[source] = data
+        while len(cache_partitions) > max(partitions_en_memoire, 0):
+            cache_partitions.popitem(last=False)
+    return data
+
+
+def positions_de_la_partition(etat, mois, locations, periode):
+    # Partition et positions croissantes (donc par date) de ses lignes dans
+    # la période et les zones, sans copier les lignes
+    data = lire_partition(etat["partitions"][mois])
+    debut, fin = periode
+    dates = data["Transaction_Date"].to_numpy()
+    gauche = np.searchsorted(dates, np.datetime64(debut)) if debut else 0
+    droite = (
+        np.searchsorted(dates, np.datetime64(fin) + np.timedelta64(1, "D"))
+        if fin
+        else len(dates)
+    )
+    positions = np.arange(gauche, droite)
+    if locations:
+        codes, modalites = codes_categoriels(data["Location"])
+        retenues = np.flatnonzero(modalites.isin(locations))
+        positions = positions[np.isin(codes[gauche:droite], retenues)]
+    return data, positions
+
+
+def lignes_aux_positions(data, positions, colonnes_lues=None):
+    # Positions consécutives (toute une période) : simple vue sur la partition
+    if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+        positions = slice(positions[0], positions[-1] + 1)
+    if colonnes_lues is not None:
+        data = data[colonnes_lues]
+    return data.iloc[positions]
+
+
+def ventes_de_la_selection(etat, locations, periode, colonnes_lues=None):
+    # Ventes des zones et de la période, réunies en un seul frame ; seules
+    # les colonnes_lues sont copiées
+    morceaux = [
+        etat["modele"] if colonnes_lues is None else etat["modele"][colonnes_lues]
+    ]
+    for mois in mois_de_la_periode(etat["partitions"], periode):
+        data, positions = positions_de_la_partition(etat, mois, locations, periode)
+        morceaux.append(lignes_aux_positions(data, positions, colonnes_lues))
+    return concatener_lignes(morceaux)
+
+
+# =========================================
+# Séries temporelles agrégées
+# =========================================
+
+# Chiffre d'affaire et nombre de ventes par (période, Location), pour les
+# jours, les semaines (terminées le dimanche, comme pd.Grouper(freq="W")) et
+# les mois.
+# Les séries sont construites une fois puis complétées par les nouvelles
+# ventes ; une requête ne somme que les zones sélectionnées. Sur une période,
+# les semaines et les mois sont recomposés à partir des jours de la période.
+
+
+def fin_de_semaine(dates):
+    return dates.dt.normalize() + pd.to_timedelta(6 - dates.dt.dayofweek, unit="D")
+
+
+def debut_de_mois(dates):
+    return dates.dt.to_period("M").dt.to_timestamp()
+
+
+def agreger_par_periode(data, periodes):
+    agregat = data.groupby(
+        [periodes.rename("Periode"), data["Location"].astype(str)], observed=True
+    )["Total_price"].agg(["sum", "size"])
+    agregat.columns = ["Chiffre d'affaire", "Nombre"]
+    return agregat
+
+
+def construire_series_temporelles(data):
+    return {
+        "jour": agreger_par_periode(data, data["Transaction_Date"].dt.normalize()),
+        "semaine": agreger_par_periode(data, fin_de_semaine(data["Transaction_Date"])),
+        "mois": agreger_par_periode(data, debut_de_mois(data["Transaction_Date"])),
+    }
+
+
+def fusionner_series(series, ajout):
+    return {
+        granularite: pd.concat([agregat, ajout[granularite]])
+        .groupby(level=["Periode", "Location"])
+        .sum()
+        for granularite, agregat in series.items()
+    }
+
+
+def ajouter_aux_series(series, nouvelles_lignes):
+    return fusionner_series(series, construire_series_temporelles(nouvelles_lignes))
+
+
+frequences_periodes = {"jour": "D", "semaine": "W-SUN"}
+periodes_des_jours = {"semaine": fin_de_semaine, "mois": debut_de_mois}
+
+
+def interroger_series(series, granularite, locations, periode=(None, None)):
+    debut, fin = periode
+    agregat = series[granularite]
+    if debut or fin:
+        agregat = series["jour"]
+        jours = agregat.index.get_level_values("Periode")
+        masque = np.ones(len(agregat), dtype=bool)
+        if debut:
+            masque &= jours >= pd.Timestamp(debut)
+        if fin:
+            masque &= jours <= pd.Timestamp(fin)
+        agregat = agregat[masque]
+    if locations:
+        agregat = agregat[agregat.index.get_level_values("Location").isin(locations)]
+    resultat = agregat.groupby(level="Periode").sum()
+
+    if (debut or fin) and granularite in periodes_des_jours:
+        periodes = periodes_des_jours[granularite](resultat.index.to_series())
+        resultat = resultat.groupby(periodes.rename("Periode")).sum()
+    return completer_periodes(resultat, granularite)
+
+
+def completer_periodes(resultat, granularite):
+    # Jours et semaines sans vente à zéro, comme le regroupement de pandas
+    if granularite in frequences_periodes and len(resultat):
+        resultat = resultat.reindex(
+            pd.date_range(
+                resultat.index.min(),
+                resultat.index.max(),
+                freq=frequences_periodes[granularite],
+            ),
+            fill_value=0,
+        )
+    return resultat
+
+
+# =========================================
+# Granularité et sous-échantillonnage des courbes
+# =========================================
 
-df["Date"] = df["Transaction_Date"].dt.date
+# La granularité de la courbe d'évolution (jour, semaine ou mois) suit la
+# période visible (choisir_granularite), et ses points sont réduits par LTTB
+# au-delà de EVOLUTION_POINTS_MAX (dashboard_common).
+
+
+def serie_evolution(etat, locations, plage=None, periode=(None, None)):
+    # Chiffre d'affaire à la granularité adaptée à la période visible
+    journalier = series_de_la_selection(etat, "jour", locations, periode)[
+        "Chiffre d'affaire"
+    ]
+    debut, fin = plage or (journalier.index.min(), journalier.index.max())
+    granularite = choisir_granularite(debut, fin)
+
+    if granularite == "mois":
+        mois = journalier.index.to_period("M").to_timestamp()
+        chiffre = journalier.groupby(mois).sum()
+    else:
+        chiffre = series_de_la_selection(etat, granularite, locations, periode)[
+            "Chiffre d'affaire"
+        ]
+
+    # La dernière période, incomplète, n'est pas affichée
+    chiffre = chiffre[:-1]
+
+    # Après un zoom, la période visible et autant de chaque côté
+    if plage is not None:
+        marge = fin - debut
+        chiffre = chiffre[
+            (chiffre.index >= debut - marge) & (chiffre.index <= fin + marge)
+        ]
+
+    return chiffre, granularite
+
+
+# =========================================
+# État des données
+# =========================================
+
+# Les partitions et tout ce qui en dérive forment un état unique, remplacé
+# d'un bloc lorsque de nouvelles ventes arrivent : un callback lit l'état une
+# seule fois et travaille toujours sur des données cohérentes.
+#
+# Chaque partition est gardée physiquement triée par Transaction_Date : une
+# période s'y lit comme une tranche, et les ventes les plus récentes d'une
+# sélection à la fin de la dernière partition, sans tri.
+
+
+def resumer_partition(source, avec_series):
+    # Schéma (frame vide) et séries temporelles d'une partition. Le fichier
+    # est lu sans passer par le cache des partitions, dont le verrou ne doit
+    # pas être pris dans un processus fils
+    lignes = source if isinstance(source, pd.DataFrame) else lire_colonnaire(source)
+    return (
+        lignes.iloc[:0],
+        construire_series_temporelles(lignes) if avec_series else None,
+    )
+
+
+def construire_etat(partitions, version):
+    # "modele" est un frame vide portant le schéma et les catégories communes.
+    # Avec le moteur pandas, les séries temporelles sont construites partition
+    # par partition, sans réunir toutes les lignes, puis fusionnées dans
+    # l'ordre des partitions ; DuckDB les agrège à chaque requête
+    avec_series = moteurs[moteur_requetes]["series_en_memoire"]
+    resultats = executer_en_parallele(
+        resumer_partition, [(source, avec_series) for source in partitions.values()]
+    )
+    modeles, series = [], None
+    for modele, ajout in resultats:
+        modeles.append(modele)
+        if ajout is not None:
+            series = ajout if series is None else fusionner_series(series, ajout)
+    return {
+        "partitions": partitions,
+        "modele": concatener_lignes(modeles),
+        "series": series,
+        "version": version,
+    }
+
+
+def etendre_etat(etat, nouvelles_lignes, version):
+    # Les mois touchés par les nouvelles ventes deviennent des partitions en
+    # mémoire, complétées puis retriées ; les autres mois restent sur disque
+    modele = concatener_lignes([etat["modele"], nouvelles_lignes]).iloc[:0]
+    partitions = dict(etat["partitions"])
+    for mois, lignes in decouper_par_mois(
+        nouvelles_lignes, source_donnees["colonne_date"]
+    ):
+        anciennes = [lire_partition(partitions[mois])] if mois in partitions else []
+        partitions[mois] = trier_par_date(
+            concatener_lignes([modele, *anciennes, lignes])
+        )
+    return {
+        "partitions": ordonner_partitions(partitions),
+        "modele": modele,
+        "series": (
+            None
+            if etat["series"] is None
+            else ajouter_aux_series(etat["series"], nouvelles_lignes)
+        ),
+        "version": version,
+    }
+
+
+# =========================================
+# Ingestion continue des nouvelles ventes
+# =========================================
+
+# Deux sources, activées par variables d'environnement :
+# - INGESTION_CONTINUE=1 : les lignes ajoutées à la fin du CSV sont lues à
+#   partir du dernier octet traité, sans relire le début du fichier ;
+# - INGESTION_DOSSIER : chaque fichier .csv (avec en-tête) déposé dans ce
+#   dossier est intégré une fois. Il doit y être déplacé une fois complet ;
+#   un fichier illisible est journalisé et ignoré.
+# Les nouvelles lignes passent par nettoyer_donnees puis sont fusionnées
+# dans un nouvel état, qui remplace l'ancien.
+
+ingestion_continue = os.environ.get("INGESTION_CONTINUE") == "1"
+dossier_ingestion = os.environ.get("INGESTION_DOSSIER")
+intervalle_ingestion = float(os.environ.get("INGESTION_INTERVALLE", 5))
+
+# Version et position du CSV chargé au démarrage, fixées par charger_application
+suivi_ingestion = {"version": None, "position": 0, "fichiers": set()}
+verrou_ingestion = threading.Lock()
+
+
+def entete_csv(chemin):
+    with open(chemin, newline="") as fichier:
+        return next(csv.reader(fichier))
+
+
+def lire_ajouts_csv(chemin, position):
+    with open(chemin, "rb") as fichier:
+        fichier.seek(position)
+        contenu = fichier.read()
+
+    # Seules les lignes complètes sont lues, la suite attend le prochain passage
+    fin = contenu.rfind(b"\n") + 1
+    if fin == 0:
+        return None, position
+
+    lignes = pd.read_csv(
+        io.BytesIO(contenu[:fin]), header=None, names=entete_csv(chemin), index_col=0
+    )
+    return lignes, position + fin
+
+
+def integrer_nouvelles_ventes():
+    global etat
+    lots = []
+
+    if ingestion_continue:
+        taille = os.path.getsize(chemin_donnees)
+        if taille < suivi_ingestion["position"]:
+            # Fichier remplacé ou tronqué : rechargement complet
+            journal.warning("%s a été tronqué, rechargement complet", chemin_donnees)
+            suivi_ingestion.update(
+                version=empreinte_donnees(chemin_donnees, dossier_partitions),
+                position=taille,
+                fichiers=set(),
+            )
+            with verrou_partitions:
+                cache_partitions.clear()
+            etat = construire_etat(
+                charger_donnees(source_donnees, chemin_donnees, dossier_partitions),
+                suivi_ingestion["version"],
+            )
+        elif taille > suivi_ingestion["position"]:
+            lignes, suivi_ingestion["position"] = lire_ajouts_csv(
+                chemin_donnees, suivi_ingestion["position"]
+            )
+            if lignes is not None:
+                lots.append(nettoyer_donnees(lignes))
+
+    if dossier_ingestion:
+        for nom in sorted(os.listdir(dossier_ingestion)):
+            if nom.endswith(".csv") and nom not in suivi_ingestion["fichiers"]:
+                # Un fichier illisible est ignoré une fois pour toutes
+                suivi_ingestion["fichiers"].add(nom)
+                chemin = os.path.join(dossier_ingestion, nom)
+                try:
+                    lots.append(nettoyer_donnees(pd.read_csv(chemin, index_col=0)))
+                except Exception:
+                    journal.exception("%s ignoré : ventes illisibles", chemin)
+
+    if lots:
+        nouvelles_lignes = concatener_lignes(lots)
+        version = "{}+{}+{}".format(
+            suivi_ingestion["version"],
+            suivi_ingestion["position"],
+            len(suivi_ingestion["fichiers"]),
+        )
+        etat = etendre_etat(etat, nouvelles_lignes, version)
+        journal.info("%d nouvelles ventes intégrées", len(nouvelles_lignes))
+
+
+def surveiller_ventes():
+    while True:
+        time.sleep(intervalle_ingestion)
+        try:
+            integrer_nouvelles_ventes()
+        except Exception:
+            journal.exception("Échec de l'ingestion des nouvelles ventes")
+
+
+@server.before_request
+def lancer_ingestion():
+    # Démarrée à la première requête de chaque worker (compatible --preload),
+    # une fois les données chargées
+    if not (ingestion_continue or dossier_ingestion) or verrou_ingestion.locked():
+        return
+    if not donnees_pretes.is_set():
+        return
+    if verrou_ingestion.acquire(blocking=False):
+        threading.Thread(
+            target=surveiller_ventes, name="ingestion-ventes", daemon=True
+        ).start()
+
+
+# =========================================
+# Moteur de requêtes
+# =========================================
+
+# Les agrégats des panneaux (séries temporelles, totaux par couple pour le
+# classement des meilleures ventes) sont demandés à un moteur, choisi par
+# MOTEUR_REQUETES :
+# - pandas (par défaut) : séries pré-agrégées gardées en mémoire, totaux
+#   calculés sur les lignes de la sélection ;
+# - duckdb : chaque requête est une requête SQL sur les partitions de la
+#   période, exécutée par DuckDB dans le processus, en parallèle sur
+#   MOTEUR_THREADS threads (tous les cœurs par défaut). Rien d'autre que les
+#   partitions ouvertes n'est gardé en mémoire.
+# Les deux moteurs renvoient les mêmes frames (aux arrondis des sommes près).
+# La table des ventes lit toujours ses lignes directement dans les partitions.
+# La connexion DuckDB du processus est ouverte par curseur_duckdb
+# (dashboard_common).
+
+
+def lignes_sql(curseur, etat, periode, colonnes_lues):
+    # Partitions de la période, déclarées à DuckDB sans copie et réunies ;
+    # le modèle vide fixe le schéma quand aucune partition n'est lue. Seules
+    # les colonnes lues sont déclarées : DuckDB analyse chaque colonne du
+    # frame à la déclaration
+    sources = [etat["modele"]] + [
+        lire_partition(etat["partitions"][mois])
+        for mois in mois_de_la_periode(etat["partitions"], periode)
+    ]
+    requetes = []
+    for i, source in enumerate(sources):
+        curseur.register(
+            f"partition_{i}",
+            pd.DataFrame({c: source[c] for c in colonnes_lues}, copy=False),
+        )
+        requetes.append(f"SELECT * FROM partition_{i}")
+    return " UNION ALL ".join(requetes)
+
+
+def conditions_sql(locations, periode):
+    # Clause WHERE et paramètres de la sélection
+    conditions, parametres = ["TRUE"], []
+    if locations:
+        conditions.append("list_contains(?, Location)")
+        parametres.append(list(locations))
+    debut, fin = periode
+    if debut:
+        conditions.append("Transaction_Date >= CAST(? AS DATE)")
+        parametres.append(debut)
+    if fin:
+        conditions.append("Transaction_Date < CAST(? AS DATE) + INTERVAL 1 DAY")
+        parametres.append(fin)
+    return " AND ".join(conditions), parametres
+
+
+# Période de chaque jour, comme periodes_des_jours et fin_de_semaine : les
+# ventes sont d'abord sommées par jour, puis les jours par période
+periodes_sql = {
+    "jour": "Jour",
+    "semaine": "date_trunc('week', Jour) + INTERVAL 6 DAY",
+    "mois": "date_trunc('month', Jour)",
+}
+
+
+def series_duckdb(etat, granularite, locations, periode):
+    conditions, parametres = conditions_sql(locations, periode)
+    with closing(curseur_duckdb()) as curseur:
+        lignes = lignes_sql(
+            curseur, etat, periode, ["Transaction_Date", "Location", "Total_price"]
+        )
+        resultat = curseur.execute(
+            f"""
+            SELECT CAST({periodes_sql[granularite]} AS TIMESTAMP) AS Periode,
+                   sum(Chiffre) AS "Chiffre d'affaire",
+                   CAST(sum(Nombre) AS BIGINT) AS Nombre
+            FROM (
+                SELECT CAST(Transaction_Date AS DATE) AS Jour,
+                       sum(Total_price) AS Chiffre,
+                       count(*) AS Nombre
+                FROM ({lignes})
+                WHERE Transaction_Date IS NOT NULL AND {conditions}
+                GROUP BY Jour
+            )
+            GROUP BY Periode
+            ORDER BY Periode
+            """,
+            parametres,
+        ).df()
+    return completer_periodes(resultat.set_index("Periode"), granularite)
+
+
+def couples_duckdb(etat, groupe, cle, locations, periode, metrique="count"):
+    colonne = metriques[metrique]
+    conditions, parametres = conditions_sql(locations, periode)
+    colonnes_lues = list(
+        dict.fromkeys(
+            [groupe, cle, "Transaction_Date", "Location"]
+            + ([] if colonne is None else [colonne])
+        )
+    )
+    with closing(curseur_duckdb()) as curseur:
+        lignes = lignes_sql(curseur, etat, periode, colonnes_lues)
+        resultat = curseur.execute(
+            f"""
+            SELECT {groupe}, {cle},
+                   {"count(*)" if colonne is None else f"sum({colonne})"} AS total
+            FROM ({lignes})
+            WHERE {groupe} IS NOT NULL AND {cle} IS NOT NULL AND {conditions}
+            GROUP BY {groupe}, {cle}
+            """,
+            parametres,
+        ).df()
+
+    # Mêmes catégories que les lignes lues par pandas
+    couples = {}
+    for colonne_couple in [groupe, cle]:
+        type_modele = etat["modele"][colonne_couple].dtype
+        couples[colonne_couple] = pd.Categorical(
+            resultat[colonne_couple].astype(object),
+            categories=(
+                type_modele.categories
+                if isinstance(type_modele, pd.CategoricalDtype)
+                else None
+            ),
+        )
+    couples[metrique] = resultat["total"].to_numpy(
+        dtype=np.int64 if colonne is None else np.float64
+    )
+    return pd.DataFrame(couples)
+
+
+def series_pandas(etat, granularite, locations, periode):
+    return interroger_series(etat["series"], granularite, locations, periode)
+
+
+def couples_pandas(etat, groupe, cle, locations, periode, metrique="count"):
+    colonne = metriques[metrique]
+    colonnes_lues = list(
+        dict.fromkeys([groupe, cle] + ([] if colonne is None else [colonne]))
+    )
+    return totaux_par_couple(
+        ventes_de_la_selection(etat, locations, periode, colonnes_lues),
+        groupe,
+        cle,
+        metrique,
+    )
+
+
+# (agrégats d'une sélection, séries pré-agrégées gardées dans l'état)
+moteurs = {
+    "pandas": {
+        "series": series_pandas,
+        "couples": couples_pandas,
+        "series_en_memoire": True,
+    },
+    "duckdb": {
+        "series": series_duckdb,
+        "couples": couples_duckdb,
+        "series_en_memoire": False,
+    },
+}
+
+
+def series_de_la_selection(etat, granularite, locations, periode=(None, None)):
+    # Chiffre d'affaire et nombre de ventes par période ("Periode" en index)
+    return moteurs[moteur_requetes]["series"](etat, granularite, locations, periode)
+
+
+def couples_de_la_selection(etat, groupe, cle, locations, periode, metrique="count"):
+    # Total de chaque couple (groupe, clé) observé dans la sélection
+    return moteurs[moteur_requetes]["couples"](
+        etat, groupe, cle, locations, periode, metrique
+    )
 
 
 # =========================================
@@ -82,54 +784,120 @@ def calculer_chiffre_affaire(data):
     return data["Total_price"].sum()
 
 
-def frequence_meilleure_vente(data, top=10, ascending=False):
-    resultat = (
-        pd.crosstab(
-            [data["Gender"], data["Product_Category"]],
-            "Total vente",
-            values=data["Total_price"],
-            aggfunc=lambda x: len(x),
-            rownames=["Sexe", "Categorie du produit"],
-            colnames=[""],
-        )
-        .reset_index()
-        .groupby(["Sexe"], as_index=False, group_keys=True)
-        .apply(
-            lambda x: x.sort_values("Total vente", ascending=ascending).iloc[:top, :]
-        )
-        .reset_index(drop=True)
-        .set_index(["Sexe", "Categorie du produit"])
+# Top N par groupe : les effectifs (ou sommes) de chaque couple
+# (groupe, clé) sont obtenus en un seul np.bincount sur les codes des
+# catégories (ou par le moteur de requêtes), puis classés par un tri vectorisé
+# à l'intérieur de chaque groupe.
+
+metriques = {"count": None, "revenue": "Total_price", "quantity": "Quantity"}
+
+
+def codes_categoriels(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    codes, modalites = pd.factorize(serie, sort=True)
+    return codes, modalites
+
+
+def totaux_par_couple(data, groupe, cle, metrique="count"):
+    # Couples observés, en catégories, et leur total
+    codes_groupe, modalites_groupe = codes_categoriels(data[groupe])
+    codes_cle, modalites_cle = codes_categoriels(data[cle])
+
+    # Les valeurs manquantes (code -1) sont ignorées, comme dans pd.crosstab
+    valides = (codes_groupe >= 0) & (codes_cle >= 0)
+    cellules = (
+        codes_groupe[valides].astype(np.int64) * len(modalites_cle) + codes_cle[valides]
+    )
+    taille = len(modalites_groupe) * len(modalites_cle)
+
+    colonne = metriques[metrique]
+    poids = None if colonne is None else data[colonne].to_numpy()[valides]
+    # Sommes en float64, même sans ligne (np.bincount renverrait des entiers)
+    totaux = np.bincount(cellules, weights=poids, minlength=taille)
+    if poids is not None:
+        totaux = totaux.astype(np.float64, copy=False)
+    observes = np.flatnonzero(np.bincount(cellules, minlength=taille))
+    lignes, colonnes_cle = np.divmod(observes, len(modalites_cle))
+
+    return pd.DataFrame(
+        {
+            groupe: pd.Categorical.from_codes(lignes, modalites_groupe),
+            cle: pd.Categorical.from_codes(colonnes_cle, modalites_cle),
+            metrique: totaux[observes],
+        }
+    )
+
+
+def classer_par_groupe(couples, groupe, cle, metrique="count", top=10, ascending=False):
+    codes_groupe, modalites_groupe = codes_categoriels(couples[groupe])
+    codes_cle, modalites_cle = codes_categoriels(couples[cle])
+    totaux = couples[metrique].to_numpy()
+
+    # Classement dans chaque groupe, à total égal dans l'ordre des clés
+    # (np.lexsort trie selon la dernière clé en premier)
+    ordre = np.lexsort((codes_cle, totaux if ascending else -totaux, codes_groupe))
+    groupes_tries = codes_groupe[ordre]
+    debuts = np.flatnonzero(np.r_[True, groupes_tries[1:] != groupes_tries[:-1]])
+    rangs = np.arange(len(ordre)) - np.repeat(
+        debuts, np.diff(np.r_[debuts, len(ordre)])
     )
+    ordre = ordre[rangs < top]
+
+    return pd.Series(
+        totaux[ordre],
+        index=pd.MultiIndex.from_arrays(
+            [modalites_groupe[codes_groupe[ordre]], modalites_cle[codes_cle[ordre]]],
+            names=[groupe, cle],
+        ),
+        name=metrique,
+    )
+
+
+def frequence_meilleure_vente(couples, top=10, ascending=False):
+    resultat = classer_par_groupe(
+        couples, "Gender", "Product_Category", top=top, ascending=ascending
+    ).to_frame("Total vente")
+    resultat.index.names = ["Sexe", "Categorie du produit"]
 
     return resultat
 
 
-def indicateur_du_mois(data, current_month=12, freq=True, abbr=False):
-    previous_month = current_month - 1 if current_month > 1 else 12
-    if freq:
-        resultat = data["Month"][
-            (data["Month"] == current_month) | (data["Month"] == previous_month)
-        ].value_counts()
-        # sort by index
-        resultat = resultat.sort_index()
-        resultat.index = [
-            (month_abbr[i] if abbr else month_name[i]) for i in resultat.index
-        ]
-        return resultat
-    else:
-        resultat = (
-            data[(data["Month"] == current_month) | (data["Month"] == previous_month)]
-            .groupby("Month")
-            .apply(calculer_chiffre_affaire)
+def mois_de_reference(etat, periode):
+    # Mois de la fin de la période, sinon dernier mois des données, sinon
+    # (aucune vente datée) mois courant : les indicateurs sont alors à zéro
+    fin = periode[1]
+    if not fin:
+        fin = max(
+            (mois for mois in etat["partitions"] if mois != "NaT"),
+            default=pd.Timestamp.today().strftime("%Y-%m"),
         )
-        resultat.index = [
-            (month_abbr[i] if abbr else month_name[i]) for i in resultat.index
-        ]
-        return resultat
+    return pd.Timestamp(fin[:7])
+
+
+def indicateur_du_mois(mensuel, current_month, freq=True, abbr=False):
+    # Mois current_month (premier jour du mois) comparé au mois précédent,
+    # à zéro pour un mois sans vente
+    previous_month = current_month - pd.DateOffset(months=1)
+    mesure = "Nombre" if freq else "Chiffre d'affaire"
+    resultat = mensuel[mesure].reindex([previous_month, current_month], fill_value=0)
+    resultat.index = [
+        (month_abbr[m.month] if abbr else month_name[m.month])
+        for m in [previous_month, current_month]
+    ]
+    return resultat
 
 
-def barplot_top_10_ventes(data):
-    df_plot = frequence_meilleure_vente(data, ascending=True)
+# La mise en page de chaque figure est construite une seule fois au
+# démarrage, sur toutes les données ; plotly express n'est importé qu'à ce
+# moment. Par requête, seules les traces sont recalculées, en simples
+# dictionnaires, et envoyées comme mise à jour partielle de la figure affichée
+# (figure_partielle).
+
+
+def gabarit_barplot(df_plot):
+    import plotly.express as px
+
     graph = px.bar(
         df_plot,
         x="Total vente",
@@ -139,14 +907,47 @@ def barplot_top_10_ventes(data):
         title="Frequence des 10 meilleures ventes",
         labels={"x": "Fréquence", "y": "Categorie du produit", "color": "Sexe"},
     ).update_layout(margin=dict(t=60))
-    return graph
+    return mise_en_page(graph)
+
+
+def barplot_top_10_ventes(df_plot):
+    sexes = df_plot.index.get_level_values(0)
+    categories = df_plot.index.get_level_values(1)
+
+    # Une série de barres par sexe, dans l'ordre d'apparition
+    traces = []
+    for i, sexe in enumerate(sexes.unique()):
+        lignes = sexes == sexe
+        traces.append(
+            {
+                "alignmentgroup": "True",
+                "hovertemplate": f"Sexe={sexe}<br>Total vente=%{{x}}"
+                "<br>Categorie du produit=%{y}<extra></extra>",
+                "legendgroup": sexe,
+                "marker": {
+                    "color": couleurs_defaut[i % len(couleurs_defaut)],
+                    "pattern": {"shape": ""},
+                },
+                "name": sexe,
+                "offsetgroup": sexe,
+                "orientation": "h",
+                "showlegend": True,
+                "textposition": "auto",
+                "type": "bar",
+                "x": df_plot["Total vente"].to_numpy()[lignes],
+                "xaxis": "x",
+                "y": categories[lignes],
+                "yaxis": "y",
+            }
+        )
+    return traces
 
 
 # Evolution chiffre d'affaire
-def plot_evolution_chiffre_affaire(data):
-    df_plot = data.groupby(pd.Grouper(key="Transaction_Date", freq="W")).apply(
-        calculer_chiffre_affaire
-    )[:-1]
+def gabarit_evolution_chiffre_affaire(hebdo):
+    import plotly.express as px
+
+    df_plot = hebdo["Chiffre d'affaire"][:-1]
     chiffre_evolution = px.line(
         x=df_plot.index,
         y=df_plot,
@@ -154,50 +955,87 @@ def plot_evolution_chiffre_affaire(data):
         labels={"x": "Semaine", "y": "Chiffre d'affaire"},
     ).update_layout(
         margin=dict(t=40, b=0),
+        # Le zoom de l'utilisateur est conservé quand les traces changent
+        uirevision="evolution",
     )
-    return chiffre_evolution
+    return mise_en_page(chiffre_evolution)
+
+
+def plot_evolution_chiffre_affaire(chiffre, libelle="Semaine"):
+    retenus = lttb(chiffre.index, chiffre.to_numpy(), points_max_courbe)
+    return [
+        {
+            "hovertemplate": f"{libelle}=%{{x}}<br>Chiffre d'affaire=%{{y}}"
+            "<extra></extra>",
+            "legendgroup": "",
+            "line": {"color": couleurs_defaut[0], "dash": "solid"},
+            "marker": {"symbol": "circle"},
+            "mode": "lines",
+            "name": "",
+            "orientation": "v",
+            "showlegend": False,
+            "type": "scatter",
+            "x": chiffre.index[retenus],
+            "xaxis": "x",
+            "y": chiffre.to_numpy()[retenus],
+            "yaxis": "y",
+        }
+    ]
+
+
+## Indicateurs du mois
+def gabarit_indicateur():
+    indicateur = go.Figure().update_layout(margin=dict(l=0, r=0, t=30, b=0))
+    return mise_en_page(indicateur)
+
+
+def trace_indicateur(df_plot):
+    return {
+        "delta": {"reference": df_plot[0]},
+        "domain": {"column": 1, "row": 0},
+        "mode": "number+delta",
+        "title": {"text": f"{df_plot.index[1]}"},
+        "type": "indicator",
+        "value": df_plot[1],
+    }
 
 
 ## Chiffre d'affaire du mois
-def plot_chiffre_affaire_mois(data):
-    df_plot = indicateur_du_mois(data, freq=False)
-    indicateur = go.Figure(
-        go.Indicator(
-            mode="number+delta",
-            value=df_plot[1],
-            delta={"reference": df_plot[0]},
-            domain={"row": 0, "column": 1},
-            title=f"{df_plot.index[1]}",
-        )
-    ).update_layout(margin=dict(l=0, r=0, t=30, b=0))
-    return indicateur
+def plot_chiffre_affaire_mois(mensuel, mois):
+    return [trace_indicateur(indicateur_du_mois(mensuel, mois, freq=False))]
 
 
 # Ventes du mois
-def plot_vente_mois(data, abbr=False):
-    df_plot = indicateur_du_mois(data, freq=True, abbr=abbr)
-    indicateur = go.Figure(
-        go.Indicator(
-            mode="number+delta",
-            value=df_plot[1],
-            delta={"reference": df_plot[0]},
-            domain={"row": 0, "column": 1},
-            title=f"{df_plot.index[1]}",
-        )
-    ).update_layout(margin=dict(l=0, r=0, t=30, b=0))
-    return indicateur
+def plot_vente_mois(mensuel, mois, abbr=False):
+    return [trace_indicateur(indicateur_du_mois(mensuel, mois, freq=True, abbr=abbr))]
 
 
 # Table des ventes
+types_colonnes = {
+    "Date": "datetime",
+    "Quantity": "numeric",
+    "Avg_Price": "numeric",
+    "Discount_pct": "numeric",
+}
+
 table_des_ventes = dash_table.DataTable(
     id="table-ventes",
     editable=False,
-    filter_action="native",
-    sort_action="native",
-    page_action="native",
+    filter_action="custom",
+    sort_action="custom",
+    sort_mode="multi",
+    sort_by=[],
+    page_action="custom",
     page_current=0,
     page_size=10,
-    columns=[{"id": c, "name": c.replace("_", " ").title()} for c in colonnes],
+    columns=[
+        {
+            "id": c,
+            "name": c.replace("_", " ").title(),
+            "type": types_colonnes.get(c, "text"),
+        }
+        for c in colonnes
+    ],
     style_cell={
         "font-size": "1.2vw",
         "font-family": "Arial",
@@ -206,206 +1044,774 @@ table_des_ventes = dash_table.DataTable(
 )
 
 
+# =========================================
+# Panneaux du tableau de bord
+# =========================================
+
+# Chaque graphique a son propre callback, généré à partir de ce registre : le
+# navigateur envoie une requête par graphique, traitées en parallèle par les
+# threads du serveur, et chaque graphique s'affiche dès qu'il est prêt.
+
+
+# Les indicateurs comparent le mois de la fin de la période (le dernier mois
+# des données sans période) au mois précédent, chacun en entier.
+
+
+def panneau_chiffre_affaires(etat, locations, periode):
+    with etape("agregation"):
+        mensuel = series_de_la_selection(etat, "mois", locations)
+    with etape("figure"):
+        return figure_partielle(
+            plot_chiffre_affaire_mois(mensuel, mois_de_reference(etat, periode))
+        )
+
+
+def panneau_vente_mois(etat, locations, periode):
+    with etape("agregation"):
+        mensuel = series_de_la_selection(etat, "mois", locations)
+    with etape("figure"):
+        return figure_partielle(
+            plot_vente_mois(mensuel, mois_de_reference(etat, periode))
+        )
+
+
+def panneau_barplot_vente(etat, locations, periode):
+    with etape("agregation"):
+        df_plot = frequence_meilleure_vente(
+            couples_de_la_selection(
+                etat, "Gender", "Product_Category", locations, periode
+            ),
+            ascending=True,
+        )
+    with etape("figure"):
+        return figure_partielle(barplot_top_10_ventes(df_plot))
+
+
+def panneau_evolution_ca(etat, locations, periode, plage):
+    with etape("agregation"):
+        chiffre, granularite = serie_evolution(etat, locations, plage, periode)
+    libelle = libelles_granularite[granularite]
+    with etape("figure"):
+        patch = figure_partielle(plot_evolution_chiffre_affaire(chiffre, libelle))
+    patch["layout"]["title"][
+        "text"
+    ] = f"Evolution du chiffre d'affaire par {granularite}"
+    patch["layout"]["xaxis"]["title"]["text"] = libelle
+    return patch
+
+
+# (identifiant du graphique, calcul, entrées propres au graphique avec leur
+# normalisation, passées normalisées au calcul après les zones et la période).
+# Seule la plage visible du zoom compte : les autres changements de
+# relayoutData (autosize, axe des y...) gardent la même clé.
+panneaux = [
+    ("chiffre-affaires", panneau_chiffre_affaires, []),
+    ("vente-mois", panneau_vente_mois, []),
+    ("barplot-vente", panneau_barplot_vente, []),
+    (
+        "evolution-ca",
+        panneau_evolution_ca,
+        [(Input("evolution-ca", "relayoutData"), plage_visible)],
+    ),
+]
+
+# =========================================
+# Requêtes de la table des ventes
+# =========================================
+
+# Pagination, tri et filtres de la table sont faits côté serveur : seules les
+# lignes de la page affichée sont sérialisées. Les requêtes parcourent les
+# partitions de la période de la plus récente à la plus ancienne, chacune
+# étant déjà triée par date.
+
+operateurs_filtre = [
+    ["ge ", ">="],
+    ["le ", "<="],
+    ["lt ", "<"],
+    ["gt ", ">"],
+    ["ne ", "!="],
+    ["eq ", "="],
+    ["contains "],
+    ["datestartswith "],
+]
+
+comparateurs = {
+    "ge": operator.ge,
+    "le": operator.le,
+    "lt": operator.lt,
+    "gt": operator.gt,
+    "ne": operator.ne,
+    "eq": operator.eq,
+}
+
+
+def decouper_filtre(partie):
+    for operateurs in operateurs_filtre:
+        for symbole in operateurs:
+            if symbole in partie:
+                nom, texte = partie.split(symbole, 1)
+                nom = nom[nom.find("{") + 1 : nom.rfind("}")]
+                texte = texte.strip()
+                if texte and texte[0] == texte[-1] and texte[0] in ("'", '"', "`"):
+                    texte = texte[1:-1].replace("\\" + texte[0], texte[0])
+                return nom, operateurs[0].strip(), texte
+    return None, None, None
+
+
+def masque_filtre(data, positions, colonne, operation, texte):
+    if colonne == "Date":
+        dates = data["Transaction_Date"].to_numpy()[positions].astype("datetime64[D]")
+        try:
+            valeur = np.datetime64(texte)
+        except ValueError:
+            return np.zeros(len(positions), dtype=bool)
+        if operation in ("datestartswith", "contains"):
+            # "2019", "2019-12" ou "2019-12-30" : tout l'intervalle correspondant
+            return (dates >= valeur) & (dates < valeur + 1)
+        return comparateurs[operation](dates, valeur.astype("datetime64[D]"))
+
+    serie = data[colonne]
+
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Le filtre est évalué sur les modalités, puis appliqué aux codes
+        modalites = np.asarray(serie.cat.categories, dtype=object)
+        if operation == "contains":
+            retenues = np.array([texte in str(m) for m in modalites], dtype=bool)
+        elif operation in comparateurs:
+            retenues = comparateurs[operation](modalites.astype(str), texte)
+        else:
+            return np.zeros(len(positions), dtype=bool)
+        codes = serie.cat.codes.to_numpy()[positions]
+        return np.isin(codes, np.flatnonzero(retenues))
+
+    valeurs = serie.to_numpy()[positions]
+    if operation == "contains":
+        return np.char.find(valeurs.astype(str), texte) >= 0
+    try:
+        valeur = float(texte)
+    except ValueError:
+        return np.zeros(len(positions), dtype=bool)
+    if colonne == "Avg_Price":
+        valeurs = np.round(valeurs.astype(np.float64), 2)
+    return comparateurs.get(operation, operator.eq)(valeurs, valeur)
+
+
+def cle_tri(data, positions, colonne, croissant):
+    if colonne == "Date":
+        cle = data["Transaction_Date"].to_numpy()[positions].astype("datetime64[D]")
+        cle = cle.view(np.int64)
+    elif isinstance(data[colonne].dtype, pd.CategoricalDtype):
+        modalites = np.asarray(data[colonne].cat.categories, dtype=str)
+        rangs = np.argsort(np.argsort(modalites, kind="stable"))
+        codes = data[colonne].cat.codes.to_numpy()[positions]
+        cle = np.where(codes >= 0, rangs[codes], -1)
+    else:
+        cle = data[colonne].to_numpy()[positions].astype(np.float64)
+    return cle if croissant else -cle
+
+
+def interroger_ventes(etat, locations, periode, filtre, tri, debut, fin):
+    # Renvoie les lignes [debut, fin) de la sélection et son nombre de lignes
+    filtres = [decouper_filtre(partie) for partie in (filtre or "").split(" && ")]
+    filtres = [f for f in filtres if f[0] in colonnes]
+    mois = mois_de_la_periode(etat["partitions"], periode)[::-1]
+
+    # Affichage par défaut : les plus récentes, en ne copiant que la page.
+    # Après la page, le nombre de ventes des zones sur un mois entièrement
+    # dans la période est lu dans la série mensuelle, sans parcourir la
+    # partition
+    if not filtres and not tri:
+        mensuel = None
+        if locations:
+            mensuel = series_de_la_selection(etat, "mois", locations)["Nombre"]
+        morceaux, total = [etat["modele"]], 0
+        for m in mois:
+            if mensuel is not None and total >= fin and mois_complet(m, periode):
+                total += int(mensuel.get(pd.Timestamp(m), 0))
+                continue
+            data, positions = positions_de_la_partition(etat, m, locations, periode)
+            if total < fin and debut < total + len(positions):
+                page = positions[::-1][max(debut - total, 0) : fin - total]
+                morceaux.append(data.take(page))
+            total += len(positions)
+        return concatener_lignes(morceaux), total
+
+    # Les filtres sont appliqués partition par partition, le tri à la fin
+    morceaux = [etat["modele"]]
+    for m in mois:
+        data, positions = positions_de_la_partition(etat, m, locations, periode)
+        positions = positions[::-1]
+        for colonne, operation, texte in filtres:
+            positions = positions[
+                masque_filtre(data, positions, colonne, operation, texte)
+            ]
+        morceaux.append(data.take(positions))
+    data = concatener_lignes(morceaux)
+    positions = np.arange(len(data))
+
+    if tri:
+        # np.lexsort trie selon la dernière clé en premier
+        cles = [
+            cle_tri(data, positions, t["column_id"], t["direction"] == "asc")
+            for t in reversed(tri)
+        ]
+        positions = positions[np.lexsort(cles)]
+
+    return data.iloc[positions[debut:fin]], len(positions)
+
+
+def page_de_ventes(page):
+    return (
+        # La date affichée est dérivée de Transaction_Date, page par page,
+        # plutôt que conservée en objets date pour chaque ligne
+        page.assign(Date=page["Transaction_Date"].dt.date)[colonnes]
+        # Avg_Price peut être stocké en float32 : retour au centime pour l'affichage
+        .astype({"Avg_Price": np.float64})
+        .round({"Avg_Price": 2})
+        .to_dict("records")
+    )
+
+
 # =========================================
 # Structure de l'application
 # =========================================
 
-app.layout = dbc.Container(
-    [
-        # ligne 1
-        dbc.Row(
-            [
-                # ligne 1 colonne 1
-                dbc.Col(
-                    html.H3("ECAP Store"),
-                    md=6,
-                    style={
-                        "height": "7vh",
-                        "display": "flex",
-                        "alignItems": "center",
-                    },
-                ),
-                # ligne 1 colonne 2
-                dbc.Col(
-                    [
-                        dcc.Dropdown(
-                            id="filtre-location",
-                            options=[{"label": "Toutes les zones", "value": "all"}]
-                            + [
-                                {"label": loc, "value": loc}
-                                for loc in sorted(df["Location"].dropna().unique())
-                            ],
-                            multi=True,
-                            value=None,
-                            placeholder="Choisissez des zones",
-                            style={
-                                "width": "80%",
-                                "font-size": "16px",
-                            },
-                        )
-                    ],
-                    md=6,
-                    style={
-                        "height": "7vh",
-                        "display": "flex",
-                        "alignItems": "center",
-                        "justifyContent": "center",
-                    },
-                ),
-            ],
-            style={"backgroundColor": "#bad7e4"},
-        ),
-        # ligne 2
-        dbc.Row(
-            [
-                # ligne 2 colonne 1
-                dbc.Col(
-                    [
-                        # ligne 2 colonne 1 ligne 1
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    dcc.Graph(
-                                        id="chiffre-affaires",
+
+def interface(options_location, dates, gabarits):
+    return dbc.Container(
+        [
+            # ligne 1
+            dbc.Row(
+                [
+                    # ligne 1 colonne 1
+                    dbc.Col(
+                        html.H3("ECAP Store"),
+                        md=4,
+                        style={
+                            "height": "7vh",
+                            "display": "flex",
+                            "alignItems": "center",
+                        },
+                    ),
+                    # ligne 1 colonne 2
+                    dbc.Col(
+                        [
+                            dcc.Dropdown(
+                                id="filtre-location",
+                                options=options_location,
+                                multi=True,
+                                value=None,
+                                placeholder="Choisissez des zones",
+                                style={
+                                    "width": "80%",
+                                    "font-size": "16px",
+                                },
+                            )
+                        ],
+                        md=4,
+                        style={
+                            "height": "7vh",
+                            "display": "flex",
+                            "alignItems": "center",
+                            "justifyContent": "center",
+                        },
+                    ),
+                    # ligne 1 colonne 3
+                    dbc.Col(
+                        [
+                            # Pas de date maximale : l'ingestion ajoute des
+                            # ventes après le démarrage
+                            dcc.DatePickerRange(
+                                id="filtre-dates",
+                                min_date_allowed=dates[0],
+                                initial_visible_month=dates[1],
+                                start_date_placeholder_text="Début",
+                                end_date_placeholder_text="Fin",
+                                display_format="DD/MM/YYYY",
+                                first_day_of_week=1,
+                                clearable=True,
+                            )
+                        ],
+                        md=4,
+                        style={
+                            "height": "7vh",
+                            "display": "flex",
+                            "alignItems": "center",
+                            "justifyContent": "center",
+                        },
+                    ),
+                ],
+                style={"backgroundColor": "#bad7e4"},
+            ),
+            # ligne 2
+            dbc.Row(
+                [
+                    # ligne 2 colonne 1
+                    dbc.Col(
+                        [
+                            # ligne 2 colonne 1 ligne 1
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        dcc.Graph(
+                                            id="chiffre-affaires",
+                                            figure={
+                                                "data": [],
+                                                "layout": gabarits["chiffre-affaires"],
+                                            },
+                                            style={
+                                                "width": "80%",
+                                                "height": "80%",
+                                            },
+                                            config={"responsive": True},
+                                        ),
                                         style={
-                                            "width": "80%",
-                                            "height": "80%",
+                                            "width": "50%",
+                                            "height": "23vh",
+                                            "display": "flex",
+                                            "alignItems": "center",
+                                            "justifyContent": "center",
                                         },
-                                        config={"responsive": True},
                                     ),
-                                    style={
-                                        "width": "50%",
-                                        "height": "23vh",
-                                        "display": "flex",
-                                        "alignItems": "center",
-                                        "justifyContent": "center",
-                                    },
-                                ),
-                                dbc.Col(
-                                    dcc.Graph(
-                                        id="vente-mois",
+                                    dbc.Col(
+                                        dcc.Graph(
+                                            id="vente-mois",
+                                            figure={
+                                                "data": [],
+                                                "layout": gabarits["vente-mois"],
+                                            },
+                                            style={
+                                                "width": "80%",
+                                                "height": "80%",
+                                            },
+                                            config={"responsive": True},
+                                        ),
                                         style={
-                                            "width": "80%",
-                                            "height": "80%",
+                                            "width": "50%",
+                                            "height": "23vh",
+                                            "display": "flex",
+                                            "alignItems": "center",
+                                            "justifyContent": "center",
                                         },
-                                        config={"responsive": True},
                                     ),
-                                    style={
-                                        "width": "50%",
-                                        "height": "23vh",
-                                        "display": "flex",
-                                        "alignItems": "center",
-                                        "justifyContent": "center",
-                                    },
-                                ),
-                            ]
-                        ),
-                        # ligne 2 colonne 1 ligne 2
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    dcc.Graph(
-                                        id="barplot-vente",
+                                ]
+                            ),
+                            # ligne 2 colonne 1 ligne 2
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        dcc.Graph(
+                                            id="barplot-vente",
+                                            figure={
+                                                "data": [],
+                                                "layout": gabarits["barplot-vente"],
+                                            },
+                                            style={
+                                                "width": "110%",
+                                                "height": "100%",
+                                            },
+                                            config={"responsive": True},
+                                        ),
                                         style={
-                                            "width": "110%",
-                                            "height": "100%",
+                                            "height": "70vh",
                                         },
-                                        config={"responsive": True},
-                                    ),
-                                    style={
-                                        "height": "70vh",
-                                    },
-                                )
-                            ]
-                        ),
-                    ],
-                    md=5,
-                ),
-                # ligne 2 colonne 2
-                dbc.Col(
-                    [
-                        # ligne 2 colonne 2 ligne 1
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    dcc.Graph(
-                                        id="evolution-ca",
+                                    )
+                                ]
+                            ),
+                        ],
+                        md=5,
+                    ),
+                    # ligne 2 colonne 2
+                    dbc.Col(
+                        [
+                            # ligne 2 colonne 2 ligne 1
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        dcc.Graph(
+                                            id="evolution-ca",
+                                            figure={
+                                                "data": [],
+                                                "layout": gabarits["evolution-ca"],
+                                            },
+                                            style={
+                                                "width": "120%",
+                                                "height": "90%",
+                                            },
+                                            config={"responsive": True},
+                                        ),
                                         style={
-                                            "width": "120%",
-                                            "height": "90%",
+                                            "height": "47vh",
+                                            "display": "flex",
+                                            "alignItems": "center",
                                         },
-                                        config={"responsive": True},
-                                    ),
-                                    style={
-                                        "height": "47vh",
-                                        "display": "flex",
-                                        "alignItems": "center",
-                                    },
-                                )
-                            ]
-                        ),
-                        # ligne 2 colonne 2 ligne 2
-                        dbc.Row(
-                            [
-                                dbc.Col(
-                                    [
-                                        html.H5(
-                                            "Table des 100 dernières ventes",
-                                            style={"paddingLeft": "3vw"},
-                                        ),
-                                        table_des_ventes,
-                                    ],
-                                    style={
-                                        "height": "46vh",
-                                    },
-                                )
-                            ]
-                        ),
-                    ],
-                    md=7,
-                ),
-            ]
-        ),
-    ],
-    fluid=True,
+                                    )
+                                ]
+                            ),
+                            # ligne 2 colonne 2 ligne 2
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        [
+                                            html.H5(
+                                                "Table des ventes",
+                                                style={"paddingLeft": "3vw"},
+                                            ),
+                                            table_des_ventes,
+                                        ],
+                                        style={
+                                            "height": "46vh",
+                                        },
+                                    )
+                                ]
+                            ),
+                        ],
+                        md=7,
+                    ),
+                ]
+            ),
+            # Empreinte du contenu affiché par chaque graphique
+            *[dcc.Store(id=f"empreinte-{identifiant}") for identifiant, *_ in panneaux],
+        ],
+        fluid=True,
+    )
+
+
+# Squelette de la page, pour que Dash valide les callbacks sans attendre les
+# données ; la page complète est servie par afficher_interface une fois
+# celles-ci chargées
+app.validation_layout = interface(
+    [], (None, None), {identifiant: {} for identifiant, *_ in panneaux}
+)
+app.layout = afficher_interface
+
+
+# =========================================
+# Cache des figures
+# =========================================
+
+# Les sorties de chaque graphique sont mémorisées en JSON dans une base SQLite
+# locale (dashboard_common). La clé contient la version du code et celle des
+# données (fichier et ventes intégrées depuis) pour ne jamais servir de figure
+# périmée.
+
+chemin_cache = os.environ.get(
+    "CACHE_FIGURES_CHEMIN",
+    os.path.join(tempfile.gettempdir(), "retail_insight_figures.sqlite"),
 )
 
 
+version_application = version_code(__file__)
+
+
+def cle_cache(version, *selections):
+    # Les bornes d'une plage visible (Timestamp) sous leur forme texte
+    return json.dumps([version_application, version, *selections], default=str)
+
+
+initialiser_cache(chemin_cache)
+
+
+# =========================================
+# Panneaux précalculés
+# =========================================
+
+# Les sorties des graphiques et la première page de la table, sur toute la
+# période, sans zoom ni tri ni filtre de la table, peuvent être calculées
+# hors ligne pour des combinaisons de zones (python -m
+# performance.precompute), une par fichier JSON compressé nommé d'après
+# l'empreinte de sa clé de cache. Avec PRECALCUL_DOSSIER, les callbacks
+# lisent ces fichiers avant le cache et ne calculent plus que les autres
+# sélections. La clé contient la version des données, d'après le contenu du
+# fichier : les fichiers servent encore quand le même fichier est redéployé,
+# plus dès que des ventes sont intégrées.
+#
+# Les combinaisons de zones sont toutes les parties de l'ensemble des zones.
+# Au-delà de --maximum, les plus demandées (comptées dans la base du cache)
+# sont retenues, puis les plus simples : toutes les zones, une seule, deux...
+
+
+def combinaisons_filtres():
+    # Combinaisons normalisées des zones, des plus simples aux plus complètes,
+    # générées à la demande ; () désigne toutes les zones
+    modalites = [option["value"] for option in options_location[1:]]
+    for taille in range(len(modalites) + 1):
+        for locations in itertools.combinations(modalites, taille):
+            yield (locations,)
+
+
+def choisir_selections(maximum=maximum_precalcul):
+    # Combinaisons à précalculer : les plus demandées encore possibles, puis
+    # les plus simples, au plus maximum
+    modalites = {option["value"] for option in options_location[1:]}
+    retenues = {}
+    for selection in itertools.chain(selections_populaires(), combinaisons_filtres()):
+        if len(retenues) >= maximum:
+            break
+        (locations,) = selection
+        if set(locations) <= modalites:
+            retenues.setdefault(selection, None)
+    if len(retenues) < 2 ** len(modalites):
+        journal.warning(
+            "Précalcul limité à %d combinaisons de zones sur %d",
+            len(retenues),
+            2 ** len(modalites),
+        )
+    return list(retenues)
+
+
+def precalculer(dossier, maximum=maximum_precalcul):
+    # Écrit les sorties des graphiques et de la table des combinaisons
+    # retenues, et supprime celles d'une version précédente des données ;
+    # renvoie les combinaisons
+    attendre_donnees()
+    os.makedirs(dossier, exist_ok=True)
+    etat_courant, periode = etat, (None, None)
+    selections, ecrits = choisir_selections(maximum), set()
+
+    def ecrire(cle, sortie):
+        texte = to_json_plotly(sortie)
+        chemin = chemin_precalcul(dossier, cle)
+        ecrire_atomique(chemin, lambda c: ecrire_gzip(c, texte))
+        ecrits.add(os.path.basename(chemin))
+
+    for (locations,) in selections:
+        for identifiant, calcul, entrees in panneaux:
+            parametres = [normaliser(None) for _, normaliser in entrees]
+            ecrire(
+                cle_cache(
+                    etat_courant["version"],
+                    identifiant,
+                    locations,
+                    periode,
+                    *parametres,
+                ),
+                calcul(etat_courant, locations, periode, *parametres),
+            )
+        ecrire(
+            cle_cache(
+                etat_courant["version"],
+                "table-ventes",
+                locations,
+                periode,
+                table_des_ventes.page_size,
+            ),
+            calculer_table(
+                etat_courant,
+                locations,
+                periode,
+                None,
+                [],
+                0,
+                table_des_ventes.page_size,
+            ),
+        )
+    for nom in os.listdir(dossier):
+        if nom.endswith(".json.gz") and nom not in ecrits:
+            os.remove(os.path.join(dossier, nom))
+    return selections
+
+
 # =========================================
 # Callbacks pour les éléments interactifs
 # =========================================
 
 
+# Un graphique dont le contenu n'a pas changé pour la nouvelle sélection
+# n'est pas renvoyé (no_update) : son empreinte (empreinte_contenu) est
+# comparée à celle conservée côté navigateur.
+
+
+def calculer_panneau(identifiant, calcul, etat, locations, periode, *parametres):
+    cle = cle_cache(etat["version"], identifiant, locations, periode, *parametres)
+    texte = lire_precalcul(cle)
+    if texte is not None:
+        incrementer("dashboard_cache_requests_total", result="precalcul")
+        return texte
+    texte = lire_cache(cle)
+    if taille_cache <= 0:
+        resultat = "disabled"
+    else:
+        resultat = "miss" if texte is None else "hit"
+    incrementer("dashboard_cache_requests_total", result=resultat)
+    if texte is None:
+        sortie = calcul(etat, locations, periode, *parametres)
+        with etape("serialisation"):
+            texte = to_json_plotly(sortie)
+        ecrire_cache(cle, texte)
+    return texte
+
+
+def enregistrer_panneau(identifiant, calcul, entrees):
+    @callback(
+        Output(identifiant, "figure"),
+        Output(f"empreinte-{identifiant}", "data"),
+        Input("filtre-location", "value"),
+        Input("filtre-dates", "start_date"),
+        Input("filtre-dates", "end_date"),
+        *[entree for entree, _ in entrees],
+        State(f"empreinte-{identifiant}", "data"),
+    )
+    def update_panneau(locations, debut, fin, *valeurs):
+
+        contexte_mesure.callback = identifiant
+        attendre_donnees()
+        *valeurs, empreinte_affichee = valeurs
+        parametres = [
+            normaliser(valeur) for (_, normaliser), valeur in zip(entrees, valeurs)
+        ]
+        locations = normaliser_selection(locations)
+        # Chaque changement de filtre déclenche le premier graphique : une
+        # seule sélection comptée par changement
+        if identifiant == panneaux[0][0]:
+            compter_selection(locations)
+
+        texte = calculer_panneau(
+            identifiant,
+            calcul,
+            etat,
+            locations,
+            normaliser_periode(debut, fin),
+            *parametres,
+        )
+        empreinte = empreinte_contenu(texte)
+        if empreinte == empreinte_affichee:
+            incrementer("dashboard_panel_unchanged_total", panel=identifiant)
+            return no_update, no_update
+        return json.loads(texte), empreinte
+
+    return update_panneau
+
+
+update_panneaux = {
+    identifiant: enregistrer_panneau(identifiant, calcul, entrees)
+    for identifiant, calcul, entrees in panneaux
+}
+
+
+def calculer_table(etat, selection, periode, filtre, tri, page_current, page_size):
+    # (lignes de la page, nombre de pages, page affichée)
+    debut = page_current * page_size
+    with etape("filtre"):
+        lignes, total = interroger_ventes(
+            etat, selection, periode, filtre, tri, debut, debut + page_size
+        )
+    nombre_pages = max(1, math.ceil(total / page_size))
+    if page_current >= nombre_pages:
+        # Page au-delà de la fin (filtre plus restrictif) : dernière page
+        page_current = nombre_pages - 1
+        debut = page_current * page_size
+        with etape("filtre"):
+            lignes, total = interroger_ventes(
+                etat, selection, periode, filtre, tri, debut, debut + page_size
+            )
+
+    with etape("page"):
+        page = page_de_ventes(lignes)
+
+    return page, nombre_pages, page_current
+
+
 @callback(
     [
-        Output("chiffre-affaires", "figure"),
-        Output("vente-mois", "figure"),
-        Output("barplot-vente", "figure"),
-        Output("evolution-ca", "figure"),
         Output("table-ventes", "data"),
+        Output("table-ventes", "page_count"),
+        Output("table-ventes", "page_current"),
+    ],
+    [
+        Input("filtre-location", "value"),
+        Input("filtre-dates", "start_date"),
+        Input("filtre-dates", "end_date"),
+        Input("table-ventes", "page_current"),
+        Input("table-ventes", "page_size"),
+        Input("table-ventes", "sort_by"),
+        Input("table-ventes", "filter_query"),
     ],
-    Input("filtre-location", "value"),
 )
-def update_graphs(locations):
+def update_table(
+    locations, date_debut, date_fin, page_current, page_size, sort_by, filter_query
+):
 
-    df_filtre = df.copy()
+    contexte_mesure.callback = "table-ventes"
+    attendre_donnees()
+    etat_courant = etat
+    selection = normaliser_selection(locations)
+    periode = normaliser_periode(date_debut, date_fin)
 
-    if locations:
-        df_filtre = df_filtre[df_filtre["Location"].isin(locations)]
-
-    chiffre_affaires = plot_chiffre_affaire_mois(df_filtre)
-    vente_mois = plot_vente_mois(df_filtre)
-    barplot_vente = barplot_top_10_ventes(df_filtre)
-    evolution_ca = plot_evolution_chiffre_affaire(df_filtre)
-    table_ventes = (
-        df_filtre[colonnes]
-        .sort_values(by="Date", ascending=False)
-        .head(100)
-        .to_dict("records")
+    # Retour à la première page quand la sélection change
+    if dash.ctx.triggered_id != "table-ventes":
+        page_current = 0
+    page_current = page_current or 0
+
+    # Première page de l'affichage par défaut : éventuellement précalculée
+    if page_current == 0 and not sort_by and not filter_query:
+        texte = lire_precalcul(
+            cle_cache(
+                etat_courant["version"], "table-ventes", selection, periode, page_size
+            )
+        )
+        if texte is not None:
+            incrementer("dashboard_cache_requests_total", result="precalcul")
+            return json.loads(texte)
+
+    return calculer_table(
+        etat_courant, selection, periode, filter_query, sort_by, page_current, page_size
     )
 
-    return (chiffre_affaires, vente_mois, barplot_vente, evolution_ca, table_ventes)
 
+# =========================================
+# Chargement au démarrage
+# =========================================
+
+
+def charger_application():
+    global etat, options_location, dates, gabarits
+
+    with etape_demarrage("donnees"):
+        partitions = charger_donnees(source_donnees, chemin_donnees, dossier_partitions)
+
+    with etape_demarrage("agregats"):
+        etat = construire_etat(
+            partitions, empreinte_donnees(chemin_donnees, dossier_partitions)
+        )
+        suivi_ingestion.update(
+            version=etat["version"], position=os.path.getsize(chemin_donnees)
+        )
+
+    with etape_demarrage("options"):
+        colonnes_filtres = source_donnees["colonnes_filtres"]
+        valeurs = lire_options(dossier_partitions) or valeurs_filtres(
+            ventes_de_la_selection(etat, (), (None, None), colonnes_filtres),
+            colonnes_filtres,
+        )
+        options_location = [{"label": "Toutes les zones", "value": "all"}] + [
+            {"label": loc, "value": loc} for loc in valeurs["Location"]
+        ]
+        # Bornes du sélecteur de période
+        jours = series_de_la_selection(etat, "jour", ()).index
+        dates = (jours.min().date(), jours.max().date())
+
+    # Mise en page de chaque figure, affichée dès le chargement de la page
+    with etape_demarrage("gabarits"):
+        gabarits = {
+            "chiffre-affaires": gabarit_indicateur(),
+            "vente-mois": gabarit_indicateur(),
+            "barplot-vente": gabarit_barplot(
+                frequence_meilleure_vente(
+                    couples_de_la_selection(
+                        etat, "Gender", "Product_Category", (), (None, None)
+                    ),
+                    ascending=True,
+                )
+            ),
+            "evolution-ca": gabarit_evolution_chiffre_affaire(
+                series_de_la_selection(etat, "semaine", ())
+            ),
+        }
+        application["interface"] = interface(options_location, dates, gabarits)
+
+
+lancer_demarrage(charger_application)
 
 if __name__ == "__main__":
     app.run(debug=True, port=8100, jupyter_mode="external")
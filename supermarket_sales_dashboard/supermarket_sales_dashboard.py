@@ -1,9 +1,74 @@
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+# Début du démarrage, avant les imports lourds (numpy, pandas, dash, plotly)
+instant_debut = time.perf_counter()
+
+import numpy as np
 import pandas as pd
-from dash import Dash, dcc, html, Input, Output, callback
+from dash import Dash, dcc, html, Input, Output, State, callback, no_update
 import dash_bootstrap_components as dbc
-import plotly.graph_objects as go
-import plotly.express as px
-
+from plotly.io.json import to_json_plotly
+
+try:
+    from pyarrow import feather
+except ImportError:  # sans pyarrow, les données sont lues depuis le CSV
+    feather = None
+
+# Lancé comme script, le module commun est cherché à la racine du dépôt
+if not __package__:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard_common.dashboard_common import (
+    afficher_interface,
+    application,
+    attendre_donnees,
+    charger_donnees,
+    chemin_precalcul,
+    choisir_granularite,
+    compacter_donnees,
+    compter_selection,
+    contexte_mesure,
+    couleurs_defaut,
+    curseur_duckdb,
+    dossier_des_partitions,
+    ecrire_atomique,
+    ecrire_cache,
+    ecrire_gzip,
+    empreinte_contenu,
+    empreinte_donnees,
+    etape,
+    etape_demarrage,
+    executer_en_parallele,
+    figure_partielle,
+    incrementer,
+    initialiser_cache,
+    installer,
+    lancer_demarrage,
+    libelles_granularite,
+    lire_cache,
+    lire_colonnaire,
+    lire_options,
+    lire_precalcul,
+    lttb,
+    maximum_precalcul,
+    mise_en_page,
+    moteur_requetes,
+    normaliser_periode,
+    normaliser_selection,
+    plage_visible,
+    points_max_courbe,
+    selections_populaires,
+    taille_cache,
+    valeurs_filtres,
+    version_code,
+)
 
 # ========================================
 # Initialisation de l'application
@@ -12,12 +77,10 @@ import plotly.express as px
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
 
+journal = logging.getLogger(__name__)
 
-# =========================================
-# Chargement des données
-# =========================================
-
-df = pd.read_csv("supermarket_sales_dashboard/supermarket_sales.csv")
+# Mesures des callbacks, /metrics et /health (dashboard_common)
+installer(app, instant_debut)
 
 
 # =========================================
@@ -44,7 +107,6 @@ colonnes = {
     "gross income": "Revenu brut",
     "Rating": "Note",
 }
-df.rename(columns=colonnes, inplace=True)
 
 # Modalités en français
 
@@ -67,15 +129,379 @@ paiement = {
     "Credit card": "Carte de crédit",
 }
 
-df["Type de client"] = df["Type de client"].map(client)
-df["Genre"] = df["Genre"].map(genre)
-df["Ligne de produit"] = df["Ligne de produit"].map(produit)
-df["Paiement"] = df["Paiement"].map(paiement)
 
+# Schéma compact (compacter_donnees) : les variables qualitatives en
+# catégories, le numéro de facture restant une chaîne ; le prix unitaire
+# passe en float32 seulement si l'arrondi au centime est conservé.
+
+colonnes_categorielles = [
+    "Succursale",
+    "Ville",
+    "Type de client",
+    "Genre",
+    "Ligne de produit",
+    "Heure",
+    "Paiement",
+]
+
+
+def nettoyer_donnees(df):
+    df = df.rename(columns=colonnes)
+
+    # Convertir la colonne "Date" en datetime
+    df["Date"] = pd.to_datetime(df["Date"])
+
+    df, rapport = compacter_donnees(
+        df, colonnes_categorielles, colonnes_float32=["Prix unitaire"]
+    )
+    journal.info("Mémoire par colonne avant/après compaction :\n%s", rapport)
+
+    # Traduction des modalités : seules les catégories sont renommées
+    for colonne, traduction in [
+        ("Type de client", client),
+        ("Genre", genre),
+        ("Ligne de produit", produit),
+        ("Paiement", paiement),
+    ]:
+        df[colonne] = df[colonne].astype("category").cat.rename_categories(traduction)
+
+    # Colonne dérivée, calculée une seule fois au chargement
+    df["Ville_Genre"] = (
+        df["Ville"].astype(str) + " - " + df["Genre"].astype(str)
+    ).astype("category")
+
+    return df
+
+
+# =========================================
+# Chargement des données
+# =========================================
+
+# Le CSV nettoyé est converti en partitions Arrow/Feather mensuelles par
+# charger_donnees (dashboard_common), qui décrit aussi DONNEES_PARTAGEES,
+# CSV_LIGNES_PAR_BLOC et PROCESSUS_CHARGEMENT.
+
+chemin_donnees = os.environ.get(
+    "DONNEES_CHEMIN", "supermarket_sales_dashboard/supermarket_sales.csv"
+)
+dossier_partitions = dossier_des_partitions(chemin_donnees, "supermarket_sales_")
+
+source_donnees = {
+    "nettoyer": nettoyer_donnees,
+    "index_col": None,
+    "colonne_date": "Date",
+    "colonnes_filtres": ["Genre", "Ville"],
+    "trier": None,
+}
+
+
+def lire_partition(source):
+    # Lignes d'une partition : fichier Feather, ou DataFrame sans pyarrow
+    if isinstance(source, pd.DataFrame):
+        return source
+    return lire_colonnaire(source)
+
+
+# =========================================
+# Cube pré-agrégé
+# =========================================
+
+# Le cube regroupe les ventes par cellule (Genre, Ville, Ligne de produit,
+# Date) : les callbacks somment quelques cellules au lieu de reparcourir
+# toutes les lignes de df.
+#
+# Pour l'histogramme, chaque cellule compte aussi ses ventes par classe de
+# montant. Les 30 classes ont des bornes fixes, calculées sur toutes les
+# données, pour que les sélections restent comparables.
+#
+# Une cellule ne couvre qu'un jour, donc une seule partition : le cube est
+# construit partition par partition, sans jamais réunir toutes les lignes.
+
+dimensions_cube = ["Genre", "Ville", "Ligne de produit", "Date"]
+
+nombre_classes = 30
+colonnes_classes = [f"Classe {i}" for i in range(nombre_classes)]
+
+
+def classes_montants(montants, bornes):
+    # Classe de chaque montant, la dernière borne étant incluse (np.histogram)
+    classes = np.searchsorted(bornes, montants, side="right") - 1
+    return np.clip(classes, 0, nombre_classes - 1)
+
+
+def construire_cube(data, bornes):
+    cube = (
+        data.groupby(dimensions_cube, observed=True)
+        .agg(
+            **{
+                "Montant total": ("Montant total", "sum"),
+                "Nombre": ("ID Facture", "size"),
+                "Nombre factures": ("ID Facture", "nunique"),
+            }
+        )
+        .reset_index()
+    )
+
+    # Effectifs par (cellule, classe de montant) en un seul np.bincount
+    cellules = data.groupby(dimensions_cube, observed=True).ngroup().to_numpy()
+    classes = classes_montants(data["Montant total"].to_numpy(), bornes)
+    effectifs = np.bincount(
+        cellules * nombre_classes + classes, minlength=len(cube) * nombre_classes
+    ).reshape(len(cube), nombre_classes)
+    cube = pd.concat([cube, pd.DataFrame(effectifs, columns=colonnes_classes)], axis=1)
+
+    # Le cube est petit : ses dimensions restent de simples chaînes pour les
+    # graphiques, sans modalités vides héritées des catégories de df.
+    for dimension in ["Genre", "Ville", "Ligne de produit"]:
+        cube[dimension] = cube[dimension].astype(str)
+    return cube
+
+
+def factures_par_cellule(cellules, numeros, nombre_cellules):
+    # Numéros entiers des factures distinctes de chaque cellule
+    base = numeros.max() + 1
+    cellules_paires, numeros_paires = np.divmod(
+        np.unique(cellules.astype(np.int64) * base + numeros), base
+    )
+    bornes = np.searchsorted(cellules_paires, np.arange(nombre_cellules + 1))
+    factures = np.empty(nombre_cellules, dtype=object)
+    for i in range(nombre_cellules):
+        factures[i] = numeros_paires[bornes[i] : bornes[i + 1]]
+    return factures
+
+
+def selectionner_cellules(cube, genres, villes, periode):
+    masque = np.ones(len(cube), dtype=bool)
+
+    if genres:
+        masque &= cube["Genre"].isin(genres).to_numpy()
+
+    if villes:
+        masque &= cube["Ville"].isin(villes).to_numpy()
 
-# Convertir la colonne "Date" en datetime
+    debut, fin = periode
+    if debut:
+        masque &= (cube["Date"] >= pd.Timestamp(debut)).to_numpy()
 
-df["Date"] = pd.to_datetime(df["Date"])
+    if fin:
+        masque &= (cube["Date"] <= pd.Timestamp(fin)).to_numpy()
+
+    return cube[masque]
+
+
+# =========================================
+# Moteur de requêtes
+# =========================================
+
+# Le cube est construit par un moteur, choisi par MOTEUR_REQUETES :
+# - pandas (par défaut) : toutes les partitions sont réunies en un frame,
+#   regroupé par pandas ;
+# - duckdb : une requête SQL agrège les partitions, exécutée par DuckDB dans
+#   le processus, en parallèle sur MOTEUR_THREADS threads (tous les cœurs par
+#   défaut), sans jamais réunir toutes les lignes en un seul frame.
+# Les deux moteurs renvoient le même cube (aux arrondis des sommes près) ;
+# les callbacks sélectionnent ensuite ses cellules avec pandas. La connexion
+# DuckDB du processus est ouverte par curseur_duckdb (dashboard_common).
+
+
+def extremes_montants(source):
+    # Plus petit et plus grand montant d'une partition, seule colonne lue
+    if isinstance(source, pd.DataFrame):
+        montants = source["Montant total"]
+    else:
+        montants = (
+            feather.read_table(source, columns=["Montant total"], memory_map=True)
+            .column(0)
+            .to_pandas()
+        )
+    return montants.min(), montants.max()
+
+
+def ordonner_cube(cube, apparitions):
+    # Cellules dans l'ordre du regroupement de pandas (observed=True) sur
+    # toutes les lignes : les modalités dans leur ordre d'apparition d'une
+    # partition à l'autre, puis les dates
+    for dimension, valeurs in apparitions.items():
+        modalites = pd.concat([pd.Series(v) for v in valeurs])
+        cube[dimension] = pd.Categorical(
+            cube[dimension].astype(object),
+            categories=modalites.dropna().astype(object).unique(),
+        )
+    cube = cube.sort_values(dimensions_cube, kind="stable", ignore_index=True)
+    for dimension in apparitions:
+        cube[dimension] = cube[dimension].astype(str)
+    return cube
+
+
+def cube_de_la_partition(source, bornes):
+    # Cube d'une partition, avec ses modalités et ses factures dans leur ordre
+    # d'apparition
+    data = lire_partition(source)
+    return (
+        construire_cube(data, bornes),
+        {
+            dimension: data[dimension].unique()
+            for dimension in ["Genre", "Ville", "Ligne de produit"]
+        },
+        data["ID Facture"].dropna().unique(),
+    )
+
+
+def cube_pandas(partitions):
+    # Bornes des classes : seuls le minimum et le maximum comptent
+    extremes = np.array(
+        [extremes_montants(source) for source in partitions.values()]
+    ).ravel()
+    bornes = np.histogram_bin_edges(extremes[~np.isnan(extremes)], bins=nombre_classes)
+
+    # Un cube par partition, puis les factures distinctes dans l'ordre
+    # d'apparition, numérotées comme pd.factorize sur toutes les lignes
+    resultats = executer_en_parallele(
+        cube_de_la_partition, [(source, bornes) for source in partitions.values()]
+    )
+    cubes = [cube for cube, _, _ in resultats]
+    apparitions = {
+        dimension: [modalites[dimension] for _, modalites, _ in resultats]
+        for dimension in ["Genre", "Ville", "Ligne de produit"]
+    }
+    identifiants = pd.Index(
+        pd.unique(np.concatenate([factures for _, _, factures in resultats]))
+    )
+    cube = pd.concat(cubes, ignore_index=True)
+
+    # Factures réparties sur plusieurs cellules : leurs numéros par cellule
+    # servent à compter les factures distinctes d'une sélection. Les
+    # partitions sont alors relues pour numéroter leurs factures
+    if cube["Nombre factures"].sum() != len(identifiants):
+        factures = []
+        for source, cube_partition in zip(partitions.values(), cubes):
+            data = lire_partition(source)
+            cellules = data.groupby(dimensions_cube, observed=True).ngroup()
+            factures.append(
+                factures_par_cellule(
+                    cellules.to_numpy(),
+                    identifiants.get_indexer(data["ID Facture"]),
+                    len(cube_partition),
+                )
+            )
+        cube["Factures"] = np.concatenate(factures)
+    return bornes, ordonner_cube(cube, apparitions)
+
+
+def cube_duckdb(partitions):
+    sources = [lire_partition(source) for source in partitions.values()]
+    # Types des colonnes une fois les partitions réunies, comme avec pandas
+    modele = pd.concat([source.iloc[:0] for source in sources])
+    colonnes_lues = dimensions_cube + ["Montant total", "ID Facture"]
+    dimensions = ", ".join(f'"{dimension}"' for dimension in dimensions_cube)
+    cellules_valides = " AND ".join(
+        f'"{dimension}" IS NOT NULL' for dimension in dimensions_cube
+    )
+
+    with closing(curseur_duckdb()) as curseur:
+        # Seules les colonnes lues sont déclarées, sans copie : DuckDB analyse
+        # chaque colonne du frame à la déclaration
+        requetes = []
+        for i, source in enumerate([modele, *sources]):
+            curseur.register(
+                f"partition_{i}",
+                pd.DataFrame({c: source[c] for c in colonnes_lues}, copy=False),
+            )
+            requetes.append(f"SELECT * FROM partition_{i}")
+        curseur.execute(
+            f"CREATE TEMPORARY VIEW ventes AS {' UNION ALL '.join(requetes)}"
+        )
+
+        # Bornes des classes : seuls le minimum et le maximum comptent
+        extremes = curseur.execute(
+            'SELECT min("Montant total"), max("Montant total") FROM ventes'
+        ).fetchone()
+        bornes = np.histogram_bin_edges(
+            np.array(extremes, dtype=modele["Montant total"].dtype),
+            bins=nombre_classes,
+        )
+
+        # Intervalle [bas, haut[ de chaque classe, les classes extrêmes
+        # ouvertes ; un montant hors de toutes (NaN) va dans la dernière,
+        # comme avec classes_montants
+        curseur.register(
+            "classes",
+            pd.DataFrame(
+                {
+                    "numero": np.arange(nombre_classes),
+                    "bas": np.r_[-np.inf, bornes[1:-1]],
+                    "haut": np.r_[bornes[1:-1], np.inf],
+                }
+            ),
+        )
+        effectifs = ", ".join(
+            f"count(*) FILTER (WHERE coalesce(numero, {nombre_classes - 1}) = {i})"
+            f' AS "{colonne}"'
+            for i, colonne in enumerate(colonnes_classes)
+        )
+        cube = curseur.execute(f"""
+            SELECT {dimensions},
+                   sum("Montant total") AS "Montant total",
+                   count(*) AS "Nombre",
+                   count(DISTINCT "ID Facture") AS "Nombre factures",
+                   {effectifs}
+            FROM ventes
+            LEFT JOIN classes ON "Montant total" >= bas AND "Montant total" < haut
+            WHERE {cellules_valides}
+            GROUP BY {dimensions}
+            """).df()
+
+        # Factures réparties sur plusieurs cellules : numéros (rang de
+        # l'identifiant) des factures distinctes de chaque cellule
+        (nombre_factures,) = curseur.execute(
+            'SELECT count(DISTINCT "ID Facture") FROM ventes'
+        ).fetchone()
+        if cube["Nombre factures"].sum() != nombre_factures:
+            factures = curseur.execute(f"""
+                SELECT {dimensions}, list(DISTINCT numero) AS Factures
+                FROM (
+                    SELECT *, dense_rank() OVER (ORDER BY "ID Facture") AS numero
+                    FROM ventes
+                )
+                WHERE {cellules_valides}
+                GROUP BY {dimensions}
+                """).df()
+            factures["Factures"] = [
+                np.sort(np.asarray(numeros, dtype=np.int64))
+                for numeros in factures["Factures"]
+            ]
+            cube = cube.merge(factures, on=dimensions_cube, how="left")
+
+    apparitions = {
+        dimension: [source[dimension].unique() for source in sources]
+        for dimension in ["Genre", "Ville", "Ligne de produit"]
+    }
+    cube = ordonner_cube(cube, apparitions)
+    cube["Date"] = cube["Date"].astype("datetime64[ns]")
+    return bornes, cube
+
+
+# (construction du cube : bornes des classes de montant et cube)
+moteurs = {"pandas": cube_pandas, "duckdb": cube_duckdb}
+
+
+# =========================================
+# Granularité et sous-échantillonnage des courbes
+# =========================================
+
+# La granularité de la courbe d'évolution (jour, semaine ou mois) suit la
+# période visible (choisir_granularite), et ses points sont réduits par LTTB
+# au-delà de EVOLUTION_POINTS_MAX (dashboard_common). Les cellules du cube
+# sont regroupées par période de cette granularité.
+
+
+def debut_de_periode(dates, granularite):
+    if granularite == "jour":
+        return dates.dt.normalize()
+    if granularite == "semaine":
+        # Lundi de la semaine ISO
+        return dates.dt.normalize() - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+    return dates.dt.to_period("M").dt.to_timestamp()
 
 
 # =========================================
@@ -96,25 +522,42 @@ def format_entier(x):
 # Indicateurs
 
 
-def afficher_montant_total_achats(data):
-    montant_total_achats = f"{format_decimal(data['Montant total'].sum())} USD"
+def afficher_montant_total_achats(cellules):
+    montant_total_achats = f"{format_decimal(cellules['Montant total'].sum())} USD"
     return montant_total_achats
 
 
-def afficher_nombre_total_achats(data):
-    nombre_total_achats = f"{format_entier(data['ID Facture'].nunique())}"
+def afficher_nombre_total_achats(cellules):
+    if cube_factures_disjointes:
+        nombre = int(cellules["Nombre factures"].sum())
+    else:
+        nombre = len(np.unique(np.concatenate([[], *cellules["Factures"]])))
+    nombre_total_achats = f"{format_entier(nombre)}"
     return nombre_total_achats
 
 
 # Graphiques
 
+# La mise en page de chaque figure (titres, polices, légendes, marges, thème)
+# est construite une seule fois au démarrage, avec plotly express sur toutes
+# les données ; plotly express n'est importé qu'à ce moment. Par requête,
+# seules les traces sont recalculées, en simples dictionnaires, et envoyées
+# comme mise à jour partielle de la figure affichée (figure_partielle).
+
 
 ## Histogramme
-def histogramme_montants_totaux_achats(data):
-    data["Ville_Genre"] = data["Ville"] + " - " + data["Genre"]
-    data = data.sort_values(by="Ville_Genre")
+couleurs_histogramme = ["blue", "lightblue", "red", "pink", "orange", "yellow"]
+
 
-    couleurs = ["blue", "lightblue", "red", "pink", "orange", "yellow"]
+def gabarit_histogramme(data):
+    import plotly.express as px
+
+    data = pd.DataFrame(
+        {
+            "Montant total": data["Montant total"],
+            "Ville_Genre": data["Ville_Genre"].astype(str),
+        }
+    ).sort_values(by="Ville_Genre")
 
     fig = px.histogram(
         data_frame=data,
@@ -125,7 +568,7 @@ def histogramme_montants_totaux_achats(data):
             "Ville_Genre": "Ville - Genre",
         },
         nbins=30,
-        color_discrete_sequence=couleurs,
+        color_discrete_sequence=couleurs_histogramme,
     )
 
     # Titre
@@ -160,35 +603,60 @@ def histogramme_montants_totaux_achats(data):
         margin=dict(t=70, b=5, l=5, r=5),
     )
 
-    return fig
+    return mise_en_page(fig)
 
 
-## Diagramme circulaire
-def diagramme_categorie_produit(data):
-    # Calcul des pourcentages
-    df = data.groupby("Ligne de produit").size().reset_index(name="Nombre")
-    df["Pourcentage"] = df["Nombre"] / df["Nombre"].sum()
+def histogramme_montants_totaux_achats(cellules):
+    # Les classes sont calculées côté serveur : une barre par classe et par
+    # groupe Ville - Genre, quel que soit le nombre de ventes
+    effectifs = cellules.groupby(["Ville", "Genre"])[colonnes_classes].sum()
+    effectifs.index = [f"{ville} - {genre}" for ville, genre in effectifs.index]
+    effectifs = effectifs.sort_index()
 
-    # Pourcentages en gras
-    df["Texte"] = df["Pourcentage"].apply(
-        lambda x: f"<b>{format_decimal(x * 100)} %</b>"
+    # Classes de même largeur, bornes arrondies au centime pour l'affichage
+    largeur = bornes_montants[1] - bornes_montants[0]
+    centres = np.round(bornes_montants[:-1] + largeur / 2, 2)
+    intervalles = np.round(
+        np.column_stack([bornes_montants[:-1], bornes_montants[1:]]), 2
     )
 
-    # Graphique
+    traces = []
+    for i, (nom, comptes) in enumerate(effectifs.iterrows()):
+        traces.append(
+            {
+                "customdata": intervalles,
+                "hovertemplate": f"Ville - Genre={nom}<br>Montant total="
+                "%{customdata[0]:.2f} - %{customdata[1]:.2f}"
+                "<br>count=%{y}<extra></extra>",
+                "legendgroup": nom,
+                "marker": {
+                    "color": couleurs_histogramme[i % len(couleurs_histogramme)],
+                    "pattern": {"shape": ""},
+                },
+                "name": nom,
+                "orientation": "v",
+                "showlegend": True,
+                "type": "bar",
+                "width": largeur,
+                "x": centres,
+                "xaxis": "x",
+                "y": comptes.to_numpy(),
+                "yaxis": "y",
+            }
+        )
+
+    return traces
+
+
+## Diagramme circulaire
+def gabarit_categorie_produit(cellules):
+    import plotly.express as px
+
     fig = px.pie(
-        df,
+        cellules,
         names="Ligne de produit",
         values="Nombre",
         color="Ligne de produit",
-        category_orders={"Ligne de produit": sorted(df["Ligne de produit"].unique())},
-    )
-
-    # Texte à l'intérieur du graphique
-    fig.update_traces(
-        text=df["Texte"],
-        textinfo="text",
-        textposition="inside",
-        textfont=dict(color="black", size=13),
     )
 
     # Titre
@@ -214,40 +682,56 @@ def diagramme_categorie_produit(data):
         margin=dict(t=70, b=5, l=5, r=5),
     )
 
-    return fig
+    return mise_en_page(fig)
 
 
-## Graphique en ligne
-def evolution_montant_total_achats(data):
-
-    # Colonne semaine
-    data["Semaine"] = data["Date"].dt.isocalendar().week
+def diagramme_categorie_produit(cellules):
+    # Calcul des pourcentages
+    nombres = cellules.groupby("Ligne de produit")["Nombre"].sum()
+    pourcentages = nombres / nombres.sum()
+    categories = list(nombres.index)
+
+    return [
+        {
+            "customdata": [[categorie] for categorie in categories],
+            "direction": "clockwise",
+            "domain": {"x": [0.0, 1.0], "y": [0.0, 1.0]},
+            "hovertemplate": "Ligne de produit=%{customdata[0]}<br>Nombre=%{value}"
+            "<extra></extra>",
+            "labels": categories,
+            "legendgroup": "",
+            "marker": {
+                "colors": [
+                    couleurs_defaut[i % len(couleurs_defaut)]
+                    for i in range(len(categories))
+                ]
+            },
+            "name": "",
+            "showlegend": True,
+            "sort": False,
+            # Pourcentages en gras, à l'intérieur du graphique
+            "text": [f"<b>{format_decimal(x * 100)} %</b>" for x in pourcentages],
+            "textfont": {"color": "black", "size": 13},
+            "textinfo": "text",
+            "textposition": "inside",
+            "type": "pie",
+            "values": nombres.to_numpy(),
+        }
+    ]
 
-    # Colonne année
-    data["Annee"] = data["Date"].dt.isocalendar().year
 
-    # Groupement par Annee, Semaine et Ville
-    df = (
-        data.sort_values(by=["Annee", "Semaine", "Ville"])
-        .groupby(["Annee", "Semaine", "Ville"])["Montant total"]
-        .sum()
-        .reset_index()
-    )
-
-    # Colonne pour la semaine de l'année
-    df["Semaine_annee"] = (
-        "S" + df["Semaine"].astype(str) + "-" + df["Annee"].astype(str)
-    )
+## Graphique en ligne
+def gabarit_evolution(cellules):
+    import plotly.express as px
 
-    # Tracer l'évolution des achats par semaine et par ville
     fig = px.line(
-        df,
-        x="Semaine_annee",
+        cellules,
+        x="Date",
         y="Montant total",
         color="Ville",
         labels={
             "Montant total": "Montant total des achats (USD)",
-            "Semaine_annee": "Semaine",
+            "Date": "Semaine",
         },
     )
 
@@ -271,21 +755,134 @@ def evolution_montant_total_achats(data):
             font=dict(color="black", size=14),
         ),
         margin=dict(t=70, b=5, l=5, r=5),
+        # Le zoom de l'utilisateur est conservé quand les traces changent
+        uirevision="evolution",
+    )
+
+    return mise_en_page(fig)
+
+
+def evolution_montant_total_achats(cellules, plage=None):
+
+    # Granularité selon la période visible
+    debut, fin = plage or (cellules["Date"].min(), cellules["Date"].max())
+    granularite = choisir_granularite(debut, fin)
+    libelle = libelles_granularite[granularite]
+
+    # Groupement par période et par ville
+    df = (
+        cellules.groupby(
+            [debut_de_periode(cellules["Date"], granularite).rename("Periode"), "Ville"]
+        )["Montant total"]
+        .sum()
+        .reset_index()
     )
 
-    return fig
+    # Après un zoom, la période visible et autant de chaque côté
+    if plage is not None:
+        marge = fin - debut
+        df = df[df["Periode"].between(debut - marge, fin + marge)]
+
+    # Une courbe par ville, dans l'ordre d'apparition
+    traces = []
+    for i, (ville, groupe) in enumerate(df.groupby("Ville", sort=False)):
+        periodes = groupe["Periode"].to_numpy()
+        montants = groupe["Montant total"].to_numpy()
+        retenus = lttb(periodes, montants, points_max_courbe)
+        traces.append(
+            {
+                "hovertemplate": f"Ville={ville}<br>{libelle}=%{{x}}"
+                "<br>Montant total des achats (USD)=%{y}<extra></extra>",
+                "legendgroup": ville,
+                "line": {
+                    "color": couleurs_defaut[i % len(couleurs_defaut)],
+                    "dash": "solid",
+                },
+                "marker": {"symbol": "circle"},
+                "mode": "lines",
+                "name": ville,
+                "orientation": "v",
+                "showlegend": True,
+                "type": "scatter",
+                "x": periodes[retenus],
+                "xaxis": "x",
+                "y": montants[retenus],
+                "yaxis": "y",
+            }
+        )
+
+    return traces, granularite
 
 
 # =========================================
-# Options pour les filtres
+# Panneaux du tableau de bord
 # =========================================
 
-options_genre = [{"label": "Tous les genres", "value": "all"}] + [
-    {"label": g, "value": g} for g in sorted(df["Genre"].dropna().unique())
-]
-
-options_ville = [{"label": "Toutes les villes", "value": "all"}] + [
-    {"label": v, "value": v} for v in sorted(df["Ville"].dropna().unique())
+# Chaque panneau a son propre callback, généré à partir de ce registre : le
+# navigateur envoie une requête par panneau, traitées en parallèle par les
+# threads du serveur, et chaque panneau s'affiche dès qu'il est prêt.
+
+
+# Les étapes mesurées sont la sélection des cellules du cube (filtre) puis la
+# construction de la sortie (figure), qui agrège les cellules sélectionnées.
+
+
+def panneau_montant_total_achats(genres, villes, periode):
+    with etape("filtre"):
+        cellules = selectionner_cellules(cube, genres, villes, periode)
+    with etape("figure"):
+        return afficher_montant_total_achats(cellules)
+
+
+def panneau_nombre_total_achats(genres, villes, periode):
+    with etape("filtre"):
+        cellules = selectionner_cellules(cube, genres, villes, periode)
+    with etape("figure"):
+        return afficher_nombre_total_achats(cellules)
+
+
+def panneau_histogramme(genres, villes, periode):
+    with etape("filtre"):
+        cellules = selectionner_cellules(cube, genres, villes, periode)
+    with etape("figure"):
+        return figure_partielle(histogramme_montants_totaux_achats(cellules))
+
+
+def panneau_categorie_produit(genres, villes, periode):
+    with etape("filtre"):
+        cellules = selectionner_cellules(cube, genres, villes, periode)
+    with etape("figure"):
+        return figure_partielle(diagramme_categorie_produit(cellules))
+
+
+def panneau_evolution(genres, villes, periode, plage):
+    with etape("filtre"):
+        cellules = selectionner_cellules(cube, genres, villes, periode)
+    with etape("figure"):
+        traces, granularite = evolution_montant_total_achats(cellules, plage)
+        patch = figure_partielle(traces)
+    patch["layout"]["title"][
+        "text"
+    ] = f"<b>Évolution du montant total des achats par {granularite} et par ville</b>"
+    patch["layout"]["xaxis"]["title"]["text"] = libelles_granularite[granularite]
+    return patch
+
+
+# (identifiant du composant, propriété mise à jour, calcul, entrées propres
+# au panneau avec leur normalisation, passées normalisées au calcul après les
+# filtres et la période). Seule la plage visible du zoom compte : les autres
+# changements de relayoutData (autosize, axe des y...) gardent la même clé.
+panneaux = [
+    ("montant-total-achats", "children", panneau_montant_total_achats, []),
+    ("nombre-total-achats", "children", panneau_nombre_total_achats, []),
+    ("hist-montants-totaux-achats", "figure", panneau_histogramme, []),
+    ("diag-categorie-produit", "figure", panneau_categorie_produit, []),
+    (
+        "evol-montant-total-achats",
+        "figure",
+        panneau_evolution,
+        [(Input("evol-montant-total-achats", "relayoutData"), plage_visible)],
+    ),
 ]
 
 
@@ -293,205 +890,322 @@ options_ville = [{"label": "Toutes les villes", "value": "all"}] + [
 # Interface utilisateur
 # =========================================
 
-app.layout = dbc.Container(
-    [
-        # Titre
-        dbc.Row(
-            [
-                html.H1(
-                    "Tableau de bord des ventes",
-                    style={
-                        "display": "flex",
-                        "alignItems": "center",
-                        "justifyContent": "center",
-                        "color": "white",
-                        "fontWeight": "bold",
-                    },
-                ),
-            ],
-            style={
-                "height": "10vh",
-                "backgroundColor": "#001F3F",
-            },
-        ),
-        # Filtres
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.Div(
-                            [
-                                html.Label(
-                                    "Genre :",
-                                    style={
-                                        "fontSize": "2.4vh",
-                                        "paddingLeft": "9vw",
-                                        "color": "white",
-                                        "fontWeight": "bold",
-                                        "marginBottom": "1vw",
-                                    },
-                                ),
-                                dcc.Dropdown(
-                                    id="filtre-genre",
-                                    options=options_genre,
-                                    multi=True,
-                                    value=None,
-                                    placeholder="Sélectionnez le genre",
-                                    style={
-                                        "width": "30vw",
-                                        "font-size": "2.2vh",
-                                        "margin": "auto",
-                                        "marginBottom": "1vw",
-                                    },
-                                ),
-                            ]
-                        )
-                    ],
-                    style={
-                        "height": "17vh",
-                        "display": "flex",
-                        "flexDirection": "column",
-                        "justifyContent": "center",
-                        "backgroundColor": "#003366",
-                    },
-                    md=6,
-                ),
-                dbc.Col(
-                    [
-                        html.Div(
-                            [
-                                html.Label(
-                                    "Ville(s) :",
-                                    style={
-                                        "fontSize": "2.4vh",
-                                        "paddingLeft": "9vw",
-                                        "color": "white",
-                                        "fontWeight": "bold",
-                                        "marginBottom": "1vw",
-                                    },
-                                ),
-                                dcc.Dropdown(
-                                    id="filtre-ville",
-                                    options=options_ville,
-                                    multi=True,
-                                    value=None,
-                                    placeholder="Sélectionnez la ou les villes",
-                                    style={
-                                        "width": "30vw",
-                                        "font-size": "2.2vh",
-                                        "margin": "auto",
-                                        "marginBottom": "1vw",
-                                    },
-                                ),
-                            ]
+
+def interface(options_genre, options_ville, dates, gabarits):
+    return dbc.Container(
+        [
+            # Titre
+            dbc.Row(
+                [
+                    html.H1(
+                        "Tableau de bord des ventes",
+                        style={
+                            "display": "flex",
+                            "alignItems": "center",
+                            "justifyContent": "center",
+                            "color": "white",
+                            "fontWeight": "bold",
+                        },
+                    ),
+                ],
+                style={
+                    "height": "10vh",
+                    "backgroundColor": "#001F3F",
+                },
+            ),
+            # Filtres
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.Div(
+                                [
+                                    html.Label(
+                                        "Genre :",
+                                        style={
+                                            "fontSize": "2.4vh",
+                                            "paddingLeft": "9vw",
+                                            "color": "white",
+                                            "fontWeight": "bold",
+                                            "marginBottom": "1vw",
+                                        },
+                                    ),
+                                    dcc.Dropdown(
+                                        id="filtre-genre",
+                                        options=options_genre,
+                                        multi=True,
+                                        value=None,
+                                        placeholder="Sélectionnez le genre",
+                                        style={
+                                            "width": "30vw",
+                                            "font-size": "2.2vh",
+                                            "margin": "auto",
+                                            "marginBottom": "1vw",
+                                        },
+                                    ),
+                                ]
+                            )
+                        ],
+                        style={
+                            "height": "17vh",
+                            "display": "flex",
+                            "flexDirection": "column",
+                            "justifyContent": "center",
+                            "backgroundColor": "#003366",
+                        },
+                        md=4,
+                    ),
+                    dbc.Col(
+                        [
+                            html.Div(
+                                [
+                                    html.Label(
+                                        "Ville(s) :",
+                                        style={
+                                            "fontSize": "2.4vh",
+                                            "paddingLeft": "9vw",
+                                            "color": "white",
+                                            "fontWeight": "bold",
+                                            "marginBottom": "1vw",
+                                        },
+                                    ),
+                                    dcc.Dropdown(
+                                        id="filtre-ville",
+                                        options=options_ville,
+                                        multi=True,
+                                        value=None,
+                                        placeholder="Sélectionnez la ou les villes",
+                                        style={
+                                            "width": "30vw",
+                                            "font-size": "2.2vh",
+                                            "margin": "auto",
+                                            "marginBottom": "1vw",
+                                        },
+                                    ),
+                                ]
+                            ),
+                        ],
+                        style={
+                            "height": "17vh",
+                            "display": "flex",
+                            "flexDirection": "column",
+                            "justifyContent": "center",
+                            "backgroundColor": "#003366",
+                        },
+                        md=4,
+                    ),
+                    dbc.Col(
+                        [
+                            html.Div(
+                                [
+                                    html.Label(
+                                        "Période :",
+                                        style={
+                                            "fontSize": "2.4vh",
+                                            "paddingLeft": "9vw",
+                                            "color": "white",
+                                            "fontWeight": "bold",
+                                            "marginBottom": "1vw",
+                                        },
+                                    ),
+                                    dcc.DatePickerRange(
+                                        id="filtre-dates",
+                                        min_date_allowed=dates[0],
+                                        max_date_allowed=dates[1],
+                                        initial_visible_month=dates[1],
+                                        start_date_placeholder_text="Début",
+                                        end_date_placeholder_text="Fin",
+                                        display_format="DD/MM/YYYY",
+                                        first_day_of_week=1,
+                                        clearable=True,
+                                        style={"margin": "auto", "marginBottom": "1vw"},
+                                    ),
+                                ]
+                            ),
+                        ],
+                        style={
+                            "height": "17vh",
+                            "display": "flex",
+                            "flexDirection": "column",
+                            "justifyContent": "center",
+                            "backgroundColor": "#003366",
+                        },
+                        md=4,
+                    ),
+                ]
+            ),
+            # Indicateurs
+            dbc.Row(
+                [
+                    dbc.Col(
+                        dbc.Card(
+                            dbc.CardBody(
+                                [
+                                    html.H5(
+                                        "Montant total des achats ($)",
+                                        style={
+                                            "font-weight": "bold",
+                                            "text-align": "center",
+                                            "font-size": "3.5vh",
+                                        },
+                                    ),
+                                    html.H2(
+                                        id="montant-total-achats",
+                                        style={
+                                            "font-weight": "bold",
+                                            "text-align": "center",
+                                            "font-size": "5.5vh",
+                                        },
+                                    ),
+                                ]
+                            ),
+                            outline=True,
+                            style={
+                                "width": "32vw",
+                                "height": "18vh",
+                                "borderRadius": "1.5vw",
+                                "border": "0.4vw solid #001F3F",
+                                "margin": "auto",
+                                "text-align": "center",
+                            },
                         ),
-                    ],
-                    style={
-                        "height": "17vh",
-                        "display": "flex",
-                        "flexDirection": "column",
-                        "justifyContent": "center",
-                        "backgroundColor": "#003366",
-                    },
-                    md=6,
-                ),
-            ]
-        ),
-        # Indicateurs
-        dbc.Row(
-            [
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(
+                        style={
+                            "height": "25vh",
+                            "display": "flex",
+                            "alignItems": "center",
+                            "justifyContent": "center",
+                            "backgroundColor": "#004080",
+                        },
+                        md=6,
+                    ),
+                    dbc.Col(
+                        dbc.Card(
+                            dbc.CardBody(
+                                [
+                                    html.H5(
+                                        "Nombre total d'achats",
+                                        style={
+                                            "font-weight": "bold",
+                                            "text-align": "center",
+                                            "font-size": "3.5vh",
+                                        },
+                                    ),
+                                    html.H2(
+                                        id="nombre-total-achats",
+                                        style={
+                                            "font-weight": "bold",
+                                            "text-align": "center",
+                                            "font-size": "5.5vh",
+                                        },
+                                    ),
+                                ]
+                            ),
+                            outline=True,
+                            style={
+                                "width": "32vw",
+                                "height": "18vh",
+                                "borderRadius": "1.5vw",
+                                "border": "0.4vw solid #001F3F",
+                                "margin": "auto",
+                                "text-align": "center",
+                            },
+                        ),
+                        style={
+                            "height": "25vh",
+                            "display": "flex",
+                            "alignItems": "center",
+                            "justifyContent": "center",
+                            "backgroundColor": "#004080",
+                        },
+                        md=6,
+                    ),
+                ]
+            ),
+            # Graphiques
+            dbc.Row(
+                [
+                    dbc.Col(
+                        html.Div(
                             [
-                                html.H5(
-                                    "Montant total des achats ($)",
-                                    style={
-                                        "font-weight": "bold",
-                                        "text-align": "center",
-                                        "font-size": "3.5vh",
+                                dcc.Graph(
+                                    id="hist-montants-totaux-achats",
+                                    figure={
+                                        "data": [],
+                                        "layout": gabarits[
+                                            "hist-montants-totaux-achats"
+                                        ],
                                     },
-                                ),
-                                html.H2(
-                                    id="montant-total-achats",
                                     style={
-                                        "font-weight": "bold",
-                                        "text-align": "center",
-                                        "font-size": "5.5vh",
+                                        "width": "96%",
+                                        "height": "96%",
                                     },
+                                    config={"responsive": True},
                                 ),
-                            ]
+                            ],
+                            style={
+                                "width": "47.5vw",
+                                "height": "70vh",
+                                "display": "flex",
+                                "justifyContent": "center",
+                                "borderRadius": "1.5vw",
+                                "backgroundColor": "white",
+                                "border": "0.4vw solid #001F3F",
+                            },
                         ),
-                        outline=True,
                         style={
-                            "width": "32vw",
-                            "height": "18vh",
-                            "borderRadius": "1.5vw",
-                            "border": "0.4vw solid #001F3F",
-                            "margin": "auto",
-                            "text-align": "center",
+                            "height": "70vh",
+                            "display": "flex",
+                            "justifyContent": "center",
+                            "backgroundColor": "#004080",
                         },
+                        md=6,
                     ),
-                    style={
-                        "height": "25vh",
-                        "display": "flex",
-                        "alignItems": "center",
-                        "justifyContent": "center",
-                        "backgroundColor": "#004080",
-                    },
-                    md=6,
-                ),
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(
+                    dbc.Col(
+                        html.Div(
                             [
-                                html.H5(
-                                    "Nombre total d'achats",
-                                    style={
-                                        "font-weight": "bold",
-                                        "text-align": "center",
-                                        "font-size": "3.5vh",
+                                dcc.Graph(
+                                    id="diag-categorie-produit",
+                                    figure={
+                                        "data": [],
+                                        "layout": gabarits["diag-categorie-produit"],
                                     },
-                                ),
-                                html.H2(
-                                    id="nombre-total-achats",
                                     style={
-                                        "font-weight": "bold",
-                                        "text-align": "center",
-                                        "font-size": "5.5vh",
+                                        "width": "96%",
+                                        "height": "96%",
                                     },
+                                    config={"responsive": True},
                                 ),
-                            ]
+                            ],
+                            style={
+                                "width": "47.5vw",
+                                "height": "70vh",
+                                "display": "flex",
+                                "justifyContent": "center",
+                                "borderRadius": "1.5vw",
+                                "backgroundColor": "white",
+                                "border": "0.4vw solid #001F3F",
+                            },
                         ),
-                        outline=True,
                         style={
-                            "width": "32vw",
-                            "height": "18vh",
-                            "borderRadius": "1.5vw",
-                            "border": "0.4vw solid #001F3F",
-                            "margin": "auto",
-                            "text-align": "center",
+                            "height": "70vh",
+                            "display": "flex",
+                            "justifyContent": "center",
+                            "backgroundColor": "#004080",
                         },
+                        md=6,
                     ),
-                    style={
-                        "height": "25vh",
-                        "display": "flex",
-                        "alignItems": "center",
-                        "justifyContent": "center",
-                        "backgroundColor": "#004080",
-                    },
-                    md=6,
-                ),
-            ]
-        ),
-        # Graphiques
-        dbc.Row(
-            [
-                dbc.Col(
+                ]
+            ),
+            dbc.Row(
+                [
                     html.Div(
                         [
                             dcc.Graph(
-                                id="hist-montants-totaux-achats",
+                                id="evol-montant-total-achats",
+                                figure={
+                                    "data": [],
+                                    "layout": gabarits["evol-montant-total-achats"],
+                                },
                                 style={
                                     "width": "96%",
                                     "height": "96%",
@@ -500,160 +1214,297 @@ app.layout = dbc.Container(
                             ),
                         ],
                         style={
-                            "width": "47.5vw",
+                            "width": "96.75vw",
                             "height": "70vh",
                             "display": "flex",
+                            "alignItems": "center",
                             "justifyContent": "center",
                             "borderRadius": "1.5vw",
                             "backgroundColor": "white",
                             "border": "0.4vw solid #001F3F",
                         },
                     ),
-                    style={
-                        "height": "70vh",
-                        "display": "flex",
-                        "justifyContent": "center",
-                        "backgroundColor": "#004080",
-                    },
-                    md=6,
-                ),
+                ],
+                style={
+                    "height": "77vh",
+                    "display": "flex",
+                    "alignItems": "center",
+                    "justifyContent": "center",
+                    "backgroundColor": "#004080",
+                },
+            ),
+            dbc.Row(
                 dbc.Col(
-                    html.Div(
-                        [
-                            dcc.Graph(
-                                id="diag-categorie-produit",
-                                style={
-                                    "width": "96%",
-                                    "height": "96%",
-                                },
-                                config={"responsive": True},
-                            ),
-                        ],
+                    html.P(
+                        "Projet réalisé dans le cadre du cours de Python-Dash, Master 1 ECAP (2024-2025), par Florian CROCHET sous la direction de M. Abdoul Razac SANE.",
                         style={
-                            "width": "47.5vw",
-                            "height": "70vh",
-                            "display": "flex",
-                            "justifyContent": "center",
-                            "borderRadius": "1.5vw",
-                            "backgroundColor": "white",
-                            "border": "0.4vw solid #001F3F",
+                            "textAlign": "center",
+                            "fontStyle": "italic",
+                            "fontSize": "14px",
+                            "color": "white",
                         },
                     ),
                     style={
-                        "height": "70vh",
-                        "display": "flex",
-                        "justifyContent": "center",
+                        "height": "7vh",
                         "backgroundColor": "#004080",
                     },
-                    md=6,
-                ),
-            ]
-        ),
-        dbc.Row(
-            [
-                html.Div(
-                    [
-                        dcc.Graph(
-                            id="evol-montant-total-achats",
-                            style={
-                                "width": "96%",
-                                "height": "96%",
-                            },
-                            config={"responsive": True},
-                        ),
-                    ],
-                    style={
-                        "width": "96.75vw",
-                        "height": "70vh",
-                        "display": "flex",
-                        "alignItems": "center",
-                        "justifyContent": "center",
-                        "borderRadius": "1.5vw",
-                        "backgroundColor": "white",
-                        "border": "0.4vw solid #001F3F",
-                    },
-                ),
-            ],
-            style={
-                "height": "77vh",
-                "display": "flex",
-                "alignItems": "center",
-                "justifyContent": "center",
-                "backgroundColor": "#004080",
-            },
-        ),
-        dbc.Row(
-            dbc.Col(
-                html.P(
-                    "Projet réalisé dans le cadre du cours de Python-Dash, Master 1 ECAP (2024-2025), par Florian CROCHET sous la direction de M. Abdoul Razac SANE.",
-                    style={
-                        "textAlign": "center",
-                        "fontStyle": "italic",
-                        "fontSize": "14px",
-                        "color": "white",
-                    },
-                ),
-                style={
-                    "height": "7vh",
-                    "backgroundColor": "#004080",
-                },
-            )
-        ),
-    ],
-    fluid=True,
+                )
+            ),
+            # Empreinte du contenu affiché par chaque panneau
+            *[dcc.Store(id=f"empreinte-{identifiant}") for identifiant, *_ in panneaux],
+        ],
+        fluid=True,
+    )
+
+
+# Squelette de la page, pour que Dash valide les callbacks sans attendre les
+# données ; la page complète est servie par afficher_interface une fois
+# celles-ci chargées
+app.validation_layout = interface(
+    [], [], (None, None), {identifiant: {} for identifiant, *_ in panneaux}
 )
+app.layout = afficher_interface
 
 
 # =========================================
-# Callbacks pour les éléments interactifs
+# Cache des figures
 # =========================================
 
+# Les sorties de chaque panneau sont mémorisées en JSON dans une base SQLite
+# locale (dashboard_common). La clé contient la version du code et celle du
+# contenu du fichier de données pour ne jamais servir de figure périmée.
 
-@callback(
-    [
-        Output("montant-total-achats", "children"),
-        Output("nombre-total-achats", "children"),
-        Output("hist-montants-totaux-achats", "figure"),
-        Output("diag-categorie-produit", "figure"),
-        Output("evol-montant-total-achats", "figure"),
-    ],
-    [
-        Input("filtre-genre", "value"),
-        Input("filtre-ville", "value"),
-    ],
+chemin_cache = os.environ.get(
+    "CACHE_FIGURES_CHEMIN",
+    os.path.join(tempfile.gettempdir(), "supermarket_sales_figures.sqlite"),
 )
-def update_dashboard(genre, ville):
 
-    df_filtre = df.copy()
+# Fixée par charger_application
+version_donnees = None
+version_application = version_code(__file__)
 
-    if genre and genre != ["all"]:
-        df_filtre = df_filtre[df_filtre["Genre"].isin(genre)]
 
-    if ville and ville != ["all"]:
-        df_filtre = df_filtre[df_filtre["Ville"].isin(ville)]
+def cle_cache(*selections):
+    # Les bornes d'une plage visible (Timestamp) sous leur forme texte
+    return json.dumps([version_application, version_donnees, *selections], default=str)
 
-    # Indicateurs
 
-    indic_montant_total_achats = afficher_montant_total_achats(df_filtre)
+initialiser_cache(chemin_cache)
 
-    indic_nombre_total_achats = afficher_nombre_total_achats(df_filtre)
 
-    # Graphiques
+# =========================================
+# Panneaux précalculés
+# =========================================
 
-    hist_montants_totaux_achats = histogramme_montants_totaux_achats(df_filtre)
+# Le domaine des filtres est petit : chaque sous-ensemble des genres et des
+# villes. Les sorties des panneaux pour ces combinaisons, sur toute la
+# période et sans zoom, peuvent être calculées hors ligne (python -m
+# performance.precompute), une par fichier JSON compressé nommé d'après
+# l'empreinte de sa clé de cache. Avec PRECALCUL_DOSSIER, les callbacks
+# lisent ces fichiers avant le cache et ne calculent plus que les autres
+# sélections (période, zoom). La clé contient l'empreinte du contenu du
+# fichier de données : un fichier précalculé n'est jamais servi pour d'autres
+# données, et reste servi quand le même fichier est redéployé.
+#
+# Au-delà de --maximum combinaisons, les plus demandées (comptées dans la
+# base du cache) sont retenues, puis les plus simples.
+
+
+def combinaisons_filtres():
+    # Combinaisons normalisées des filtres, des plus simples aux plus
+    # complètes ; () désigne toutes les modalités d'un filtre
+    par_filtre = [
+        [
+            selection
+            for taille in range(len(modalites) + 1)
+            for selection in itertools.combinations(modalites, taille)
+        ]
+        for modalites in (
+            [option["value"] for option in options_genre[1:]],
+            [option["value"] for option in options_ville[1:]],
+        )
+    ]
+    return sorted(
+        itertools.product(*par_filtre),
+        key=lambda combinaison: sum(map(len, combinaison)),
+    )
 
-    diag_categorie_produit = diagramme_categorie_produit(df_filtre)
 
-    evol_montant_total_achats = evolution_montant_total_achats(df_filtre)
+def choisir_selections(maximum=maximum_precalcul):
+    # Combinaisons à précalculer : les plus demandées encore possibles, puis
+    # les plus simples, au plus maximum
+    combinaisons = combinaisons_filtres()
+    possibles = set(combinaisons)
+    retenues = {}
+    for selection in itertools.chain(selections_populaires(), combinaisons):
+        if len(retenues) >= maximum:
+            break
+        if selection in possibles:
+            retenues.setdefault(selection, None)
+    if len(retenues) < len(possibles):
+        journal.warning(
+            "Précalcul limité à %d combinaisons de filtres sur %d",
+            len(retenues),
+            len(possibles),
+        )
+    return list(retenues)
+
+
+def precalculer(dossier, maximum=maximum_precalcul):
+    # Écrit les sorties des panneaux des combinaisons retenues, et supprime
+    # celles d'une version précédente des données ; renvoie les combinaisons
+    attendre_donnees()
+    os.makedirs(dossier, exist_ok=True)
+    selections, ecrits = choisir_selections(maximum), set()
+    for genres, villes in selections:
+        for identifiant, _, calcul, entrees in panneaux:
+            parametres = [normaliser(None) for _, normaliser in entrees]
+            cle = cle_cache(identifiant, genres, villes, (None, None), *parametres)
+            texte = to_json_plotly(calcul(genres, villes, (None, None), *parametres))
+            chemin = chemin_precalcul(dossier, cle)
+            ecrire_atomique(chemin, lambda c: ecrire_gzip(c, texte))
+            ecrits.add(os.path.basename(chemin))
+    for nom in os.listdir(dossier):
+        if nom.endswith(".json.gz") and nom not in ecrits:
+            os.remove(os.path.join(dossier, nom))
+    return selections
 
-    return (
-        indic_montant_total_achats,
-        indic_nombre_total_achats,
-        hist_montants_totaux_achats,
-        diag_categorie_produit,
-        evol_montant_total_achats,
+
+# =========================================
+# Callbacks pour les éléments interactifs
+# =========================================
+
+
+# Un panneau dont le contenu n'a pas changé pour la nouvelle sélection n'est
+# pas renvoyé (no_update) : son empreinte (empreinte_contenu) est comparée à
+# celle conservée côté navigateur.
+
+
+def calculer_panneau(identifiant, calcul, genres, villes, periode, *parametres):
+    cle = cle_cache(identifiant, genres, villes, periode, *parametres)
+    texte = lire_precalcul(cle)
+    if texte is not None:
+        incrementer("dashboard_cache_requests_total", result="precalcul")
+        return texte
+    texte = lire_cache(cle)
+    if taille_cache <= 0:
+        resultat = "disabled"
+    else:
+        resultat = "miss" if texte is None else "hit"
+    incrementer("dashboard_cache_requests_total", result=resultat)
+    if texte is None:
+        sortie = calcul(genres, villes, periode, *parametres)
+        with etape("serialisation"):
+            texte = to_json_plotly(sortie)
+        ecrire_cache(cle, texte)
+    return texte
+
+
+def enregistrer_panneau(identifiant, propriete, calcul, entrees):
+    @callback(
+        Output(identifiant, propriete),
+        Output(f"empreinte-{identifiant}", "data"),
+        Input("filtre-genre", "value"),
+        Input("filtre-ville", "value"),
+        Input("filtre-dates", "start_date"),
+        Input("filtre-dates", "end_date"),
+        *[entree for entree, _ in entrees],
+        State(f"empreinte-{identifiant}", "data"),
     )
+    def update_panneau(genre, ville, debut, fin, *valeurs):
+
+        contexte_mesure.callback = identifiant
+        attendre_donnees()
+        *valeurs, empreinte_affichee = valeurs
+        parametres = [
+            normaliser(valeur) for (_, normaliser), valeur in zip(entrees, valeurs)
+        ]
+        genres = normaliser_selection(genre)
+        villes = normaliser_selection(ville)
+        periode = normaliser_periode(debut, fin)
+        # Chaque changement de filtre déclenche le premier panneau : une
+        # seule sélection comptée par changement
+        if identifiant == panneaux[0][0]:
+            compter_selection(genres, villes)
+
+        texte = calculer_panneau(
+            identifiant, calcul, genres, villes, periode, *parametres
+        )
+        empreinte = empreinte_contenu(texte)
+        if empreinte == empreinte_affichee:
+            incrementer("dashboard_panel_unchanged_total", panel=identifiant)
+            return no_update, no_update
+        return json.loads(texte), empreinte
+
+    return update_panneau
+
+
+update_panneaux = {
+    identifiant: enregistrer_panneau(identifiant, propriete, calcul, entrees)
+    for identifiant, propriete, calcul, entrees in panneaux
+}
+
+
+# =========================================
+# Chargement au démarrage
+# =========================================
+
+
+def charger_application():
+    global partitions, bornes_montants, cube, cube_factures_disjointes
+    global options_genre, options_ville, dates, gabarits, version_donnees
+
+    with etape_demarrage("donnees"):
+        partitions = charger_donnees(source_donnees, chemin_donnees, dossier_partitions)
+        version_donnees = empreinte_donnees(chemin_donnees, dossier_partitions)
+
+    # Le cube couvre toute la période : les partitions ne sont relues qu'ici,
+    # les callbacks filtrant ensuite les cellules par date
+    with etape_demarrage("agregats"):
+        bornes_montants, cube = moteurs[moteur_requetes](partitions)
+        # Sans numéros de factures, aucune facture n'est répartie sur plusieurs
+        # cellules : le nombre de factures distinctes est la somme des cellules
+        cube_factures_disjointes = "Factures" not in cube
+
+    with etape_demarrage("options"):
+        colonnes_filtres = source_donnees["colonnes_filtres"]
+        valeurs = lire_options(dossier_partitions) or valeurs_filtres(
+            pd.concat(
+                [lire_partition(s)[colonnes_filtres] for s in partitions.values()]
+            ),
+            colonnes_filtres,
+        )
+        options_genre = [{"label": "Tous les genres", "value": "all"}] + [
+            {"label": g, "value": g} for g in valeurs["Genre"]
+        ]
+        options_ville = [{"label": "Toutes les villes", "value": "all"}] + [
+            {"label": v, "value": v} for v in valeurs["Ville"]
+        ]
+        # Bornes du sélecteur de période
+        dates = (cube["Date"].min().date(), cube["Date"].max().date())
+
+    # Mise en page de chaque figure, affichée dès le chargement de la page
+    with etape_demarrage("gabarits"):
+        gabarits = {
+            # La mise en page ne dépend pas des montants : une vente par
+            # groupe Ville - Genre suffit, sans parcourir toutes les lignes
+            "hist-montants-totaux-achats": gabarit_histogramme(
+                pd.concat(
+                    [
+                        lire_partition(source).drop_duplicates("Ville_Genre")
+                        for source in partitions.values()
+                    ]
+                ).drop_duplicates("Ville_Genre")
+            ),
+            "diag-categorie-produit": gabarit_categorie_produit(cube),
+            "evol-montant-total-achats": gabarit_evolution(cube),
+        }
+        application["interface"] = interface(
+            options_genre, options_ville, dates, gabarits
+        )
+
 
+lancer_demarrage(charger_application)
 
 if __name__ == "__main__":
     app.run(debug=True, port=8000, jupyter_mode="external")
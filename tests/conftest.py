@@ -0,0 +1,63 @@
+# =========================================
+# Données des tests
+# =========================================
+
+# Chaque application est importée une seule fois, sur un petit CSV
+# synthétique (performance.synthetic_data) écrit dans un dossier temporaire,
+# avec le cache des figures désactivé. Les tests comparent ses résultats à
+# ceux de pandas sur le même CSV, lu et nettoyé d'un coup.
+
+import importlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["CACHE_FIGURES_TAILLE"] = "0"
+
+from performance.benchmark import modules
+from performance.synthetic_data import ecrire_csv
+
+lignes_tests = 3000
+
+
+def importer_application(application, chemin):
+    # Les applications lisent DONNEES_CHEMIN à l'import
+    os.environ["DONNEES_CHEMIN"] = chemin
+    try:
+        return importlib.import_module(modules[application])
+    finally:
+        del os.environ["DONNEES_CHEMIN"]
+
+
+@pytest.fixture(scope="session")
+def retail(tmp_path_factory):
+    chemin = str(tmp_path_factory.mktemp("retail") / "retail.csv")
+    ecrire_csv("retail", lignes_tests, chemin, graine=0)
+    return importer_application("retail", chemin)
+
+
+@pytest.fixture(scope="session")
+def ventes_retail(retail):
+    return retail.nettoyer_donnees(pd.read_csv(retail.chemin_donnees, index_col=0))
+
+
+@pytest.fixture(scope="session")
+def supermarche(tmp_path_factory):
+    chemin = str(tmp_path_factory.mktemp("supermarche") / "supermarche.csv")
+    ecrire_csv("supermarche", lignes_tests, chemin, graine=0)
+    # Factures de plusieurs lignes, réparties sur plusieurs cellules du cube
+    # et plusieurs mois
+    data = pd.read_csv(chemin)
+    numeros = np.random.default_rng(0).integers(0, lignes_tests // 3, len(data))
+    data["Invoice ID"] = data["Invoice ID"].to_numpy()[numeros]
+    data.to_csv(chemin, index=False)
+    return importer_application("supermarche", chemin)
+
+
+@pytest.fixture(scope="session")
+def ventes_supermarche(supermarche):
+    return supermarche.nettoyer_donnees(pd.read_csv(supermarche.chemin_donnees))
@@ -0,0 +1,102 @@
+# Cache des figures dans une base SQLite temporaire : lectures, éviction LRU,
+# sélections comptées et clés versionnées par le code
+
+import collections
+import itertools
+
+import pytest
+
+from dashboard_common import dashboard_common
+from dashboard_common.dashboard_common import (
+    compter_selection,
+    ecrire_cache,
+    lire_cache,
+    normaliser_selection,
+    selections_populaires,
+    version_code,
+)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Cache de 3 entrées, désactivé par ailleurs pour les tests ; une horloge
+    # qui avance à chaque lecture ; écritures en attente jamais vidées seules
+    horloge = itertools.count(1000.0)
+    monkeypatch.setattr(dashboard_common, "taille_cache", 3)
+    monkeypatch.setattr(dashboard_common, "intervalle_ecritures", 3600)
+    monkeypatch.setattr(dashboard_common, "acces_en_attente", {})
+    monkeypatch.setattr(
+        dashboard_common, "selections_en_attente", collections.Counter()
+    )
+    monkeypatch.setattr(dashboard_common.time, "time", lambda: next(horloge))
+    monkeypatch.setitem(dashboard_common.base_cache, "chemin", None)
+    dashboard_common.initialiser_cache(str(tmp_path / "cache.sqlite"))
+
+
+def test_lecture(cache):
+    assert lire_cache("a") is None
+    ecrire_cache("a", "figure a")
+    assert lire_cache("a") == "figure a"
+    ecrire_cache("a", "figure a bis")
+    assert lire_cache("a") == "figure a bis"
+
+
+def test_eviction_lru(cache):
+    for cle in ["a", "b", "c"]:
+        ecrire_cache(cle, cle)
+    # Accès noté en attente, écrit avec la figure suivante avant l'éviction
+    assert lire_cache("a") == "a"
+    ecrire_cache("d", "d")
+
+    assert lire_cache("b") is None
+    assert [lire_cache(cle) for cle in ["a", "c", "d"]] == ["a", "c", "d"]
+
+
+def test_cache_desactive(cache, monkeypatch):
+    monkeypatch.setattr(dashboard_common, "taille_cache", 0)
+    ecrire_cache("a", "a")
+    assert lire_cache("a") is None
+
+
+def test_selections_populaires(cache):
+    for selection in [("F",), (), ("F",), ("M", "F"), ("F",), ()]:
+        compter_selection(selection, ())
+
+    assert selections_populaires() == [(("F",), ()), ((), ()), (("M", "F"), ())]
+
+
+@pytest.mark.parametrize("valeurs", [None, [], ["all"], ["all", "all"]])
+def test_selection_complete(valeurs):
+    assert normaliser_selection(valeurs) == ()
+
+
+def test_selection_triee():
+    assert normaliser_selection(["Yangon", "all", "Mandalay", "Yangon"]) == (
+        "Mandalay",
+        "Yangon",
+    )
+
+
+def test_version_du_code(tmp_path, monkeypatch):
+    chemin = tmp_path / "application.py"
+    chemin.write_text("x = 1\n")
+    version = version_code(str(chemin))
+
+    assert version_code(str(chemin)) == version
+    chemin.write_text("x = 2\n")
+    assert version_code(str(chemin)) != version
+    chemin.write_text("x = 1\n")
+    monkeypatch.setattr(dashboard_common, "format_cache", 2)
+    assert version_code(str(chemin)) != version
+
+
+@pytest.mark.parametrize("version", ["version_application", "version_donnees"])
+def test_autre_version_non_servie(cache, supermarche, monkeypatch, version):
+    # Figure calculée par une version précédente du code ou des données
+    selection = ("montant-total-achats", (), (), (None, None))
+    monkeypatch.setattr(supermarche, version, "0" * 16)
+    ecrire_cache(supermarche.cle_cache(*selection), "ancienne figure")
+    assert lire_cache(supermarche.cle_cache(*selection)) == "ancienne figure"
+
+    monkeypatch.setattr(supermarche, version, "1" * 16)
+    assert lire_cache(supermarche.cle_cache(*selection)) is None
@@ -0,0 +1,117 @@
+# Chargement par blocs du CSV : découpage en octets, lecture de chaque bloc
+# et partitions mensuelles, identiques à une lecture en une seule passe
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from dashboard_common import dashboard_common
+
+feather = pytest.importorskip("pyarrow.feather")
+
+applications = ["retail", "supermarche"]
+
+sans_nettoyage = {"nettoyer": lambda data: data}
+
+
+def test_un_seul_bloc_par_defaut(retail, monkeypatch):
+    monkeypatch.setattr(dashboard_common, "lignes_par_bloc", None)
+    assert dashboard_common.blocs_csv(retail.chemin_donnees) == [None]
+
+
+@pytest.mark.parametrize("application", applications)
+@pytest.mark.parametrize("lignes_par_bloc", [1, 7, 1000, 2999, 3000, 10**6])
+def test_blocs_csv(request, monkeypatch, application, lignes_par_bloc):
+    module = request.getfixturevalue(application)
+    chemin = module.chemin_donnees
+    monkeypatch.setattr(dashboard_common, "lignes_par_bloc", lignes_par_bloc)
+
+    blocs = dashboard_common.blocs_csv(chemin)
+
+    with open(chemin, "rb") as fichier:
+        entete = len(fichier.readline())
+        lignes = fichier.read().splitlines(keepends=True)
+    # Blocs contigus, de l'en-tête à la fin du fichier
+    assert blocs[0][0] == entete
+    assert blocs[-1][1] == os.path.getsize(chemin)
+    assert all(a[1] == b[0] for a, b in zip(blocs, blocs[1:]))
+    # lignes_par_bloc lignes par bloc, le dernier excepté
+    fins = [entete]
+    for ligne in lignes:
+        fins.append(fins[-1] + len(ligne))
+    for numero, (debut, fin, premiere_ligne) in enumerate(blocs):
+        assert premiere_ligne == numero * lignes_par_bloc
+        assert debut == fins[premiere_ligne]
+        assert fin == fins[min(premiere_ligne + lignes_par_bloc, len(lignes))]
+
+
+@pytest.mark.parametrize("application", applications)
+def test_lecture_par_blocs(request, monkeypatch, application):
+    module = request.getfixturevalue(application)
+    source = {**module.source_donnees, **sans_nettoyage}
+    monkeypatch.setattr(dashboard_common, "lignes_par_bloc", 700)
+
+    lues = pd.concat(
+        [
+            dashboard_common.lire_bloc_csv(source, module.chemin_donnees, bloc)
+            for bloc in dashboard_common.blocs_csv(module.chemin_donnees)
+        ]
+    )
+
+    pd.testing.assert_frame_equal(
+        lues, pd.read_csv(module.chemin_donnees, index_col=source["index_col"])
+    )
+
+
+def test_csv_sans_fin_de_ligne_finale(tmp_path, monkeypatch):
+    chemin = tmp_path / "ventes.csv"
+    chemin.write_bytes(b"a,b\n1,2\n3,4\n5,6")
+    monkeypatch.setattr(dashboard_common, "lignes_par_bloc", 2)
+
+    blocs = dashboard_common.blocs_csv(str(chemin))
+    lues = pd.concat(
+        [
+            dashboard_common.lire_bloc_csv(
+                {"index_col": None, **sans_nettoyage}, str(chemin), bloc
+            )
+            for bloc in blocs
+        ]
+    )
+
+    assert [(debut, fin) for debut, fin, _ in blocs] == [(4, 12), (12, 15)]
+    pd.testing.assert_frame_equal(lues, pd.read_csv(chemin))
+
+
+def ecrire(module, dossier, monkeypatch, lignes_par_bloc, processus):
+    monkeypatch.setattr(dashboard_common, "lignes_par_bloc", lignes_par_bloc)
+    monkeypatch.setattr(dashboard_common, "processus_chargement", processus)
+    os.makedirs(dossier)
+    manifeste = dashboard_common.ecrire_partitions(
+        module.source_donnees, module.chemin_donnees, str(dossier)
+    )
+    return manifeste, {
+        mois: feather.read_feather(os.path.join(dossier, f"{mois}.feather"))
+        for mois in manifeste["partitions"]
+    }
+
+
+@pytest.mark.parametrize("application", applications)
+@pytest.mark.parametrize("lignes_par_bloc, processus", [(700, 1), (250, 2)])
+def test_partitions_par_blocs_comme_en_une_passe(
+    request, monkeypatch, tmp_path, application, lignes_par_bloc, processus
+):
+    module = request.getfixturevalue(application)
+
+    manifeste, partitions = ecrire(module, tmp_path / "passe", monkeypatch, None, 1)
+    manifeste_blocs, partitions_blocs = ecrire(
+        module, tmp_path / "blocs", monkeypatch, lignes_par_bloc, processus
+    )
+
+    assert json.dumps(manifeste_blocs, sort_keys=True) == json.dumps(
+        manifeste, sort_keys=True
+    )
+    assert list(partitions_blocs) == list(partitions)
+    for mois in partitions:
+        pd.testing.assert_frame_equal(partitions_blocs[mois], partitions[mois])
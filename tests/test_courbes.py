@@ -0,0 +1,98 @@
+# Sous-échantillonnage LTTB et plage visible des courbes d'évolution,
+# comparés à l'algorithme de référence écrit point par point
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard_common.dashboard_common import (
+    choisir_granularite,
+    lttb,
+    plage_visible,
+)
+
+
+def lttb_reference(x, y, nombre):
+    # Largest-Triangle-Three-Buckets (Steinarsson, 2013)
+    n = len(x)
+    if nombre >= n or nombre < 3:
+        return list(range(n))
+    taille = (n - 2) / (nombre - 2)
+    retenus, a = [0], 0
+    for i in range(nombre - 2):
+        debut_suivant = int((i + 1) * taille) + 1
+        fin_suivant = min(int((i + 2) * taille) + 1, n)
+        cx = sum(x[debut_suivant:fin_suivant]) / (fin_suivant - debut_suivant)
+        cy = sum(y[debut_suivant:fin_suivant]) / (fin_suivant - debut_suivant)
+        meilleur, aire_max = None, -1.0
+        for j in range(int(i * taille) + 1, debut_suivant):
+            aire = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if aire > aire_max:
+                meilleur, aire_max = j, aire
+        retenus.append(meilleur)
+        a = meilleur
+    return retenus + [n - 1]
+
+
+@pytest.mark.parametrize("n, nombre", [(10, 3), (100, 7), (1000, 50), (5003, 500)])
+@pytest.mark.parametrize("graine", [0, 1])
+def test_lttb_comme_reference(n, nombre, graine):
+    rng = np.random.default_rng(graine)
+    x = np.cumsum(rng.integers(1, 5, n)).astype(float)
+    y = np.cumsum(rng.normal(size=n))
+
+    retenus = lttb(x, y, nombre)
+
+    assert list(retenus) == lttb_reference(list(x), list(y), nombre)
+    assert len(retenus) == nombre
+    assert retenus[0] == 0 and retenus[-1] == n - 1
+    assert (np.diff(retenus) > 0).all()
+
+
+def test_lttb_sur_des_dates():
+    x = pd.date_range("2019-01-01", periods=400, freq="D")
+    y = np.sin(np.arange(400) / 10)
+
+    retenus = lttb(x.to_numpy(), y, 40)
+
+    assert list(retenus) == lttb_reference(
+        list(x.to_numpy().astype(np.float64)), list(y), 40
+    )
+
+
+@pytest.mark.parametrize("nombre", [0, 2, 20, 25])
+def test_lttb_sans_reduction(nombre):
+    # Assez de place pour tous les points, ou trop peu pour trois seaux
+    assert list(lttb(np.arange(20.0), np.ones(20), nombre)) == list(range(20))
+
+
+@pytest.mark.parametrize(
+    "relayout, attendu",
+    [
+        (None, None),
+        ({}, None),
+        ({"xaxis.autorange": True}, None),
+        ({"autosize": True}, None),
+        (
+            {"xaxis.range[0]": "2019-02-01", "xaxis.range[1]": "2019-03-15 12:00"},
+            (pd.Timestamp("2019-02-01"), pd.Timestamp("2019-03-15 12:00")),
+        ),
+        (
+            {"xaxis.range": ["2019-02-01 06:30:00.5", "2019-10-01"]},
+            (pd.Timestamp("2019-02-01 06:30:00.5"), pd.Timestamp("2019-10-01")),
+        ),
+        # Une seule borne : zoom incomplet, toute la période
+        ({"xaxis.range[0]": "2019-02-01"}, None),
+    ],
+)
+def test_plage_visible(relayout, attendu):
+    assert plage_visible(relayout) == attendu
+
+
+@pytest.mark.parametrize(
+    "jours, granularite",
+    [(1, "jour"), (62, "jour"), (63, "semaine"), (730, "semaine"), (731, "mois")],
+)
+def test_choisir_granularite(jours, granularite):
+    debut = pd.Timestamp("2019-01-01")
+    assert choisir_granularite(debut, debut + pd.Timedelta(days=jours)) == granularite
@@ -0,0 +1,70 @@
+# Cube des ventes du supermarché, construit partition par partition :
+# montants, nombres de ventes et factures distinctes d'une sélection,
+# comparés à pandas sur toutes les lignes
+
+import numpy as np
+import pytest
+
+tous = (None, None)
+
+selections = [
+    ((), (), tous),
+    (("Homme",), (), tous),
+    ((), ("Yangon", "Mandalay"), tous),
+    (("Femme",), ("Naypyitaw",), tous),
+    ((), (), ("2019-02-01", "2019-02-28")),
+    (("Homme",), ("Yangon",), ("2019-01-15", "2019-03-10")),
+    ((), (), ("2019-03-31", None)),
+    ((), (), (None, "2019-01-01")),
+]
+
+
+def ventes_de_la_selection(data, genres, villes, periode):
+    masque = np.ones(len(data), dtype=bool)
+    if genres:
+        masque &= data["Genre"].isin(genres)
+    if villes:
+        masque &= data["Ville"].isin(villes)
+    debut, fin = periode
+    if debut:
+        masque &= data["Date"] >= debut
+    if fin:
+        masque &= data["Date"] <= fin
+    return data[masque]
+
+
+def test_factures_reparties_sur_plusieurs_cellules(supermarche):
+    # Les factures de la sélection ne peuvent pas être sommées par cellule
+    assert not supermarche.cube_factures_disjointes
+
+
+@pytest.mark.parametrize("genres, villes, periode", selections, ids=str)
+def test_selection_comme_pandas(
+    supermarche, ventes_supermarche, genres, villes, periode
+):
+    cellules = supermarche.selectionner_cellules(
+        supermarche.cube, genres, villes, periode
+    )
+    reference = ventes_de_la_selection(ventes_supermarche, genres, villes, periode)
+
+    assert cellules["Nombre"].sum() == len(reference)
+    assert cellules["Montant total"].sum() == pytest.approx(
+        reference["Montant total"].sum()
+    )
+    assert supermarche.afficher_nombre_total_achats(
+        cellules
+    ) == supermarche.format_entier(reference["ID Facture"].nunique())
+
+
+@pytest.mark.parametrize("graine", [0, 1, 2])
+def test_factures_par_cellule(supermarche, graine):
+    rng = np.random.default_rng(graine)
+    cellules = rng.integers(0, 50, 2000)
+    numeros = rng.integers(0, 300, 2000)
+
+    # La dernière cellule n'a aucune facture
+    factures = supermarche.factures_par_cellule(cellules, numeros, 51)
+
+    assert len(factures) == 51
+    for cellule in range(51):
+        assert list(factures[cellule]) == sorted(set(numeros[cellules == cellule]))
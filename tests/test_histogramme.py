@@ -0,0 +1,53 @@
+# Histogramme des montants du supermarché : effectifs par classe calculés
+# dans le cube, comparés à np.histogram sur les lignes de la sélection
+
+import numpy as np
+import pytest
+
+from test_cube import selections, ventes_de_la_selection
+
+
+@pytest.mark.parametrize("graine", [0, 1])
+def test_classes_comme_np_histogram(supermarche, graine):
+    montants = np.random.default_rng(graine).uniform(10, 1000, 5000)
+    bornes = np.histogram_bin_edges(montants, bins=supermarche.nombre_classes)
+    # Montants sur les bornes, dont le maximum, dans la dernière classe
+    montants = np.concatenate([montants, bornes, bornes[1:-1] - 1e-9])
+
+    classes = supermarche.classes_montants(montants, bornes)
+
+    assert list(np.bincount(classes, minlength=len(bornes) - 1)) == list(
+        np.histogram(montants, bornes)[0]
+    )
+    assert supermarche.classes_montants(bornes[-1:], bornes)[0] == len(bornes) - 2
+    assert list(supermarche.classes_montants(bornes[:-1], bornes)) == list(
+        range(len(bornes) - 1)
+    )
+
+
+def test_bornes_sur_les_extremes(supermarche, ventes_supermarche):
+    assert supermarche.bornes_montants[0] == ventes_supermarche["Montant total"].min()
+    assert supermarche.bornes_montants[-1] == ventes_supermarche["Montant total"].max()
+
+
+@pytest.mark.parametrize("genres, villes, periode", selections, ids=str)
+def test_histogramme_comme_np_histogram(
+    supermarche, ventes_supermarche, genres, villes, periode
+):
+    cellules = supermarche.selectionner_cellules(
+        supermarche.cube, genres, villes, periode
+    )
+    reference = ventes_de_la_selection(ventes_supermarche, genres, villes, periode)
+
+    traces = supermarche.histogramme_montants_totaux_achats(cellules)
+
+    groupes = reference.groupby(["Ville", "Genre"], observed=True)["Montant total"]
+    assert sorted(trace["name"] for trace in traces) == sorted(
+        f"{ville} - {genre}" for ville, genre in groupes.groups
+    )
+    for trace in traces:
+        ville, genre = trace["name"].split(" - ")
+        montants = groupes.get_group((ville, genre))
+        assert list(trace["y"]) == list(
+            np.histogram(montants, supermarche.bornes_montants)[0]
+        )
@@ -0,0 +1,50 @@
+# Indicateurs du mois du retail : mois de référence et comparaison au mois
+# précédent, y compris sans aucune vente datée
+
+import pandas as pd
+import pytest
+
+tous = (None, None)
+
+
+def test_mois_de_reference(retail, ventes_retail):
+    dernier = ventes_retail["Transaction_Date"].max()
+
+    assert retail.mois_de_reference(retail.etat, tous) == pd.Timestamp(
+        dernier.strftime("%Y-%m")
+    )
+    assert retail.mois_de_reference(
+        retail.etat, ("2019-01-01", "2019-03-15")
+    ) == pd.Timestamp("2019-03")
+
+
+@pytest.mark.parametrize("mois", ["2019-03", "2019-07"])
+def test_indicateur_comme_pandas(retail, ventes_retail, mois):
+    mensuel = retail.series_de_la_selection(retail.etat, "mois", ())
+    courant = pd.Timestamp(mois)
+    dates = ventes_retail["Transaction_Date"].dt.to_period("M")
+
+    trace = retail.plot_chiffre_affaire_mois(mensuel, courant)[0]
+
+    assert trace["value"] == pytest.approx(
+        ventes_retail.loc[dates == mois, "Total_price"].sum()
+    )
+    assert trace["delta"]["reference"] == pytest.approx(
+        ventes_retail.loc[
+            dates == (courant - pd.DateOffset(months=1)).strftime("%Y-%m"),
+            "Total_price",
+        ].sum()
+    )
+
+
+def test_sans_vente_datee(retail):
+    # Seule la partition des dates invalides : mois courant, indicateurs à zéro
+    etat = {**retail.etat, "partitions": {"NaT": None}}
+    mensuel = retail.series_de_la_selection(retail.etat, "mois", ()).iloc[:0]
+
+    mois = retail.mois_de_reference(etat, tous)
+
+    assert mois == pd.Timestamp(pd.Timestamp.today().strftime("%Y-%m"))
+    for plot in (retail.plot_chiffre_affaire_mois, retail.plot_vente_mois):
+        trace = plot(mensuel, mois)[0]
+        assert trace["value"] == 0 and trace["delta"]["reference"] == 0
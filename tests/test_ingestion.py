@@ -0,0 +1,74 @@
+# Ingestion des fichiers de ventes déposés dans INGESTION_DOSSIER : nouvelle
+# version des données, lignes visibles dans les séries et la table, fichiers
+# illisibles ignorés
+
+import logging
+
+import pytest
+
+from performance.synthetic_data import ecrire_csv
+
+tous = (None, None)
+
+
+@pytest.fixture
+def ingestion(retail, tmp_path, monkeypatch):
+    # L'état et le suivi de l'ingestion sont rétablis après chaque test
+    dossier = tmp_path / "ingestion"
+    dossier.mkdir()
+    monkeypatch.setattr(retail, "etat", retail.etat)
+    monkeypatch.setattr(retail, "dossier_ingestion", str(dossier))
+    monkeypatch.setitem(retail.suivi_ingestion, "fichiers", set())
+    return dossier
+
+
+def nombre_de_ventes(retail):
+    series = retail.series_de_la_selection(retail.etat, "mois", ())
+    _, total = retail.interroger_ventes(retail.etat, (), tous, "", [], 0, 10)
+    return int(series["Nombre"].sum()), total
+
+
+def test_nouveau_fichier(retail, ingestion):
+    ecrire_csv("retail", 200, str(ingestion / "lot-1.csv"), graine=2)
+    version = retail.etat["version"]
+    avant = nombre_de_ventes(retail)
+
+    retail.integrer_nouvelles_ventes()
+
+    assert retail.etat["version"] != version
+    assert nombre_de_ventes(retail) == (avant[0] + 200, avant[1] + 200)
+
+    # Un fichier n'est intégré qu'une fois
+    version = retail.etat["version"]
+    retail.integrer_nouvelles_ventes()
+    assert retail.etat["version"] == version
+
+
+@pytest.mark.parametrize(
+    "contenu",
+    [
+        "a,b\n1,2\n",
+        "Transaction_ID,Transaction_Date\n1,pas une date\n",
+        "\x00\x01\x02",
+    ],
+    ids=["colonnes", "date", "binaire"],
+)
+def test_fichier_illisible(retail, ingestion, caplog, contenu):
+    (ingestion / "lot-1.csv").write_text(contenu)
+    ecrire_csv("retail", 100, str(ingestion / "lot-2.csv"), graine=3)
+    avant = nombre_de_ventes(retail)
+
+    with caplog.at_level(logging.ERROR):
+        retail.integrer_nouvelles_ventes()
+
+    # Journalisé, ignoré, sans empêcher l'intégration des autres fichiers
+    assert [r.message for r in caplog.records] == [
+        f"{ingestion / 'lot-1.csv'} ignoré : ventes illisibles"
+    ]
+    assert nombre_de_ventes(retail) == (avant[0] + 100, avant[1] + 100)
+
+    # Ni réessayé au passage suivant
+    caplog.clear()
+    with caplog.at_level(logging.ERROR):
+        retail.integrer_nouvelles_ventes()
+    assert not caplog.records
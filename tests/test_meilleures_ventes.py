@@ -0,0 +1,81 @@
+# Classement des meilleures ventes par groupe (np.bincount sur les codes
+# catégoriels), comparé à un groupby de pandas
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def classement_reference(data, groupe, cle, metrique, top, ascending):
+    colonne = {"count": None, "revenue": "Total_price", "quantity": "Quantity"}[
+        metrique
+    ]
+    regroupement = data.groupby([groupe, cle], observed=True)
+    totaux = (
+        regroupement.size() if colonne is None else regroupement[colonne].sum()
+    ).rename(metrique)
+    # À total égal, dans l'ordre des clés
+    return (
+        totaux.reset_index()
+        .sort_values(
+            [groupe, metrique, cle], ascending=[True, ascending, True], kind="stable"
+        )
+        .groupby(groupe, observed=True)
+        .head(top)
+        .set_index([groupe, cle])[metrique]
+    )
+
+
+@pytest.mark.parametrize("metrique", ["count", "revenue", "quantity"])
+@pytest.mark.parametrize("top", [1, 3, 10, 100])
+@pytest.mark.parametrize("ascending", [False, True])
+def test_classement_comme_pandas(retail, ventes_retail, metrique, top, ascending):
+    for groupe, cle in [("Gender", "Product_Category"), ("Location", "Gender")]:
+        couples = retail.totaux_par_couple(ventes_retail, groupe, cle, metrique)
+        resultat = retail.classer_par_groupe(
+            couples, groupe, cle, metrique, top=top, ascending=ascending
+        )
+        reference = classement_reference(
+            ventes_retail, groupe, cle, metrique, top, ascending
+        )
+
+        assert list(resultat.index) == list(reference.index)
+        np.testing.assert_allclose(resultat.to_numpy(), reference.to_numpy())
+
+
+def test_colonnes_non_categorielles(retail, ventes_retail):
+    data = ventes_retail.astype({"Gender": str, "Product_Category": str})
+    couples = retail.totaux_par_couple(data, "Gender", "Product_Category")
+    resultat = retail.classer_par_groupe(couples, "Gender", "Product_Category", top=5)
+    reference = classement_reference(
+        data, "Gender", "Product_Category", "count", 5, False
+    )
+
+    assert list(resultat.index) == list(reference.index)
+    assert list(resultat) == list(reference)
+
+
+def test_valeurs_manquantes_ignorees(retail, ventes_retail):
+    data = ventes_retail.copy()
+    data.loc[data.index[::7], "Product_Category"] = np.nan
+    couples = retail.totaux_par_couple(data, "Gender", "Product_Category")
+
+    assert couples["count"].sum() == data["Product_Category"].notna().sum()
+
+
+def test_frequence_meilleure_vente(retail, ventes_retail):
+    couples = retail.totaux_par_couple(ventes_retail, "Gender", "Product_Category")
+    resultat = retail.frequence_meilleure_vente(couples, top=4)
+    reference = pd.crosstab(
+        [ventes_retail["Gender"], ventes_retail["Product_Category"]], "Total vente"
+    )["Total vente"]
+
+    assert resultat.index.names == ["Sexe", "Categorie du produit"]
+    assert (resultat.groupby(level="Sexe").size() == 4).all()
+    for (sexe, categorie), nombre in resultat["Total vente"].items():
+        assert nombre == reference[(sexe, categorie)]
+        # Aucune catégorie hors du classement n'a vendu plus
+        assert (
+            nombre
+            >= reference[sexe].drop(resultat.loc[sexe].index, errors="ignore").max()
+        )
@@ -0,0 +1,129 @@
+# Route /metrics : compteurs et histogramme de durée des callbacks au format
+# texte de Prometheus, après des requêtes de callback réelles
+
+import json
+import math
+import re
+
+import pytest
+
+panneau = "montant-total-achats"
+
+ligne_echantillon = re.compile(
+    r"(?P<nom>[a-zA-Z_:][a-zA-Z0-9_:]*)"
+    r"(?:\{(?P<etiquettes>[a-zA-Z_][a-zA-Z0-9_]*=\"[^\"]*\""
+    r"(?:,[a-zA-Z_][a-zA-Z0-9_]*=\"[^\"]*\")*)\})?"
+    r" (?P<valeur>\S+)"
+)
+
+
+def lire_exposition(texte):
+    # {nom: type} et [(nom, {étiquette: valeur}, valeur)], chaque ligne
+    # vérifiée au passage
+    types, echantillons = {}, []
+    assert texte.endswith("\n")
+    for ligne in texte.splitlines():
+        if ligne.startswith("# HELP "):
+            assert len(ligne.split(" ", 3)) == 4
+        elif ligne.startswith("# TYPE "):
+            _, _, nom, type_metrique = ligne.split(" ")
+            assert type_metrique in ("counter", "gauge", "histogram")
+            assert nom not in types
+            types[nom] = type_metrique
+        else:
+            correspondance = ligne_echantillon.fullmatch(ligne)
+            assert correspondance, ligne
+            etiquettes = dict(
+                re.findall(r'([a-zA-Z_][a-zA-Z0-9_]*)="([^"]*)"', ligne.split(" ")[0])
+            )
+            valeur = float(correspondance["valeur"])
+            assert not math.isnan(valeur)
+            echantillons.append((correspondance["nom"], etiquettes, valeur))
+    return types, echantillons
+
+
+def appeler_callback(client, empreinte_affichee=None):
+    sorties = f"{panneau}.children", f"empreinte-{panneau}.data"
+    return client.post(
+        "/_dash-update-component",
+        json={
+            "output": f"..{sorties[0]}...{sorties[1]}..",
+            "outputs": [
+                {"id": sortie.split(".")[0], "property": sortie.split(".")[1]}
+                for sortie in sorties
+            ],
+            "inputs": [
+                {"id": "filtre-genre", "property": "value", "value": None},
+                {"id": "filtre-ville", "property": "value", "value": ["Yangon"]},
+                {"id": "filtre-dates", "property": "start_date", "value": None},
+                {"id": "filtre-dates", "property": "end_date", "value": None},
+            ],
+            "state": [
+                {
+                    "id": f"empreinte-{panneau}",
+                    "property": "data",
+                    "value": empreinte_affichee,
+                }
+            ],
+            "changedPropIds": ["filtre-ville.value"],
+        },
+    )
+
+
+@pytest.fixture(scope="module")
+def exposition(supermarche):
+    client = supermarche.server.test_client()
+    reponse = appeler_callback(client)
+    assert reponse.status_code == 200
+    empreinte = json.loads(reponse.data)["response"][f"empreinte-{panneau}"]["data"]
+    # Même contenu que celui affiché : panneau non renvoyé
+    assert appeler_callback(client, empreinte).status_code == 204
+
+    reponse = client.get("/metrics")
+    assert reponse.status_code == 200
+    assert reponse.mimetype == "text/plain"
+    return lire_exposition(reponse.get_data(as_text=True))
+
+
+def test_types(exposition):
+    types, echantillons = exposition
+    assert types["dashboard_cache_requests_total"] == "counter"
+    assert types["dashboard_panel_unchanged_total"] == "counter"
+    assert types["dashboard_callback_duration_seconds"] == "histogram"
+    # Chaque échantillon appartient à une métrique déclarée
+    for nom, _, _ in echantillons:
+        assert re.sub(r"_(bucket|sum|count)$", "", nom) in types
+
+
+def test_compteurs(exposition):
+    _, echantillons = exposition
+    valeurs = {
+        (nom, tuple(sorted(etiquettes.items()))): valeur
+        for nom, etiquettes, valeur in echantillons
+    }
+    assert valeurs[("dashboard_cache_requests_total", (("result", "disabled"),))] >= 2
+    assert valeurs[("dashboard_panel_unchanged_total", (("panel", panneau),))] >= 1
+
+
+def test_histogramme_des_durees(exposition):
+    _, echantillons = exposition
+    du_panneau = [
+        (nom, etiquettes, valeur)
+        for nom, etiquettes, valeur in echantillons
+        if nom.startswith("dashboard_callback_duration_seconds")
+        and etiquettes.get("callback") == panneau
+    ]
+    seaux = [
+        (float(etiquettes["le"]), valeur)
+        for nom, etiquettes, valeur in du_panneau
+        if nom.endswith("_bucket")
+    ]
+    (nombre,) = [v for nom, _, v in du_panneau if nom.endswith("_count")]
+    (somme,) = [v for nom, _, v in du_panneau if nom.endswith("_sum")]
+
+    # Seaux croissants et cumulés, le dernier (+Inf) comptant toutes les requêtes
+    assert [borne for borne, _ in seaux] == sorted(borne for borne, _ in seaux)
+    assert seaux[-1][0] == math.inf
+    assert all(a <= b for (_, a), (_, b) in zip(seaux, seaux[1:]))
+    assert seaux[-1][1] == nombre >= 2
+    assert somme > 0
@@ -0,0 +1,81 @@
+# Moteurs de requêtes : les agrégats calculés par DuckDB sont ceux de pandas
+# (séries et couples du retail, cube du supermarché)
+
+import pandas as pd
+import pytest
+
+from dashboard_common import dashboard_common
+
+tous = (None, None)
+
+periodes = [
+    tous,
+    ("2019-03-10", "2019-05-20"),
+    ("2019-12-31", None),
+    (None, "2019-01-04"),
+]
+
+
+@pytest.fixture(autouse=True)
+def duckdb(monkeypatch):
+    # duckdb n'est importé par dashboard_common que s'il est choisi au démarrage
+    module = pytest.importorskip("duckdb")
+    monkeypatch.setattr(dashboard_common, "duckdb", module, raising=False)
+    return module
+
+
+@pytest.mark.parametrize("granularite", ["jour", "semaine", "mois"])
+@pytest.mark.parametrize("locations", [(), ("Chicago",), ("California", "New York")])
+@pytest.mark.parametrize("periode", periodes)
+def test_series(retail, granularite, locations, periode):
+    pd.testing.assert_frame_equal(
+        retail.series_duckdb(retail.etat, granularite, locations, periode),
+        retail.series_pandas(retail.etat, granularite, locations, periode),
+        check_exact=False,
+    )
+
+
+@pytest.mark.parametrize(
+    "groupe, cle",
+    [
+        ("Gender", "Product_Category"),
+        ("Location", "Product_Category"),
+        ("Product_Category", "Location"),
+    ],
+)
+@pytest.mark.parametrize("metrique", ["count", "revenue", "quantity"])
+@pytest.mark.parametrize("locations", [(), ("Chicago",)])
+@pytest.mark.parametrize("periode", periodes[:2])
+def test_couples(retail, groupe, cle, metrique, locations, periode):
+    # Mêmes couples, dans un ordre quelconque
+    couples = [
+        moteur(retail.etat, groupe, cle, locations, periode, metrique)
+        .sort_values([groupe, cle])
+        .reset_index(drop=True)
+        for moteur in (retail.couples_duckdb, retail.couples_pandas)
+    ]
+    pd.testing.assert_frame_equal(*couples, check_exact=False)
+
+
+def test_cube(supermarche):
+    bornes, cube = supermarche.cube_duckdb(supermarche.partitions)
+    bornes_pandas, cube_pandas = supermarche.cube_pandas(supermarche.partitions)
+
+    assert list(bornes) == pytest.approx(list(bornes_pandas))
+    # Les factures sont numérotées différemment par les deux moteurs : seules
+    # les factures distinctes d'une sélection sont comparées
+    pd.testing.assert_frame_equal(
+        cube.drop(columns="Factures"),
+        cube_pandas.drop(columns="Factures"),
+        check_exact=False,
+    )
+    for genres, villes, periode in [
+        ((), (), tous),
+        (("Femme",), ("Naypyitaw",), tous),
+        (("Homme",), ("Yangon",), ("2019-01-15", "2019-03-10")),
+    ]:
+        assert supermarche.afficher_nombre_total_achats(
+            supermarche.selectionner_cellules(cube, genres, villes, periode)
+        ) == supermarche.afficher_nombre_total_achats(
+            supermarche.selectionner_cellules(cube_pandas, genres, villes, periode)
+        )
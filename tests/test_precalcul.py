@@ -0,0 +1,70 @@
+# Panneaux précalculés : servis par les callbacks à la place d'un calcul, à
+# l'identique, y compris quand relayoutData ne change pas la plage visible
+
+import pytest
+
+from dashboard_common import dashboard_common
+
+applications = ["retail", "supermarche"]
+
+precalcul = (("result", "precalcul"),)
+
+
+@pytest.fixture(scope="module", params=applications)
+def precalcule(request, tmp_path_factory):
+    module = request.getfixturevalue(request.param)
+    dossier = str(tmp_path_factory.mktemp(f"precalcul-{request.param}"))
+    return module, dossier, module.precalculer(dossier, 4)
+
+
+def appeler(module, identifiant, selection, relayout=None):
+    # Callback du panneau tel qu'appelé par le navigateur, sans contenu affiché
+    entrees = {i: entrees for i, *_, entrees in module.panneaux}[identifiant]
+    return module.update_panneaux[identifiant](
+        *[list(valeurs) or None for valeurs in selection],
+        None,
+        None,
+        *[relayout] * len(entrees),
+        None,
+    )
+
+
+def lectures_precalculees():
+    return dashboard_common.mesures["dashboard_cache_requests_total"].get(precalcul, 0)
+
+
+def test_comme_en_direct(precalcule, monkeypatch):
+    module, dossier, selections = precalcule
+    assert len(selections) == 4
+
+    for selection in selections:
+        for identifiant, *_ in module.panneaux:
+            monkeypatch.setattr(dashboard_common, "dossier_precalcul", dossier)
+            avant = lectures_precalculees()
+            servi = appeler(module, identifiant, selection)
+            assert lectures_precalculees() == avant + 1
+
+            monkeypatch.setattr(dashboard_common, "dossier_precalcul", None)
+            assert servi == appeler(module, identifiant, selection)
+
+
+@pytest.mark.parametrize(
+    "relayout, precalculee",
+    [
+        (None, True),
+        ({"autosize": True}, True),
+        ({"xaxis.autorange": True}, True),
+        ({"yaxis.range[0]": 0, "yaxis.range[1]": 5000}, True),
+        ({"dragmode": "pan"}, True),
+        ({"xaxis.range[0]": "2019-02-01", "xaxis.range[1]": "2019-03-01"}, False),
+    ],
+)
+def test_evolution_sans_zoom(precalcule, monkeypatch, relayout, precalculee):
+    module, dossier, selections = precalcule
+    monkeypatch.setattr(dashboard_common, "dossier_precalcul", dossier)
+    identifiant = module.panneaux[-1][0]
+
+    avant = lectures_precalculees()
+    appeler(module, identifiant, selections[0], relayout)
+
+    assert lectures_precalculees() == avant + precalculee
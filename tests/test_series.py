@@ -0,0 +1,55 @@
+# Séries temporelles du retail complétées par de nouvelles ventes, comparées
+# à des séries reconstruites sur toutes les lignes
+
+import pandas as pd
+import pytest
+
+from performance.synthetic_data import ecrire_csv
+
+tous = (None, None)
+
+granularites = ["jour", "semaine", "mois"]
+
+
+def comparer_series(series, reference):
+    for granularite in granularites:
+        pd.testing.assert_frame_equal(
+            series[granularite].sort_index(),
+            reference[granularite].sort_index(),
+            check_exact=False,
+        )
+
+
+@pytest.fixture(scope="module")
+def nouvelles_ventes(retail, tmp_path_factory):
+    chemin = str(tmp_path_factory.mktemp("nouvelles") / "ventes.csv")
+    ecrire_csv("retail", 500, chemin, graine=1)
+    return retail.nettoyer_donnees(pd.read_csv(chemin, index_col=0))
+
+
+@pytest.mark.parametrize("coupure", [1, 1500, 2999])
+def test_ajouter_aux_series(retail, ventes_retail, coupure):
+    series = retail.construire_series_temporelles(ventes_retail.iloc[:coupure])
+
+    comparer_series(
+        retail.ajouter_aux_series(series, ventes_retail.iloc[coupure:]),
+        retail.construire_series_temporelles(ventes_retail),
+    )
+
+
+def test_etendre_etat(retail, ventes_retail, nouvelles_ventes):
+    toutes = pd.concat([ventes_retail, nouvelles_ventes])
+
+    etat = retail.etendre_etat(retail.etat, nouvelles_ventes, "version")
+
+    comparer_series(etat["series"], retail.construire_series_temporelles(toutes))
+    # Partitions complétées, chacune toujours triée par date
+    lignes = retail.ventes_de_la_selection(etat, (), tous)
+    assert len(lignes) == len(toutes)
+    for mois in etat["partitions"]:
+        dates = retail.lire_partition(etat["partitions"][mois])["Transaction_Date"]
+        assert dates.is_monotonic_increasing
+    # L'état d'origine n'est pas modifié
+    assert len(retail.ventes_de_la_selection(retail.etat, (), tous)) == len(
+        ventes_retail
+    )
@@ -0,0 +1,125 @@
+# Pagination, tri et filtres (filter_query) de la table des ventes côté
+# serveur, comparés aux mêmes opérations faites par pandas sur toutes les
+# lignes
+
+import pandas as pd
+import pytest
+
+tous = (None, None)
+
+
+@pytest.fixture(scope="module")
+def affichage(ventes_retail):
+    # Colonnes telles qu'affichées : date du jour, prix au centime.
+    # Les plus récentes d'abord, comme la table
+    return ventes_retail.assign(
+        Date=ventes_retail["Transaction_Date"].dt.strftime("%Y-%m-%d"),
+        Avg_Price=ventes_retail["Avg_Price"].astype(float).round(2),
+    ).iloc[::-1]
+
+
+def interroger(retail, filtre="", tri=(), locations=(), periode=tous, page=None):
+    debut, fin = page or (0, len(retail.etat["modele"]) + 10**9)
+    return retail.interroger_ventes(
+        retail.etat, locations, periode, filtre, list(tri), debut, fin
+    )
+
+
+filtres = [
+    ("{Quantity} ge 10", lambda d: d["Quantity"] >= 10),
+    ("{Quantity} = 3", lambda d: d["Quantity"] == 3),
+    ("{Quantity} eq 3", lambda d: d["Quantity"] == 3),
+    ("{Avg_Price} lt 100.5", lambda d: d["Avg_Price"] < 100.5),
+    ("{Discount_pct} != 10", lambda d: d["Discount_pct"] != 10),
+    ("{Location} eq Chicago", lambda d: d["Location"] == "Chicago"),
+    ('{Location} eq "New York"', lambda d: d["Location"] == "New York"),
+    (
+        "{Location} contains New",
+        lambda d: d["Location"].astype(str).str.contains("New", regex=False),
+    ),
+    (
+        "{Product_Category} > Lifestyle",
+        lambda d: d["Product_Category"].astype(str) > "Lifestyle",
+    ),
+    ("{Gender} ne M", lambda d: d["Gender"] != "M"),
+    ("{Date} datestartswith 2019-12", lambda d: d["Date"].str.startswith("2019-12")),
+    ("{Date} datestartswith 2019", lambda d: d["Date"].str.startswith("2019")),
+    ("{Date} lt 2019-03-15", lambda d: d["Date"] < "2019-03-15"),
+    ("{Date} le 2019-03-15", lambda d: d["Date"] <= "2019-03-15"),
+    (
+        "{Quantity} gt 5 && {Location} contains New && {Date} ge 2019-06-01",
+        lambda d: (d["Quantity"] > 5)
+        & d["Location"].astype(str).str.contains("New", regex=False)
+        & (d["Date"] >= "2019-06-01"),
+    ),
+    # Colonne inconnue : filtre ignoré ; valeur non numérique : aucune ligne
+    ("{Inconnue} eq 3", lambda d: pd.Series(True, index=d.index)),
+    ("{Quantity} ge abc", lambda d: pd.Series(False, index=d.index)),
+]
+
+
+@pytest.mark.parametrize("filtre, masque", filtres, ids=[f for f, _ in filtres])
+def test_filtre_comme_pandas(retail, affichage, filtre, masque):
+    page, total = interroger(retail, filtre)
+    reference = affichage[masque(affichage)]
+
+    assert total == len(reference)
+    assert list(page.index) == list(reference.index)
+
+
+@pytest.mark.parametrize("locations", [(), ("Chicago",), ("California", "New York")])
+@pytest.mark.parametrize("periode", [tous, ("2019-03-10", "2019-05-20")])
+@pytest.mark.parametrize("debut, fin", [(0, 10), (20, 30), (2990, 3010)])
+def test_pages_par_defaut(retail, affichage, locations, periode, debut, fin):
+    reference = affichage
+    if locations:
+        reference = reference[reference["Location"].isin(locations)]
+    if periode != tous:
+        reference = reference[reference["Date"].between(*periode)]
+
+    page, total = interroger(
+        retail, locations=locations, periode=periode, page=(debut, fin)
+    )
+
+    assert total == len(reference)
+    assert list(page.index) == list(reference.index[debut:fin])
+
+
+tris = [
+    [("Quantity", "desc")],
+    [("Avg_Price", "asc")],
+    [("Location", "asc"), ("Quantity", "desc")],
+    [("Product_Category", "desc"), ("Date", "asc")],
+    [("Date", "asc")],
+]
+
+
+@pytest.mark.parametrize("tri", tris, ids=str)
+def test_tri_comme_pandas(retail, affichage, tri):
+    colonnes = [colonne for colonne, _ in tri]
+    # Modalités triées par libellé, dates par jour, le tri restant stable
+    cles = affichage.astype(
+        {c: str for c in colonnes if c in ("Gender", "Location", "Product_Category")}
+    )
+    reference = cles.sort_values(
+        colonnes, ascending=[sens == "asc" for _, sens in tri], kind="stable"
+    )
+
+    page, total = interroger(
+        retail,
+        "{Quantity} ge 5",
+        tri=[{"column_id": c, "direction": sens} for c, sens in tri],
+        page=(10, 60),
+    )
+    reference = reference[reference["Quantity"] >= 5]
+
+    assert total == len(reference)
+    assert list(page.index) == list(reference.index[10:60])
+
+
+def test_page_serialisee(retail):
+    page, _ = interroger(retail, "{Quantity} ge 5", page=(0, 25))
+    lignes = retail.page_de_ventes(page)
+
+    assert len(lignes) == 25
+    assert list(lignes[0]) == retail.colonnes